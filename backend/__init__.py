@@ -1,34 +1,69 @@
+import os
+import sqlite3
 from flask import Flask
-from dotenv import load_dotenv
 from .config import config_by_name
 from .extensions import db, migrate, login_manager, cors
-from sqlalchemy import text
+from sqlalchemy import text, event
+from sqlalchemy.engine import Engine
 
 
-def create_app(config_name: str = "development") -> Flask:
-    # Load .env once at startup
-    load_dotenv()
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record):
+    # Several gunicorn workers share one SQLite file: WAL lets readers run
+    # alongside the single writer, busy_timeout queues writers instead of failing.
+    if isinstance(dbapi_conn, sqlite3.Connection):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA busy_timeout=5000")
+        cur.close()
+
+
+def create_app(config_name: str = "development", bootstrap: bool = True) -> Flask:
+    """Build the Flask app.
+
+    The factory itself has no side effects besides wiring extensions, so it is
+    safe to call in a gunicorn master before forking. ``bootstrap`` runs table
+    creation, column migrations and seeding; serving entry points do it once.
+    """
     app = Flask(__name__, static_folder=None)
     app.config.from_object(config_by_name.get(config_name, config_by_name["development"]))
 
+    from .jsonio import JSONProvider
+    app.json = JSONProvider(app)
+
     # Init extensions
     db.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     cors.init_app(app, resources={r"/api/*": {"origins": "*"}})
 
-    # Flask-Login setup
-    from .models import User  # local import to avoid cycles
+    # Flask-Login setup: users come from a short-TTL snapshot cache
+    from . import user_cache  # local import to avoid cycles
+    user_cache.init_app(app)
 
     @login_manager.user_loader
     def load_user(user_id):
         try:
-            return User.query.get(int(user_id))
+            return user_cache.cache.get(int(user_id))
         except Exception:
             return None
 
     login_manager.login_view = "serve_login"
 
+    from . import ratelimit
+    ratelimit.init_app(app)
+
+    # Periodic jobs without a worker (JOBS_INLINE)
+    from . import jobs
+    jobs.init_app(app)
+
+    from . import compress
+    compress.init_app(app)
+
+    # Article excerpt/reading-time listeners
+    from . import summaries  # noqa: F401
+
     # Blueprints
     from .routes_public import public_bp
     app.register_blueprint(public_bp)
@@ -36,7 +71,14 @@ def create_app(config_name: str = "development") -> Flask:
     from .routes_admin import admin_bp
     app.register_blueprint(admin_bp, url_prefix="/admin")
 
-    # Create tables and seed minimal data on first run
+    if bootstrap:
+        bootstrap_database(app)
+
+    return app
+
+
+def bootstrap_database(app: Flask) -> None:
+    """Create tables, apply lightweight SQLite migrations and seed minimal data."""
     with app.app_context():
         db.create_all()
         # lightweight SQLite migration: add new columns if missing
@@ -68,12 +110,29 @@ def create_app(config_name: str = "development") -> Flask:
             if 'is_banned' not in cols:
                 db.session.execute(text("ALTER TABLE user ADD COLUMN is_banned BOOLEAN NOT NULL DEFAULT 0"))
                 db.session.commit()
+            # user.version (user cache invalidation)
+            if 'version' not in cols:
+                db.session.execute(text("ALTER TABLE user ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+                db.session.commit()
+            # user.tg_user_id (avatar refresh)
+            if 'tg_user_id' not in cols:
+                db.session.execute(text("ALTER TABLE user ADD COLUMN tg_user_id VARCHAR(64)"))
+                db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_user_tg_user_id ON user (tg_user_id)"))
+                db.session.commit()
+            # Telegram file URLs expire and embed the bot token; avatars are now stored locally
+            db.session.execute(text("UPDATE user SET avatar_url = NULL WHERE avatar_url LIKE 'https://api.telegram.org/file/%'"))
+            db.session.commit()
             # telegram_verification.avatar_url
             insp_tv = db.session.execute(text("PRAGMA table_info('telegram_verification')")).all()
             cols_tv = {row[1] for row in insp_tv}
             if 'avatar_url' not in cols_tv:
                 db.session.execute(text("ALTER TABLE telegram_verification ADD COLUMN avatar_url TEXT"))
                 db.session.commit()
+            if 'expires_at' not in cols_tv:
+                db.session.execute(text("ALTER TABLE telegram_verification ADD COLUMN expires_at DATETIME"))
+                db.session.execute(text("UPDATE telegram_verification SET expires_at = datetime(created_at, '+15 minutes')"))
+                db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_telegram_verification_expires_at ON telegram_verification (expires_at)"))
+                db.session.commit()
             # article.user_id
             insp_art = db.session.execute(text("PRAGMA table_info('article')")).all()
             cols_art = {row[1] for row in insp_art}
@@ -104,6 +163,41 @@ def create_app(config_name: str = "development") -> Flask:
             if 'views' not in cols_art:
                 db.session.execute(text("ALTER TABLE article ADD COLUMN views INTEGER NOT NULL DEFAULT 0"))
                 db.session.commit()
+            if 'excerpt' not in cols_art:
+                db.session.execute(text("ALTER TABLE article ADD COLUMN excerpt TEXT"))
+                db.session.execute(text("ALTER TABLE article ADD COLUMN reading_minutes INTEGER NOT NULL DEFAULT 1"))
+                db.session.commit()
+                from . import summaries
+                summaries.backfill_articles()
+            if 'comments_count' not in cols_art:
+                db.session.execute(text("ALTER TABLE article ADD COLUMN comments_count INTEGER NOT NULL DEFAULT 0"))
+                db.session.execute(text("UPDATE article SET comments_count = (SELECT COUNT(*) FROM article_comment c WHERE c.article_id = article.id AND c.approved)"))
+                db.session.commit()
+            if 'trending_score' not in cols_art:
+                db.session.execute(text("ALTER TABLE article ADD COLUMN trending_score REAL"))
+                db.session.commit()
+                from . import trending
+                trending.backfill('article')
+            # article_comment.parent_id + keyset index for paginated threads
+            insp_com = db.session.execute(text("PRAGMA table_info('article_comment')")).all()
+            if 'parent_id' not in {row[1] for row in insp_com}:
+                db.session.execute(text("ALTER TABLE article_comment ADD COLUMN parent_id INTEGER REFERENCES article_comment (id)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_article_comment_thread ON article_comment (article_id, created_at, id)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_article_comment_parent_id ON article_comment (parent_id)"))
+            db.session.commit()
+            # author_subscription.unsubscribed_at + lookup indexes
+            insp_sub = db.session.execute(text("PRAGMA table_info('author_subscription')")).all()
+            if 'unsubscribed_at' not in {row[1] for row in insp_sub}:
+                db.session.execute(text("ALTER TABLE author_subscription ADD COLUMN unsubscribed_at DATETIME"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_author_subscription_author_id ON author_subscription (author_id, id)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_author_subscription_author_email ON author_subscription (author_id, email)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_author_subscription_token ON author_subscription (token)"))
+            db.session.commit()
+            # notification_dispatch.failed_count (refused recipients are skipped, not retried)
+            insp_nd = db.session.execute(text("PRAGMA table_info('notification_dispatch')")).all()
+            if 'failed_count' not in {row[1] for row in insp_nd}:
+                db.session.execute(text("ALTER TABLE notification_dispatch ADD COLUMN failed_count INTEGER NOT NULL DEFAULT 0"))
+                db.session.commit()
             # announcement advanced fields
             insp_ann = db.session.execute(text("PRAGMA table_info('announcement')")).all()
             cols_ann = {row[1] for row in insp_ann}
@@ -127,8 +221,52 @@ def create_app(config_name: str = "development") -> Flask:
             add_col('subcategory', "subcategory VARCHAR(100)")
             add_col('deal_type', "deal_type VARCHAR(20)")
             add_col('district', "district VARCHAR(120)")
+            add_col('approved', "approved BOOLEAN NOT NULL DEFAULT 1")
+            if 'first_image' not in cols_ann:
+                add_col('first_image', "first_image TEXT")
+                add_col('images_count', "images_count INTEGER NOT NULL DEFAULT 0")
+                from . import summaries
+                summaries.backfill_announcements()
+            if 'trending_score' not in cols_ann:
+                add_col('trending_score', "trending_score REAL")
+                from . import trending
+                trending.backfill('announcement')
+            add_col('minhash', "minhash BLOB")
+            add_col('duplicate_of', "duplicate_of INTEGER")
+            # tg_post view counter and trending score
+            cols_tg = {row[1] for row in db.session.execute(text("PRAGMA table_info('tg_post')")).all()}
+            if 'views' not in cols_tg:
+                db.session.execute(text("ALTER TABLE tg_post ADD COLUMN views INTEGER NOT NULL DEFAULT 0"))
+                db.session.execute(text("ALTER TABLE tg_post ADD COLUMN trending_score REAL"))
+                db.session.commit()
+            if 'minhash' not in cols_tg:
+                db.session.execute(text("ALTER TABLE tg_post ADD COLUMN minhash BLOB"))
+                db.session.execute(text("ALTER TABLE tg_post ADD COLUMN duplicate_of INTEGER"))
+                db.session.commit()
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_announcement_created_at ON announcement (created_at)"))
+            db.session.commit()
         except Exception:
             db.session.rollback()
+            app.logger.exception("schema upgrade failed")
+        # Triggers and derived tables; each on its own, so one failing leaves the rest installed
+        from . import geo, versions, dashboard, summaries, events, trending, related, dedupe, pricestats
+        for module in (
+            geo,          # spatial index kept in sync by triggers
+            versions,     # change counters for in-process caches (facets)
+            dashboard,    # dashboard totals kept by triggers
+            summaries,
+            events,       # live-update event log (needs stat_counter)
+            trending,     # ranking indexes for sort=trending / sort=popular
+            related,      # similar-items tables, dirty-marking triggers
+            dedupe,       # near-duplicate signatures' band index and review flags
+            pricestats,   # price statistics snapshot
+        ):
+            try:
+                module.install()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("%s.install() failed", module.__name__)
         try:
             from .models import Category, Announcement, User
             if Category.query.count() == 0:
@@ -163,5 +301,3 @@ def create_app(config_name: str = "development") -> Flask:
                     db.session.commit()
         except Exception:
             pass
-
-    return app
@@ -0,0 +1,122 @@
+"""Local avatar storage for Telegram profile photos.
+
+Avatars are downloaded once, cut to a square thumbnail and written to
+``uploads/avatars/<tg user id>-<file unique id>.jpg``. Telegram's
+``file_unique_id`` changes whenever the user changes their photo, so the file
+name doubles as a version: an existing file is never rewritten, ``/uploads``
+can serve it as immutable, and a changed photo simply yields a new URL.
+
+Where the bytes come from is behind ``AvatarFetcher``; the bot uses
+``TelegramFetcher`` and offline runs can use ``LocalFetcher``.
+"""
+import hashlib
+import io
+import os
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails need Pillow; without it the original is stored
+    Image = None
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+AVATAR_DIR = os.path.join(PROJECT_ROOT, "uploads", "avatars")
+AVATAR_URL_PREFIX = "/uploads/avatars/"
+AVATAR_SIZE = int(os.environ.get("AVATAR_SIZE", 256))
+
+
+class AvatarFetcher(ABC):
+    """Source of profile photos."""
+
+    @abstractmethod
+    def latest_photo(self, tg_user_id) -> Optional[Tuple[str, str]]:
+        """Return ``(file_unique_id, file_id)`` of the current photo, or None."""
+
+    @abstractmethod
+    def download(self, file_id: str) -> bytes:
+        """Return the bytes of the photo ``file_id``."""
+
+
+class TelegramFetcher(AvatarFetcher):
+    def __init__(self, bot):
+        self.bot = bot
+
+    def latest_photo(self, tg_user_id):
+        photos = self.bot.get_user_profile_photos(tg_user_id, limit=1)
+        if not photos.total_count:
+            return None
+        largest = photos.photos[0][-1]
+        return largest.file_unique_id, largest.file_id
+
+    def download(self, file_id):
+        return bytes(self.bot.get_file(file_id).download_as_bytearray())
+
+
+class LocalFetcher(AvatarFetcher):
+    """Serves ``<root>/<tg user id>.<ext>`` files; the content hash acts as unique id."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, tg_user_id):
+        for ext in (".jpg", ".jpeg", ".png", ".webp"):
+            path = os.path.join(self.root, f"{tg_user_id}{ext}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def latest_photo(self, tg_user_id):
+        path = self._path(tg_user_id)
+        if not path:
+            return None
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()[:16], path
+
+    def download(self, file_id):
+        with open(file_id, "rb") as f:
+            return f.read()
+
+
+def _filename(tg_user_id, unique_id: str) -> str:
+    safe = "".join(ch for ch in str(unique_id) if ch.isalnum() or ch in "-_")
+    return f"{int(tg_user_id)}-{safe}.jpg"
+
+
+def cached_url(tg_user_id, unique_id: str) -> Optional[str]:
+    name = _filename(tg_user_id, unique_id)
+    if os.path.exists(os.path.join(AVATAR_DIR, name)):
+        return AVATAR_URL_PREFIX + name
+    return None
+
+
+def make_thumbnail(data: bytes, size: int = AVATAR_SIZE) -> bytes:
+    if Image is None:
+        return data
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        thumb = ImageOps.fit(img, (size, size), method=Image.LANCZOS)
+        out = io.BytesIO()
+        thumb.save(out, "JPEG", quality=85, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def store_avatar(tg_user_id, unique_id: str, data: bytes) -> str:
+    os.makedirs(AVATAR_DIR, exist_ok=True)
+    name = _filename(tg_user_id, unique_id)
+    path = os.path.join(AVATAR_DIR, name)
+    # Write-then-rename so a concurrent reader never sees a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(make_thumbnail(data))
+    os.replace(tmp, path)
+    return AVATAR_URL_PREFIX + name
+
+
+def sync_avatar(fetcher: AvatarFetcher, tg_user_id) -> Optional[str]:
+    """Return the local URL of the user's current photo, downloading it only if new."""
+    latest = fetcher.latest_photo(tg_user_id)
+    if not latest:
+        return None
+    unique_id, file_id = latest
+    return cached_url(tg_user_id, unique_id) or store_avatar(tg_user_id, unique_id, fetcher.download(file_id))
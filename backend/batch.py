@@ -0,0 +1,76 @@
+"""Several API reads in one HTTP round trip.
+
+``run`` dispatches each sub-request through the app's full request pipeline
+(``before_request`` hooks, the view, ``after_request``), inside a request
+context built from the outer request: same cookies, so the same login, and
+same client address, so the same rate-limit buckets. Sub-requests reuse the
+outer app context, hence one ``g`` (the loaded user) and one database
+session for the whole batch. The batch takes a single in-flight slot.
+
+Only GET is accepted: sub-responses cannot set cookies on the outer one,
+and writes are one call each anyway.
+"""
+import json
+
+from flask import current_app, request
+
+from . import ratelimit
+from .extensions import db
+
+# Headers describing the outer body; sub-requests have none
+_BODY_HEADERS = {"content-length", "content-type", "content-encoding"}
+
+
+class BatchError(ValueError):
+    """Malformed batch; maps to HTTP 400."""
+
+
+def _parse(items) -> list:
+    if not isinstance(items, list) or not items:
+        raise BatchError("invalid_requests")
+    if len(items) > current_app.config.get("BATCH_MAX_REQUESTS", 10):
+        raise BatchError("too_many_requests")
+    paths = []
+    for item in items:
+        path = item.get("path") if isinstance(item, dict) else None
+        method = (item.get("method") or "GET").upper() if isinstance(item, dict) else None
+        if not isinstance(path, str) or not path.startswith("/api/") or path.startswith("/api/batch"):
+            raise BatchError("invalid_path")
+        if method != "GET":
+            raise BatchError("method_not_allowed")
+        paths.append(path)
+    return paths
+
+
+def _dispatch(path: str) -> dict:
+    app = current_app._get_current_object()
+    headers = [(k, v) for k, v in request.headers if k.lower() not in _BODY_HEADERS]
+    environ = {
+        "REMOTE_ADDR": request.remote_addr,
+        ratelimit.SUBREQUEST: True,
+    }
+    with app.test_request_context(path, method="GET", headers=headers, environ_base=environ):
+        try:
+            resp = app.full_dispatch_request()
+            # Exports and file downloads; streamed JSON lists and error pages are read in full
+            if resp.is_streamed and resp.status_code < 400 and not resp.is_json:
+                resp.close()
+                return {"status": 400, "body": {"ok": False, "error": "streaming_not_supported"}}
+            body = resp.get_data(as_text=True)
+        except Exception:
+            current_app.logger.exception("batch sub-request %s failed", path)
+            db.session.rollback()
+            return {"status": 500, "body": {"ok": False, "error": "internal_error"}}
+    if resp.status_code >= 500:
+        db.session.rollback()
+    if resp.is_json:
+        body = json.loads(body) if body else None
+    out = {"status": resp.status_code, "body": body}
+    if resp.headers.get("ETag"):
+        out["etag"] = resp.headers["ETag"]
+    return out
+
+
+def run(items) -> list:
+    """Validate the whole batch first, then run it in order."""
+    return [_dispatch(path) for path in _parse(items)]
@@ -0,0 +1,158 @@
+"""Set-based admin operations over many users, listings or articles at once.
+
+Each operation is a pair (predicate, values): rows matching the ids and the
+predicate (i.e. rows the action would actually change) are updated with one
+``UPDATE ... WHERE id IN (...) RETURNING id`` per chunk of ids, all inside
+the caller's transaction. A dry run runs the same predicate as a SELECT.
+
+These statements bypass the ORM unit of work, so nothing that hangs off
+mapper events runs for them: ``User.version`` is bumped in the statement
+itself and the caller evicts the changed ids from ``user_cache`` after
+commit. Table triggers (spatial index, change counters) still fire per row.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import select, update, delete, func, true
+
+from . import notify
+from .extensions import db
+from .models import User, Announcement, Article, ArticleComment, NotificationDispatch, Category
+
+CHUNK = 500
+
+
+class BulkError(ValueError):
+    """Unknown action or bad parameters; maps to HTTP 400."""
+
+
+def _chunks(ids: list) -> Iterable[list]:
+    for i in range(0, len(ids), CHUNK):
+        yield ids[i:i + CHUNK]
+
+
+def _apply(model, ids: list, predicate, values: Optional[dict], dry_run: bool, extra=()):
+    """Return (ids that exist, rows changed or that would change)."""
+    found, changed = set(), []
+    for chunk in _chunks(ids):
+        found.update(db.session.execute(select(model.id).where(model.id.in_(chunk))).scalars())
+        where = (model.id.in_(chunk), predicate)
+        if dry_run:
+            changed += db.session.execute(select(model.id, *extra).where(*where)).all()
+        elif values is None:
+            changed += db.session.execute(delete(model).where(*where).returning(model.id, *extra),
+                                          execution_options={"synchronize_session": False}).all()
+        else:
+            changed += db.session.execute(update(model).where(*where).values(**values).returning(model.id, *extra),
+                                          execution_options={"synchronize_session": False}).all()
+    return found, changed
+
+
+def _user_op(action: str, params: dict):
+    if action == "ban":
+        return User.is_banned.isnot(True), {"is_banned": True, "version": User.version + 1}
+    if action == "unban":
+        return User.is_banned.is_(True), {"is_banned": False, "version": User.version + 1}
+    if action == "balance":
+        try:
+            delta = int(round(float(params.get("amount") or 0) * 100))
+        except (TypeError, ValueError):
+            raise BulkError("invalid_amount")
+        if not delta:
+            raise BulkError("invalid_amount")
+        return true(), {"balance_cents": func.coalesce(User.balance_cents, 0) + delta, "version": User.version + 1}
+    raise BulkError("invalid_action")
+
+
+def _announcement_op(action: str, params: dict):
+    if action == "publish":
+        return Announcement.draft.is_(True), {"draft": False}
+    if action == "draft":
+        return Announcement.draft.isnot(True), {"draft": True}
+    if action == "delete":
+        return true(), None
+    if action == "set_category":
+        try:
+            cid = int(params.get("category_id"))
+        except (TypeError, ValueError):
+            raise BulkError("invalid_category")
+        if db.session.get(Category, cid) is None:
+            raise BulkError("invalid_category")
+        return Announcement.category_id.is_distinct_from(cid), {"category_id": cid}
+    raise BulkError("invalid_action")
+
+
+def _article_op(action: str, params: dict):
+    if action == "publish":
+        return Article.is_draft.is_(True), {"is_draft": False}
+    if action == "draft":
+        return Article.is_draft.isnot(True), {"is_draft": True}
+    if action == "delete":
+        return true(), None
+    if action == "set_category":
+        category = (params.get("category") or "").strip() or None
+        return Article.category.is_distinct_from(category), {"category": category}
+    raise BulkError("invalid_action")
+
+
+TARGETS = {
+    "users": (User, _user_op),
+    "announcements": (Announcement, _announcement_op),
+    "articles": (Article, _article_op),
+}
+
+
+# (target, action) never applied to the acting admin's own row
+SELF_EXCLUDED = {("users", "ban")}
+
+
+def run(target: str, action: str, ids: list, params: dict, dry_run: bool = False,
+        actor_id: Optional[int] = None) -> dict:
+    """Apply ``action`` to ``ids`` of ``target``; the caller commits.
+
+    Returns counts, per-id statuses (``updated``/``unchanged``/``not_found``,
+    ``would_update`` on a dry run, ``skipped_self`` for the acting admin
+    under ``SELF_EXCLUDED``) and, for balance changes, new balances.
+    """
+    if target not in TARGETS:
+        raise BulkError("invalid_target")
+    model, op = TARGETS[target]
+    predicate, values = op(action, params)
+    ids = sorted({int(i) for i in ids})
+    skipped = set()
+    if (target, action) in SELF_EXCLUDED and actor_id in ids:
+        skipped.add(actor_id)
+        ids.remove(actor_id)
+    extra = ()
+    if target == "users" and action == "balance":
+        extra = (User.balance_cents,)
+    elif target == "articles" and action == "publish":
+        extra = (Article.user_id,)
+    if target == "articles" and action == "delete" and not dry_run:
+        # Children first; there is no ON DELETE CASCADE on these foreign keys
+        for chunk in _chunks(ids):
+            db.session.execute(delete(ArticleComment).where(ArticleComment.article_id.in_(chunk)),
+                               execution_options={"synchronize_session": False})
+            db.session.execute(delete(NotificationDispatch).where(NotificationDispatch.article_id.in_(chunk)),
+                               execution_options={"synchronize_session": False})
+    found, changed = _apply(model, ids, predicate, values, dry_run, extra)
+    changed_ids = {row[0] for row in changed}
+    status = "would_update" if dry_run else "updated"
+    results = {i: (status if i in changed_ids else "unchanged" if i in found else "not_found") for i in ids}
+    results.update((i, "skipped_self") for i in skipped)
+    out = {
+        "matched": len(found),
+        "changed": len(changed_ids),
+        "not_found": len(ids) - len(found),
+        "skipped": len(skipped),
+        "results": results,
+        "changed_ids": sorted(changed_ids),
+    }
+    if dry_run:
+        return out
+    if target == "users" and action == "balance":
+        out["balances"] = {row[0]: round((row[1] or 0) / 100, 2) for row in changed}
+    elif target == "articles" and action == "publish":
+        # Rows carry id and user_id, all that the subscriber mail-out needs
+        for row in changed:
+            notify.article_published(row)
+    return out
@@ -0,0 +1,130 @@
+"""Negotiated gzip/brotli compression of dynamic responses.
+
+An ``after_request`` hook compresses responses whose mimetype is in
+``COMPRESS_MIMETYPES``, picking brotli (when the ``brotli`` package is
+installed) or gzip from the client's ``Accept-Encoding``. Buffered bodies
+under ``COMPRESS_MIN_SIZE`` bytes go out as is; streamed bodies (NDJSON
+exports, generators) are compressed chunk by chunk and flushed after each,
+so the client still sees rows as they are produced.
+
+Left alone: files served with ``send_file`` (``direct_passthrough``; static
+assets and uploads, precompressed or not), responses that already carry a
+``Content-Encoding``, partial content, and sub-requests of ``/api/batch``
+(the batch response as a whole is compressed instead). ETags of compressed
+responses are made weak, as the bytes differ per encoding.
+
+``metrics()`` reports per-encoding counts, bytes in and out, ratio and the
+CPU time spent compressing.
+"""
+import threading
+import time
+import zlib
+
+from flask import current_app, request
+
+from . import ratelimit
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(encoding: str, size_in: int, size_out: int, cpu: float) -> None:
+    with _stats_lock:
+        s = _stats.setdefault(encoding, {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0})
+        s["responses"] += 1
+        s["bytes_in"] += size_in
+        s["bytes_out"] += size_out
+        s["cpu_seconds"] += cpu
+
+
+def metrics() -> dict:
+    with _stats_lock:
+        out = {k: dict(v) for k, v in _stats.items()}
+    for s in out.values():
+        s["ratio"] = round(s["bytes_out"] / s["bytes_in"], 4) if s["bytes_in"] else None
+        s["cpu_seconds"] = round(s["cpu_seconds"], 6)
+    return out
+
+
+def _negotiate() -> str:
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return ""
+
+
+def _compressor(encoding: str):
+    """(compress(chunk) -> bytes, flush(final) -> bytes) for one body."""
+    if encoding == "br":
+        c = brotli.Compressor(quality=current_app.config.get("COMPRESS_BROTLI_QUALITY", 4))
+        return c.process, lambda final: c.finish() if final else c.flush()
+    z = zlib.compressobj(current_app.config.get("COMPRESS_LEVEL", 6), zlib.DEFLATED, 31)
+    return z.compress, lambda final: z.flush() if final else z.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _stream(chunks, encoding: str, compress, flush):
+    size_in = size_out = 0
+    cpu = 0.0
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            start = time.thread_time()
+            out = compress(chunk) + flush(False)
+            cpu += time.thread_time() - start
+            size_in += len(chunk)
+            size_out += len(out)
+            yield out
+        start = time.thread_time()
+        out = flush(True)
+        cpu += time.thread_time() - start
+        size_out += len(out)
+        yield out
+    finally:
+        _record(encoding, size_in, size_out, cpu)
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+def _after_request(resp):
+    cfg = current_app.config
+    if (not cfg.get("COMPRESS_ENABLED", True)
+            or resp.mimetype not in cfg.get("COMPRESS_MIMETYPES", ())
+            or resp.direct_passthrough
+            or resp.status_code < 200 or resp.status_code in (204, 206, 304)
+            or "Content-Encoding" in resp.headers
+            or request.environ.get(ratelimit.SUBREQUEST)):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    encoding = _negotiate()
+    if not encoding:
+        return resp
+    compress, flush = _compressor(encoding)
+    if resp.is_streamed:
+        resp.response = _stream(resp.iter_encoded(), encoding, compress, flush)
+        resp.headers.pop("Content-Length", None)
+    else:
+        data = resp.get_data()
+        if len(data) < cfg.get("COMPRESS_MIN_SIZE", 500):
+            return resp
+        start = time.thread_time()
+        body = compress(data) + flush(True)
+        _record(encoding, len(data), len(body), time.thread_time() - start)
+        resp.set_data(body)
+    resp.headers["Content-Encoding"] = encoding
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        resp.set_etag(etag, weak=True)
+    return resp
+
+
+def init_app(app) -> None:
+    app.after_request(_after_request)
@@ -1,12 +1,82 @@
 import os
+from dotenv import load_dotenv
+
+# Load .env before the config classes below read the environment
+load_dotenv()
+
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key")
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///site.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Flask-Login user snapshots: seconds before revalidation, max entries
+    USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 5))
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 2048))
+    # Seconds the announcement facet index may lag behind writes
+    FACETS_MAX_STALENESS = float(os.environ.get("FACETS_MAX_STALENESS", 2))
+    # Background jobs (backend/jobs.py); inline runs handlers after the request commits,
+    # and periodic ones on a thread of the web process
+    JOBS_INLINE = os.environ.get("JOBS_INLINE", "0") == "1"
+    JOBS_BACKOFF_BASE = float(os.environ.get("JOBS_BACKOFF_BASE", 5))
+    JOBS_BACKOFF_MAX = float(os.environ.get("JOBS_BACKOFF_MAX", 3600))
+    JOBS_LOCK_TIMEOUT = float(os.environ.get("JOBS_LOCK_TIMEOUT", 600))
+    # Finished jobs are pruned after this many seconds
+    JOBS_RETENTION = float(os.environ.get("JOBS_RETENTION", 7 * 86400))
+    # Telegram sign-in attempts: lifetime and sweep interval (seconds)
+    TELEGRAM_VERIFICATION_TTL = int(os.environ.get("TELEGRAM_VERIFICATION_TTL", 900))
+    TELEGRAM_VERIFICATION_SWEEP_INTERVAL = int(os.environ.get("TELEGRAM_VERIFICATION_SWEEP_INTERVAL", 300))
+    # Rate limiting (backend/ratelimit.py): "<tokens>/<seconds>" per ip, user or class
+    RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "1") == "1"
+    RATELIMIT_STORAGE = os.environ.get("RATELIMIT_STORAGE", "")  # SQLite file shared by workers
+    RATELIMIT_TRUST_PROXY = os.environ.get("RATELIMIT_TRUST_PROXY", "0") == "1"
+    RATELIMIT_POLICIES = {
+        "auth": {"ip": "10/60", "global": "20/1"},
+        "write": {"ip": "30/60", "user": "60/60"},
+        "view": {"ip": "120/60"},
+    }
+    # Requests in flight per process; classes are shed at a fraction of it, costliest first
+    MAX_INFLIGHT = int(os.environ.get("MAX_INFLIGHT", os.environ.get("GUNICORN_THREADS", 4)))
+    RATELIMIT_SHED_AT = {"auth": 0.75, "write": 0.9}
+    # Response compression (backend/compress.py); brotli is used when installed
+    COMPRESS_ENABLED = os.environ.get("COMPRESS_ENABLED", "1") == "1"
+    COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 500))
+    COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 4))
+    COMPRESS_MIMETYPES = (
+        "application/json", "application/x-ndjson", "application/xml", "text/xml",
+        "text/html", "text/plain", "text/css", "application/javascript", "image/svg+xml",
+    )
+    # Live updates (backend/events.py). Every open stream holds a server thread;
+    # by default at most half of them, so ordinary requests always get through
+    EVENTS_MAX_CONNECTIONS = int(os.environ.get(
+        "EVENTS_MAX_CONNECTIONS", max(1, int(os.environ.get("GUNICORN_THREADS", 4)) // 2)))
+    EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", 100))
+    EVENTS_POLL_INTERVAL = float(os.environ.get("EVENTS_POLL_INTERVAL", 0.5))
+    EVENTS_HEARTBEAT = float(os.environ.get("EVENTS_HEARTBEAT", 15))
+    EVENTS_MAX_AGE = float(os.environ.get("EVENTS_MAX_AGE", 300))  # clients reconnect with Last-Event-ID
+    EVENTS_RETENTION = int(os.environ.get("EVENTS_RETENTION", 600))
+    EVENTS_PRUNE_INTERVAL = int(os.environ.get("EVENTS_PRUNE_INTERVAL", 60))
+    # Sub-requests accepted by one POST /api/batch
+    BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", 10))
+    # sort=trending: scores halve every this many hours (backend/trending.py)
+    TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", 24))
+    TRENDING_FLUSH_INTERVAL = float(os.environ.get("TRENDING_FLUSH_INTERVAL", 5))
+    TRENDING_BUFFER_SIZE = int(os.environ.get("TRENDING_BUFFER_SIZE", 10000))
+    # Similar items kept per listing/article/post and how often changed ones are recomputed
+    RELATED_TOP_K = int(os.environ.get("RELATED_TOP_K", 10))
+    RELATED_REFRESH_INTERVAL = int(os.environ.get("RELATED_REFRESH_INTERVAL", 60))
+    # Near-duplicates (backend/dedupe.py): estimated text similarity to flag,
+    # to collapse Telegram cross-posts without review, and the scan job period
+    DEDUPE_MIN_SIMILARITY = float(os.environ.get("DEDUPE_MIN_SIMILARITY", 0.8))
+    DEDUPE_AUTO_SIMILARITY = float(os.environ.get("DEDUPE_AUTO_SIMILARITY", 0.95))
+    DEDUPE_SCAN_INTERVAL = int(os.environ.get("DEDUPE_SCAN_INTERVAL", 300))
+    # How often the price statistics snapshot is rebuilt (when listings changed)
+    PRICE_STATS_INTERVAL = int(os.environ.get("PRICE_STATS_INTERVAL", 300))
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    # The dev server usually runs without a job worker
+    JOBS_INLINE = os.environ.get("JOBS_INLINE", "1") == "1"
 
 class ProductionConfig(Config):
     DEBUG = False
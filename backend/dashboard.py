@@ -0,0 +1,122 @@
+"""Admin dashboard summary from trigger-maintained counters.
+
+``stat_counter`` holds the totals the dashboard shows. Triggers on ``user``
+and ``announcement`` adjust them on every insert, delete and draft toggle,
+whatever the write path (ORM, bulk statements, imports), so reading the
+summary is one small query however large the tables grow. The latest-items
+list is cached in process and reused until ``table_version`` for
+``announcement`` moves.
+
+Each summary carries a ``rev`` token encoding the state it describes;
+passing it back as ``since`` yields deltas against that state, or
+``changed: false`` when nothing moved.
+"""
+import threading
+from typing import Optional
+
+from sqlalchemy import text
+
+from .extensions import db
+from .models import Announcement
+
+LATEST_SIZE = 5
+
+_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS user_counter_ai AFTER INSERT ON user BEGIN
+         UPDATE stat_counter SET value = value + 1 WHERE name = 'users';
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS user_counter_ad AFTER DELETE ON user BEGIN
+         UPDATE stat_counter SET value = value - 1 WHERE name = 'users';
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS announcement_counter_ai AFTER INSERT ON announcement BEGIN
+         UPDATE stat_counter SET value = value + 1 WHERE name = 'announcements';
+         UPDATE stat_counter SET value = value + 1 WHERE name = 'drafts' AND NEW.draft;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS announcement_counter_ad AFTER DELETE ON announcement BEGIN
+         UPDATE stat_counter SET value = value - 1 WHERE name = 'announcements';
+         UPDATE stat_counter SET value = value - 1 WHERE name = 'drafts' AND OLD.draft;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS announcement_counter_au AFTER UPDATE OF draft ON announcement
+       WHEN NEW.draft IS NOT OLD.draft BEGIN
+         UPDATE stat_counter SET value = value + (CASE WHEN NEW.draft THEN 1 ELSE -1 END) WHERE name = 'drafts';
+       END""",
+]
+
+
+def rebuild() -> None:
+    """Recount every counter from the tables (first install, or after manual surgery)."""
+    db.session.execute(text("""
+        INSERT OR REPLACE INTO stat_counter (name, value)
+        SELECT 'users', COUNT(*) FROM user
+        UNION ALL SELECT 'announcements', COUNT(*) FROM announcement
+        UNION ALL SELECT 'drafts', COUNT(*) FROM announcement WHERE draft"""))
+
+
+def install() -> None:
+    exists = db.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'stat_counter'")).first()
+    db.session.execute(text(
+        "CREATE TABLE IF NOT EXISTS stat_counter (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID"))
+    for stmt in _TRIGGERS:
+        db.session.execute(text(stmt))
+    if not exists:
+        rebuild()
+    db.session.commit()
+
+
+_latest = (None, [])
+_latest_lock = threading.Lock()
+
+
+def _latest_items(version: int) -> list:
+    global _latest
+    cached_version, items = _latest
+    if cached_version == version:
+        return items
+    rows = (Announcement.query
+            .with_entities(Announcement.id, Announcement.title, Announcement.created_at, Announcement.draft)
+            .order_by(Announcement.created_at.desc())
+            .limit(LATEST_SIZE).all())
+    items = [{"id": r.id, "title": r.title, "created_at": r.created_at.isoformat(), "draft": bool(r.draft)}
+             for r in rows]
+    with _latest_lock:
+        _latest = (version, items)
+    return items
+
+
+def _parse_rev(rev: str) -> Optional[dict]:
+    try:
+        version, users, total, drafts = (int(p) for p in rev.split("-"))
+    except (AttributeError, ValueError):
+        return None
+    return {"version": version, "users": users, "announcements": total, "drafts": drafts}
+
+
+def summary(since: Optional[str] = None) -> dict:
+    rows = db.session.execute(text("""
+        SELECT name, value FROM stat_counter
+        UNION ALL SELECT 'version', version FROM table_version WHERE name = 'announcement'""")).all()
+    c = dict(rows)
+    users, total, drafts, version = (c.get(k, 0) for k in ("users", "announcements", "drafts", "version"))
+    rev = f"{version}-{users}-{total}-{drafts}"
+    out = {"rev": rev}
+    if since is not None:
+        prev = _parse_rev(since)
+        if since == rev:
+            out["changed"] = False
+            return out
+        out["changed"] = True
+        if prev is not None:
+            out["delta"] = {
+                "users": users - prev["users"],
+                "announcements": total - prev["announcements"],
+                "published": (total - drafts) - (prev["announcements"] - prev["drafts"]),
+                "drafts": drafts - prev["drafts"],
+            }
+    out.update({
+        "users": users,
+        "announcements": total,
+        "published": total - drafts,
+        "drafts": drafts,
+        "latest": _latest_items(version),
+    })
+    return out
@@ -0,0 +1,259 @@
+"""Near-duplicate listings and Telegram posts.
+
+Each listing (title and description) and post (text) is reduced to the set
+of its words and word pairs, normalized as in ``related.tokens`` so that
+punctuation, numbers and word endings do not matter, and summarized by a
+``PERMUTATIONS``-value MinHash signature kept in its ``minhash`` column.
+The share of equal values between two signatures estimates the Jaccard
+similarity of the two sets.
+
+For lookup the signature is cut into ``BANDS`` bands of ``ROWS`` values,
+each hashed to one key in ``dedupe_band``. Items sharing a band key are
+candidates: ``BANDS`` primary-key probes whatever the corpus size, and with
+16 bands of 4, pairs at 0.7 similarity share a band 99% of the time, pairs
+at 0.3 about 12%. Only candidates are compared in full.
+
+An item at least ``DEDUPE_MIN_SIMILARITY`` similar to an older one is
+recorded in ``duplicate_flag`` for an admin to review
+(``/api/admin/duplicates``). Confirming sets ``duplicate_of``, which hides
+the item from the public lists, facet and map search, map clusters and
+related items (their triggers watch the column). Telegram posts at least
+``DEDUPE_AUTO_SIMILARITY`` similar (channel cross-posts) are collapsed
+right away.
+
+Listings are checked when created and posts when imported. Editing the
+text clears the signature (trigger), and the ``dedupe.scan`` job signs and
+checks every row without one: edited rows, rows from other write paths and
+the corpus that predates this module.
+"""
+import argparse
+import hashlib
+import random
+import struct
+from datetime import datetime
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import text
+
+from . import jobs
+from .extensions import db
+from .related import tokens
+
+BANDS = 16
+ROWS = 4
+PERMUTATIONS = BANDS * ROWS
+MIN_TOKENS = 5
+MAX_CANDIDATES = 200
+SCAN_BATCH = 500
+
+_PRIME = (1 << 61) - 1
+# Fixed seed: signatures must agree across processes and restarts
+_rng = random.Random(20240611)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(PERMUTATIONS)]
+_SIG = struct.Struct(f"<{PERMUTATIONS}I")
+
+# table -> text columns that are compared
+TABLES = {
+    "announcement": ("title", "content_excerpt"),
+    "tg_post": ("text",),
+}
+
+
+def install() -> None:
+    """Band and flag tables, the to-do index and triggers (``minhash``/``duplicate_of`` come from bootstrap)."""
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS dedupe_band (
+          kind TEXT NOT NULL, band INTEGER NOT NULL, item_id INTEGER NOT NULL,
+          PRIMARY KEY (kind, band, item_id)) WITHOUT ROWID"""))
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS duplicate_flag (
+          kind TEXT NOT NULL, item_id INTEGER NOT NULL,
+          original_id INTEGER NOT NULL, similarity REAL NOT NULL,
+          status TEXT NOT NULL DEFAULT 'pending',
+          created_at DATETIME NOT NULL,
+          PRIMARY KEY (kind, item_id))"""))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_duplicate_flag_status ON duplicate_flag (kind, status, created_at)"))
+    for table, columns in TABLES.items():
+        # Rows still to sign, so the scan job never walks the whole table
+        db.session.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_minhash_todo ON {table} (id) WHERE minhash IS NULL"))
+        # Writes that store a new signature along with the text are left alone
+        db.session.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_minhash_au AFTER UPDATE OF {', '.join(columns)} ON {table} "
+            f"WHEN NEW.minhash IS OLD.minhash BEGIN "
+            f"UPDATE {table} SET minhash = NULL WHERE id = NEW.id; "
+            f"DELETE FROM dedupe_band WHERE kind = '{table}' AND item_id = NEW.id; END"))
+        db.session.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_dedupe_ad AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM dedupe_band WHERE kind = '{table}' AND item_id = OLD.id; "
+            f"DELETE FROM duplicate_flag WHERE kind = '{table}' AND (item_id = OLD.id OR original_id = OLD.id); END"))
+    db.session.commit()
+
+
+# ---------- signatures ----------
+
+def signature(*texts) -> Optional[tuple]:
+    """MinHash of the word and word-pair set; None for texts too short to compare."""
+    words = tokens(*texts)
+    if len(words) < MIN_TOKENS:
+        return None
+    shingles = set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF for a, b in _PERMS)
+
+
+def similarity(a: tuple, b: tuple) -> float:
+    return sum(x == y for x, y in zip(a, b)) / PERMUTATIONS
+
+
+def band_keys(sig: tuple) -> list:
+    keys = []
+    for b in range(BANDS):
+        digest = hashlib.blake2b(struct.pack(f"<H{ROWS}I", b, *sig[b * ROWS:(b + 1) * ROWS]), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+
+def _encode(sig: Optional[tuple]) -> bytes:
+    # Empty blob: checked, too short to have duplicates
+    return _SIG.pack(*sig) if sig else b""
+
+
+def _decode(blob: Optional[bytes]) -> Optional[tuple]:
+    return _SIG.unpack(blob) if blob and len(blob) == _SIG.size else None
+
+
+# ---------- matching ----------
+
+def find_original(table: str, item_id: int, sig: tuple) -> Optional[tuple]:
+    """(original id, similarity) of the most similar older item above the threshold."""
+    keys = band_keys(sig)
+    candidates = [r[0] for r in db.session.execute(text(
+        f"SELECT item_id FROM dedupe_band WHERE kind = :k AND band IN ({', '.join(map(str, keys))}) "
+        f"AND item_id < :id GROUP BY item_id ORDER BY COUNT(*) DESC LIMIT :n"),
+        {"k": table, "id": item_id, "n": MAX_CANDIDATES})]
+    if not candidates:
+        return None
+    threshold = current_app.config.get("DEDUPE_MIN_SIMILARITY", 0.8)
+    best = None
+    for row in db.session.execute(text(
+            f"SELECT id, minhash, duplicate_of FROM {table} WHERE id IN ({', '.join(map(str, candidates))})")):
+        other = _decode(row.minhash)
+        if other is None:
+            continue
+        s = similarity(sig, other)
+        if s >= threshold and (best is None or s > best[1]):
+            # Point at the first of a chain of copies
+            best = (row.duplicate_of or row.id, s)
+    return best
+
+
+def _collapse(table: str, sim: float) -> bool:
+    return table == "tg_post" and sim >= current_app.config.get("DEDUPE_AUTO_SIMILARITY", 0.95)
+
+
+def _store(table: str, item_id: int, sig: Optional[tuple]) -> None:
+    db.session.execute(text(f"UPDATE {table} SET minhash = :m WHERE id = :i"), {"m": _encode(sig), "i": item_id})
+    db.session.execute(text("DELETE FROM dedupe_band WHERE kind = :k AND item_id = :i"), {"k": table, "i": item_id})
+    if sig:
+        db.session.execute(text("INSERT OR IGNORE INTO dedupe_band (kind, band, item_id) VALUES (:k, :b, :i)"),
+                           [{"k": table, "b": key, "i": item_id} for key in band_keys(sig)])
+
+
+def _flag(table: str, item_id: int, original_id: int, sim: float) -> None:
+    collapse = _collapse(table, sim)
+    # A dismissed flag stays dismissed
+    db.session.execute(text(
+        "INSERT INTO duplicate_flag (kind, item_id, original_id, similarity, status, created_at) "
+        "VALUES (:k, :i, :o, :s, :st, :t) "
+        "ON CONFLICT (kind, item_id) DO UPDATE SET original_id = excluded.original_id, "
+        "similarity = excluded.similarity WHERE duplicate_flag.status != 'dismissed'"),
+        {"k": table, "i": item_id, "o": original_id, "s": sim,
+         "st": "confirmed" if collapse else "pending", "t": datetime.utcnow()})
+    if collapse:
+        # Only if the stored flag is confirmed: the upsert may have kept a dismissed or pending one
+        db.session.execute(text(
+            f"UPDATE {table} SET duplicate_of = :o WHERE id = :i AND EXISTS ("
+            "SELECT 1 FROM duplicate_flag WHERE kind = :k AND item_id = :i AND status = 'confirmed')"),
+            {"o": original_id, "i": item_id, "k": table})
+
+
+def _check_row(table: str, item_id: int, texts) -> Optional[int]:
+    sig = signature(*texts)
+    _store(table, item_id, sig)
+    if sig is None:
+        return None
+    found = find_original(table, item_id, sig)
+    if found is None:
+        return None
+    _flag(table, item_id, *found)
+    return found[0]
+
+
+def check(item) -> Optional[int]:
+    """Sign a flushed listing or post and flag it; returns the original's id when it is a copy.
+
+    Writes with SQL behind the ORM's back and expires what it wrote; does not commit.
+    """
+    table = item.__tablename__
+    original_id = _check_row(table, item.id, [getattr(item, c) for c in TABLES[table]])
+    db.session.expire(item, ["minhash", "duplicate_of"])
+    return original_id
+
+
+@jobs.handler("dedupe.scan")
+def scan(payload=None) -> int:
+    """Sign and check rows without a signature, oldest first; returns the rows checked."""
+    checked = 0
+    for table, columns in TABLES.items():
+        while True:
+            rows = db.session.execute(text(
+                f"SELECT id, {', '.join(columns)} FROM {table} WHERE minhash IS NULL ORDER BY id LIMIT :n"),
+                {"n": SCAN_BATCH}).all()
+            if not rows:
+                break
+            for row in rows:
+                _check_row(table, row.id, [getattr(row, c) for c in columns])
+            db.session.commit()
+            checked += len(rows)
+    return checked
+
+
+jobs.periodic("dedupe.scan", "DEDUPE_SCAN_INTERVAL")
+
+
+def review(kind: str, item_id: int, action: str) -> bool:
+    """Confirm (hide the copy) or dismiss a flag; False when there is no such flag."""
+    flag = db.session.execute(text(
+        "SELECT original_id FROM duplicate_flag WHERE kind = :k AND item_id = :i"),
+        {"k": kind, "i": item_id}).first()
+    if flag is None:
+        return False
+    status = "confirmed" if action == "confirm" else "dismissed"
+    db.session.execute(text("UPDATE duplicate_flag SET status = :s WHERE kind = :k AND item_id = :i"),
+                       {"s": status, "k": kind, "i": item_id})
+    db.session.execute(text(f"UPDATE {kind} SET duplicate_of = :o WHERE id = :i"),
+                       {"o": flag.original_id if action == "confirm" else None, "i": item_id})
+    db.session.commit()
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find near-duplicate listings and Telegram posts")
+    parser.add_argument("--rescan", action="store_true", help="sign every row again, not only new ones")
+    args = parser.parse_args()
+    from . import create_app
+    app = create_app()
+    with app.app_context():
+        if args.rescan:
+            for table in TABLES:
+                db.session.execute(text(f"UPDATE {table} SET minhash = NULL"))
+                db.session.execute(text("DELETE FROM dedupe_band WHERE kind = :k"), {"k": table})
+            db.session.commit()
+        print(scan())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""Live updates over Server-Sent Events.
+
+Writes are turned into events by triggers, whatever the write path (API,
+Telegram importer, bulk statements), appended to the ``event_log`` table
+in the writer's own transaction:
+
+- ``posts`` and ``country:<name>``: a Telegram post was imported
+- ``listings`` and ``country:<name>``: a listing was published
+- ``article:<id>:comments``: an approved comment was added
+- ``admin:summary``: a dashboard counter (``stat_counter``) changed
+
+Each web process runs one poller thread, started with the first
+subscriber, that reads new ``event_log`` rows every
+``EVENTS_POLL_INTERVAL`` seconds and fans them out to its subscribers in
+memory, so the database sees one small indexed query per process however
+many clients are connected, and every worker sees every event.
+
+A subscriber buffers at most ``EVENTS_QUEUE_SIZE`` events. A client that
+falls further behind is sent a ``reset`` event and should refetch, instead
+of the buffer growing. Reconnecting clients send ``Last-Event-ID`` and get
+the events they missed replayed from the table, as long as they are within
+``EVENTS_RETENTION`` seconds (the ``events.prune`` job deletes older ones).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+
+from . import jobs
+from .extensions import db
+
+log = logging.getLogger(__name__)
+
+MAX_TOPICS = 10
+POLL_BATCH = 1000
+
+_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS tg_post_event_ai AFTER INSERT ON tg_post BEGIN
+         INSERT INTO event_log (topic, payload, created_at)
+         SELECT t.topic, json_object('type', 'post', 'id', NEW.id, 'date', replace(NEW.date, ' ', 'T')), unixepoch()
+         FROM (SELECT 'posts' AS topic
+               UNION ALL
+               SELECT 'country:' || value FROM json_each(
+                 CASE WHEN json_valid(NEW.countries_json) THEN NEW.countries_json ELSE '[]' END)) AS t;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS announcement_event_ai AFTER INSERT ON announcement
+       WHEN NOT NEW.draft BEGIN
+         INSERT INTO event_log (topic, payload, created_at)
+         SELECT t.topic, json_object('type', 'listing', 'id', NEW.id, 'title', NEW.title,
+                                     'price', NEW.price_cents / 100.0), unixepoch()
+         FROM (SELECT 'listings' AS topic
+               UNION ALL
+               SELECT 'country:' || name FROM category WHERE id = NEW.category_id) AS t;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS announcement_event_au AFTER UPDATE OF draft ON announcement
+       WHEN OLD.draft AND NOT NEW.draft BEGIN
+         INSERT INTO event_log (topic, payload, created_at)
+         SELECT t.topic, json_object('type', 'listing', 'id', NEW.id, 'title', NEW.title,
+                                     'price', NEW.price_cents / 100.0), unixepoch()
+         FROM (SELECT 'listings' AS topic
+               UNION ALL
+               SELECT 'country:' || name FROM category WHERE id = NEW.category_id) AS t;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS article_comment_event_ai AFTER INSERT ON article_comment
+       WHEN NEW.approved BEGIN
+         INSERT INTO event_log (topic, payload, created_at)
+         VALUES ('article:' || NEW.article_id || ':comments',
+                 json_object('type', 'comment', 'id', NEW.id, 'parent_id', NEW.parent_id,
+                             'author_name', NEW.author_name, 'content', NEW.content,
+                             'created_at', replace(NEW.created_at, ' ', 'T')),
+                 unixepoch());
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS stat_counter_event_au AFTER UPDATE ON stat_counter
+       WHEN NEW.value IS NOT OLD.value BEGIN
+         INSERT INTO event_log (topic, payload, created_at)
+         VALUES ('admin:summary', json_object('type', 'counter', 'name', NEW.name, 'value', NEW.value), unixepoch());
+       END""",
+]
+
+
+def install() -> None:
+    """Create ``event_log`` and its triggers (after ``dashboard.install``: needs ``stat_counter``)."""
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS event_log (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          topic TEXT NOT NULL,
+          payload TEXT NOT NULL,
+          created_at INTEGER NOT NULL)"""))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_event_log_created_at ON event_log (created_at)"))
+    for stmt in _TRIGGERS:
+        # Driver-level: text() would read ':comments' / ':summary' as bind parameters
+        db.session.connection().exec_driver_sql(stmt)
+    db.session.commit()
+
+
+def valid_topic(topic: str) -> bool:
+    if topic in ("posts", "listings", "admin:summary"):
+        return True
+    if topic.startswith("country:"):
+        return 0 < len(topic) - len("country:") <= 100
+    parts = topic.split(":")
+    return len(parts) == 3 and parts[0] == "article" and parts[1].isdigit() and parts[2] == "comments"
+
+
+class Subscriber:
+    """Bounded event buffer of one connection."""
+
+    def __init__(self, topics: Iterable[str], size: int):
+        self.topics = frozenset(topics)
+        self._queue = deque()
+        self._size = size
+        self._lost = False
+        self._cond = threading.Condition()
+
+    def put(self, event: tuple) -> None:
+        with self._cond:
+            if len(self._queue) >= self._size:
+                # Slow consumer: drop the backlog, tell it to refetch
+                self._queue.clear()
+                self._lost = True
+            else:
+                self._queue.append(event)
+            self._cond.notify()
+
+    def wait(self, timeout: float):
+        """(events, lost) once something arrives or ``timeout`` passes."""
+        with self._cond:
+            if not self._queue and not self._lost:
+                self._cond.wait(timeout)
+            events, lost = list(self._queue), self._lost
+            self._queue.clear()
+            self._lost = False
+        return events, lost
+
+
+class Full(Exception):
+    """The process already serves ``EVENTS_MAX_CONNECTIONS`` streams."""
+
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_topic = {}
+        self._count = 0
+        self._last_id = None
+        self._poller = None
+        self._pid = None
+
+    def subscribe(self, app, topics, size: int, max_connections: int) -> Subscriber:
+        """Register a subscriber; everything logged from now on reaches it."""
+        sub = Subscriber(topics, size)
+        tip = db.session.execute(text("SELECT COALESCE(MAX(id), 0) FROM event_log")).scalar()
+        db.session.rollback()
+        with self._lock:
+            if self._count >= max_connections:
+                raise Full()
+            self._count += 1
+            for topic in sub.topics:
+                self._by_topic.setdefault(topic, set()).add(sub)
+            # Threads do not survive a fork: each worker starts its own
+            if self._pid != os.getpid():
+                self._pid, self._poller, self._last_id = os.getpid(), None, None
+            if self._last_id is None:
+                self._last_id = tip
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll, args=(app,), name="events-poller", daemon=True)
+                self._poller.start()
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            self._count -= 1
+            for topic in sub.topics:
+                subs = self._by_topic.get(topic)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._by_topic[topic]
+
+    def connections(self) -> int:
+        return self._count
+
+    def publish(self, events: list) -> None:
+        with self._lock:
+            targets = [(ev, list(self._by_topic.get(ev[1], ()))) for ev in events]
+        for ev, subs in targets:
+            for sub in subs:
+                sub.put(ev)
+
+    def _poll(self, app) -> None:
+        interval = app.config.get("EVENTS_POLL_INTERVAL", 0.5)
+        with app.app_context():
+            while True:
+                rows = []
+                with self._lock:
+                    if not self._count:
+                        # Nobody listening: the next subscriber starts from the tip again
+                        self._last_id = None
+                    last = self._last_id
+                try:
+                    if last is not None:
+                        with db.engine.connect() as conn:
+                            rows = conn.execute(text(
+                                "SELECT id, topic, payload FROM event_log WHERE id > :last ORDER BY id LIMIT :n"),
+                                {"last": last, "n": POLL_BATCH}).all()
+                        if rows:
+                            with self._lock:
+                                if self._last_id == last:
+                                    self._last_id = rows[-1][0]
+                            self.publish([tuple(r) for r in rows])
+                except Exception:
+                    log.exception("event poll failed")
+                if len(rows) < POLL_BATCH:
+                    time.sleep(interval)
+
+
+hub = Hub()
+
+
+def replay(topics, after: int, limit: int) -> Optional[list]:
+    """Events after ``after`` for ``topics``; None when some were already pruned or too many."""
+    first = db.session.execute(text("SELECT MIN(id) FROM event_log")).scalar()
+    if first is not None and after < first - 1:
+        return None
+    rows = db.session.execute(text(
+        "SELECT id, topic, payload FROM event_log WHERE id > :after AND topic IN "
+        f"({', '.join(f':t{i}' for i in range(len(topics)))}) ORDER BY id LIMIT :n"),
+        {"after": after, "n": limit + 1, **{f"t{i}": t for i, t in enumerate(topics)}}).all()
+    if len(rows) > limit:
+        return None
+    return [tuple(r) for r in rows]
+
+
+def _frame(event: tuple) -> str:
+    event_id, topic, payload = event
+    data = json.loads(payload)
+    data["topic"] = topic
+    return f"id: {event_id}\nevent: {data.get('type', 'message')}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream(sub: Subscriber, backlog: Optional[list], heartbeat: float, max_age: float):
+    """SSE body. Runs outside the request context; only touches ``sub``."""
+    try:
+        yield "retry: 3000\n\n"
+        last = 0
+        if backlog is None:
+            yield "event: reset\ndata: {}\n\n"
+        else:
+            for event in backlog:
+                last = event[0]
+                yield _frame(event)
+        deadline = time.monotonic() + max_age
+        while time.monotonic() < deadline:
+            events, lost = sub.wait(heartbeat)
+            if lost:
+                yield "event: reset\ndata: {}\n\n"
+            if not events and not lost:
+                # Keeps proxies from timing out and surfaces dead connections
+                yield ": ping\n\n"
+            for event in events:
+                if event[0] > last:
+                    last = event[0]
+                    yield _frame(event)
+    finally:
+        hub.unsubscribe(sub)
+
+
+@jobs.handler("events.prune")
+def prune(payload=None) -> int:
+    from flask import current_app
+    cutoff = int(time.time() - current_app.config.get("EVENTS_RETENTION", 600))
+    n = db.session.execute(text("DELETE FROM event_log WHERE created_at < :c"), {"c": cutoff}).rowcount
+    db.session.commit()
+    return n
+
+
+jobs.periodic("events.prune", "EVENTS_PRUNE_INTERVAL")
@@ -0,0 +1,200 @@
+"""Faceted filtering of published announcements over in-memory bitmaps.
+
+The index is built from one column-only scan of published listings, newest
+first, so a listing's position is also its rank in the default order. Each
+facet value (a category, a district, a price bucket, ...) owns a bitmap of
+positions stored as a Python int. A query ANDs the bitmaps of the selected
+filters; the count for any facet value is then ``(mask & bitmap).bit_count()``,
+so computing every count costs one AND per value and no query at all.
+
+Multi-value filters are ORs within a dimension. Each dimension's counts are
+taken against the other dimensions' filters only, so picking one district
+still shows how many listings the neighbouring districts would add.
+
+The index is rebuilt when ``table_version`` for ``announcement`` moves, at
+most once every ``FACETS_MAX_STALENESS`` seconds; meanwhile the previous
+index keeps serving.
+"""
+import threading
+import time
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import text
+
+from . import versions
+from .extensions import db
+
+INF = float("inf")
+
+# Categorical dimensions: request argument -> column in the index scan
+CATEGORICAL = {
+    "category_id": "category_id",
+    "country": "country",
+    "deal_type": "deal_type",
+    "subcategory": "subcategory",
+    "district": "district",
+    "is_per_month": "is_per_month",
+}
+
+# Range dimensions with the bucket edges used for their facet counts.
+# Prices are in currency units (stored as cents).
+RANGES = {
+    "price": [0, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000, INF],
+    "rooms": [0, 1, 2, 3, 4, 5, INF],
+    "area": [0, 20, 40, 60, 80, 100, 150, INF],
+    "floor": [-INF, 1, 2, 3, 6, 10, 17, INF],
+}
+
+
+def _bitmap(positions, n: int) -> int:
+    buf = bytearray((n + 7) // 8)
+    for p in positions:
+        buf[p >> 3] |= 1 << (p & 7)
+    return int.from_bytes(buf, "little")
+
+
+class RangeDim:
+    def __init__(self, edges, values, n):
+        self.edges = edges
+        self.values = values
+        self.n = n
+        self.positions = [[] for _ in edges[:-1]]
+        for pos, v in enumerate(values):
+            if v is None:
+                continue
+            for i in range(len(edges) - 1):
+                if v < edges[i + 1]:
+                    self.positions[i].append(pos)
+                    break
+        self.bitmaps = [_bitmap(ps, n) for ps in self.positions]
+
+    def mask(self, lo: Optional[float], hi: Optional[float]) -> int:
+        lo = -INF if lo is None else lo
+        hi = INF if hi is None else hi
+        out = 0
+        for i, bm in enumerate(self.bitmaps):
+            start, end = self.edges[i], self.edges[i + 1]
+            if end <= lo or start > hi:
+                continue
+            if lo <= start and end <= hi:
+                out |= bm
+                continue
+            # Bucket straddles a bound: check its listings one by one
+            out |= _bitmap((p for p in self.positions[i] if lo <= self.values[p] <= hi), self.n)
+        return out
+
+    def counts(self, base: int) -> list:
+        out = []
+        for i, bm in enumerate(self.bitmaps):
+            n = (base & bm).bit_count()
+            if n:
+                lo, hi = self.edges[i], self.edges[i + 1]
+                out.append({"min": None if lo == -INF else lo, "max": None if hi == INF else hi, "count": n})
+        return out
+
+
+class FacetIndex:
+    def __init__(self, rows, version: int):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.ids = [r.id for r in rows]
+        self.n = n = len(self.ids)
+        self.all = (1 << n) - 1
+        self.categorical = {}
+        for arg, col in CATEGORICAL.items():
+            by_value = {}
+            for pos, r in enumerate(rows):
+                v = getattr(r, col)
+                if v is None or v == "":
+                    continue
+                by_value.setdefault(v, []).append(pos)
+            self.categorical[arg] = {v: _bitmap(ps, n) for v, ps in by_value.items()}
+        self.ranges = {
+            "price": RangeDim(RANGES["price"], [r.price_cents / 100 for r in rows], n),
+            "rooms": RangeDim(RANGES["rooms"], [r.rooms for r in rows], n),
+            "area": RangeDim(RANGES["area"], [r.area for r in rows], n),
+            "floor": RangeDim(RANGES["floor"], [r.floor for r in rows], n),
+        }
+
+    def _masks(self, filters: dict) -> dict:
+        masks = {}
+        for arg, values in filters.get("values", {}).items():
+            bitmaps = self.categorical[arg]
+            m = 0
+            for v in values:
+                m |= bitmaps.get(v, 0)
+            masks[arg] = m
+        for arg, (lo, hi) in filters.get("ranges", {}).items():
+            masks[arg] = self.ranges[arg].mask(lo, hi)
+        return masks
+
+    def query(self, filters: dict, offset: int = 0, limit: int = 20):
+        """(total, page of ids, facets) for ``{"values": {...}, "ranges": {...}}``."""
+        masks = self._masks(filters)
+        match = self.all
+        for m in masks.values():
+            match &= m
+
+        def without(dim):
+            m = self.all
+            for d, dm in masks.items():
+                if d != dim:
+                    m &= dm
+            return m
+
+        facets = {}
+        for arg, bitmaps in self.categorical.items():
+            base = match if arg not in masks else without(arg)
+            counts = [(v, (base & bm).bit_count()) for v, bm in bitmaps.items()]
+            facets[arg] = [{"value": v, "count": c}
+                           for v, c in sorted(counts, key=lambda vc: (-vc[1], str(vc[0]))) if c]
+        for arg, dim in self.ranges.items():
+            facets[arg] = dim.counts(match if arg not in masks else without(arg))
+
+        # Bit positions are newest-first ranks; walk them as a string
+        bits = bin(match)[:1:-1]
+        page = []
+        pos = bits.find("1")
+        skipped = 0
+        while pos != -1 and len(page) < limit:
+            if skipped < offset:
+                skipped += 1
+            else:
+                page.append(self.ids[pos])
+            pos = bits.find("1", pos + 1)
+        return match.bit_count(), page, facets
+
+
+_index: Optional[FacetIndex] = None
+_build_lock = threading.Lock()
+
+
+def _build(version: int) -> FacetIndex:
+    rows = db.session.execute(text("""
+        SELECT a.id, a.category_id, c.name AS country, a.deal_type, a.subcategory, a.district,
+               a.is_per_month, a.price_cents, a.rooms, a.area, a.floor
+        FROM announcement a LEFT JOIN category c ON c.id = a.category_id
+        WHERE a.draft = 0 AND a.duplicate_of IS NULL
+        ORDER BY a.created_at DESC, a.id DESC""")).all()
+    return FacetIndex(rows, version)
+
+
+def current() -> FacetIndex:
+    global _index
+    idx = _index
+    version = versions.get("announcement")
+    if idx is not None:
+        if idx.version == version:
+            return idx
+        if time.monotonic() - idx.built_at < current_app.config.get("FACETS_MAX_STALENESS", 2):
+            return idx
+    # Only one thread rebuilds; the others keep using the previous index
+    if not _build_lock.acquire(blocking=idx is None):
+        return idx
+    try:
+        if _index is None or _index.version != version:
+            _index = _build(version)
+        return _index
+    finally:
+        _build_lock.release()
@@ -0,0 +1,403 @@
+"""Spatial index over announcement coordinates.
+
+``announcement_geo`` is an SQLite R*Tree virtual table holding one point box
+per announcement that has ``location_lat``/``location_lng``. Triggers on
+``announcement`` keep it in sync for every write path, including raw SQL and
+bulk updates, so the application never maintains it by hand.
+
+Queries first cut candidates with the R*Tree (bounding box), then apply the
+category/price filters on the joined rows and order by an equirectangular
+distance that SQLite can compute without trig functions. Exact haversine
+distances are only computed for the rows actually returned.
+
+The same triggers maintain ``geo_cell``, per-zoom marker clusters (count,
+centroid, price range per grid cell), so a map viewport is drawn from a few
+dozen pre-aggregated rows instead of every listing in it. A new listing is
+added to its cells with one upsert, and a price edit is one update unless it
+shrinks a cell's price range; only moves, (un)publishing and deletes
+recompute the cells from the listings.
+"""
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import text
+
+from .extensions import db
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = 111.32
+
+# Marker clustering: ``geo_cell`` holds aggregates of published listings on an
+# equal-angle grid. At level l a cell spans 360 / 2**l degrees each way; cell
+# (l, cx, cy) starts at lng -180 + cx*size, lat -90 + cy*size, and its parent
+# is (l-1, cx >> 1, cy >> 1). A map tile (z, x, y) uses the same coordinates
+# at level z and is drawn as the cells of level z + CLUSTER_SHIFT inside it.
+MAX_LEVEL = 18
+CLUSTER_SHIFT = 3
+MAX_TILE_ZOOM = MAX_LEVEL - CLUSTER_SHIFT
+
+_CELL_COLS = "level, cx, cy, count, sum_lat, sum_lng, sum_price, min_price, max_price"
+
+
+def cell_size(level: int) -> float:
+    return 360.0 / (1 << level)
+
+
+def _published(ref: str) -> str:
+    """Condition for a listing that is shown: not a draft and not a confirmed duplicate."""
+    return f"{ref}.draft = 0 AND {ref}.duplicate_of IS NULL"
+
+
+def _leaf(ref: str) -> tuple:
+    """(cx, cy, bounds condition on ``a``/``g``) of the leaf cell containing ``ref``."""
+    size = repr(cell_size(MAX_LEVEL))
+    lx = f"CAST(({ref}.location_lng + 180) / {size} AS INTEGER)"
+    ly = f"CAST(({ref}.location_lat + 90) / {size} AS INTEGER)"
+    s, w = f"(-90 + {ly} * {size})", f"(-180 + {lx} * {size})"
+    n, e = f"({s} + {size})", f"({w} + {size})"
+    inside = (f"g.max_lat >= {s} AND g.min_lat <= {n} AND g.max_lng >= {w} AND g.min_lng <= {e} "
+              f"AND a.location_lat >= {s} AND a.location_lat < {n} "
+              f"AND a.location_lng >= {w} AND a.location_lng < {e}")
+    return lx, ly, inside
+
+
+def _cells_of(ref: str) -> str:
+    """``VALUES`` rows (level, cx, cy) of the MAX_LEVEL + 1 cells containing ``ref``."""
+    lx, ly, _ = _leaf(ref)
+    return "VALUES " + ", ".join(
+        f"({level}, {lx} >> {MAX_LEVEL - level}, {ly} >> {MAX_LEVEL - level})" for level in range(MAX_LEVEL + 1))
+
+
+def _refresh_sql(ref: str) -> list:
+    """Statements recomputing every cell that contains ``ref`` (NEW or OLD), bottom-up.
+
+    The leaf is rebuilt from the listings inside it, found via the R*Tree;
+    each ancestor from its four children, so no statement touches more than
+    a leaf's worth of rows however coarse the level.
+    """
+    lx, ly, inside = _leaf(ref)
+    stmts = [
+        f"DELETE FROM geo_cell WHERE level = {MAX_LEVEL} AND cx = {lx} AND cy = {ly}",
+        f"""INSERT INTO geo_cell ({_CELL_COLS})
+            SELECT {MAX_LEVEL}, {lx}, {ly}, COUNT(*), SUM(a.location_lat), SUM(a.location_lng),
+                   SUM(a.price_cents), MIN(a.price_cents), MAX(a.price_cents)
+            FROM announcement_geo g JOIN announcement a ON a.id = g.id
+            WHERE {inside} AND {_published("a")}
+            HAVING COUNT(*) > 0""",
+    ]
+    for level in range(MAX_LEVEL - 1, -1, -1):
+        shift = MAX_LEVEL - level
+        px, py = f"({lx} >> {shift})", f"({ly} >> {shift})"
+        stmts += [
+            f"DELETE FROM geo_cell WHERE level = {level} AND cx = {px} AND cy = {py}",
+            f"""INSERT INTO geo_cell ({_CELL_COLS})
+                SELECT {level}, {px}, {py}, SUM(count), SUM(sum_lat), SUM(sum_lng),
+                       SUM(sum_price), MIN(min_price), MAX(max_price)
+                FROM geo_cell
+                WHERE level = {level + 1} AND cx BETWEEN 2 * {px} AND 2 * {px} + 1
+                  AND cy BETWEEN 2 * {py} AND 2 * {py} + 1
+                HAVING SUM(count) > 0""",
+        ]
+    return stmts
+
+
+def _add_sql() -> str:
+    """One upsert adding NEW to every cell containing it; adding only ever widens a price range."""
+    return f"""INSERT INTO geo_cell ({_CELL_COLS})
+        SELECT column1, column2, column3, 1, NEW.location_lat, NEW.location_lng,
+               NEW.price_cents, NEW.price_cents, NEW.price_cents
+        FROM ({_cells_of("NEW")}) WHERE {_published("NEW")}
+        ON CONFLICT (level, cx, cy) DO UPDATE SET
+          count = count + 1, sum_lat = sum_lat + excluded.sum_lat, sum_lng = sum_lng + excluded.sum_lng,
+          sum_price = sum_price + excluded.sum_price,
+          min_price = min(min_price, excluded.min_price), max_price = max(max_price, excluded.max_price)"""
+
+
+def _reprice_sql() -> str:
+    """One update moving NEW's price in every cell containing it (see ``_price_bound_moved``)."""
+    # A join, not a row-value IN, so each cell is a primary-key probe
+    return f"""UPDATE geo_cell SET sum_price = sum_price + NEW.price_cents - OLD.price_cents,
+          min_price = min(min_price, NEW.price_cents), max_price = max(max_price, NEW.price_cents)
+        FROM ({_cells_of("NEW")}) AS c
+        WHERE geo_cell.level = c.column1 AND geo_cell.cx = c.column2 AND geo_cell.cy = c.column3"""
+
+
+def _price_bound_moved() -> str:
+    """Whether OLD's price was its leaf's only minimum (and rose) or only maximum (and fell).
+
+    Then the cells' price range shrinks and has to be recomputed; otherwise
+    ``_reprice_sql`` is exact. Decided from ``announcement`` alone, which the
+    cell triggers never write, so it reads the same in both price triggers.
+    """
+    _, _, inside = _leaf("NEW")
+    others = (f"SELECT 1 FROM announcement_geo g JOIN announcement a ON a.id = g.id "
+              f"WHERE {inside} AND {_published('a')} AND a.id != NEW.id")
+    return (f"(NEW.price_cents > OLD.price_cents AND NOT EXISTS ({others} AND a.price_cents <= OLD.price_cents) "
+            f"OR NEW.price_cents < OLD.price_cents AND NOT EXISTS ({others} AND a.price_cents >= OLD.price_cents))")
+
+
+def _trigger(name: str, event: str, when: str, body: list) -> str:
+    return f"CREATE TRIGGER {name} AFTER {event} ON announcement {when}\nBEGIN\n" + ";\n".join(body) + ";\nEND"
+
+
+# Columns that decide whether and where a listing is in the cells
+_PLACEMENT = ("location_lat", "location_lng", "draft", "duplicate_of")
+
+_TABLES = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS announcement_geo USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+    """CREATE TABLE IF NOT EXISTS geo_cell (
+         level INTEGER NOT NULL, cx INTEGER NOT NULL, cy INTEGER NOT NULL,
+         count INTEGER NOT NULL, sum_lat REAL NOT NULL, sum_lng REAL NOT NULL,
+         sum_price INTEGER NOT NULL, min_price INTEGER NOT NULL, max_price INTEGER NOT NULL,
+         PRIMARY KEY (level, cx, cy)
+       ) WITHOUT ROWID""",
+]
+
+
+def _triggers() -> dict:
+    """Trigger name -> CREATE statement, as SQLite stores it in ``sqlite_master``."""
+    rtree_insert = ("INSERT OR REPLACE INTO announcement_geo "
+                    "SELECT NEW.id, NEW.location_lat, NEW.location_lat, NEW.location_lng, NEW.location_lng "
+                    "WHERE NEW.location_lat IS NOT NULL AND NEW.location_lng IS NOT NULL")
+    rtree_delete = "DELETE FROM announcement_geo WHERE id = OLD.id"
+    moved = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in _PLACEMENT)
+    # A price edit of a listing that stays where it is and stays published
+    repriced = (f"WHEN NOT ({moved}) AND {_published('NEW')} AND NEW.location_lat IS NOT NULL "
+                f"AND NEW.location_lng IS NOT NULL AND OLD.price_cents IS NOT NEW.price_cents")
+    # The R*Tree is synced first in each body since the cell refresh reads it.
+    return {
+        "announcement_geo_ai": _trigger(
+            "announcement_geo_ai", "INSERT", "WHEN NEW.location_lat IS NOT NULL AND NEW.location_lng IS NOT NULL",
+            [rtree_insert, _add_sql()]),
+        "announcement_geo_au": _trigger(
+            "announcement_geo_au", f"UPDATE OF {', '.join(_PLACEMENT)}", f"WHEN {moved}",
+            [rtree_delete, rtree_insert] + _refresh_sql("OLD") + _refresh_sql("NEW")),
+        "announcement_geo_price_au": _trigger(
+            "announcement_geo_price_au", "UPDATE OF price_cents",
+            f"{repriced} AND NOT {_price_bound_moved()}", [_reprice_sql()]),
+        "announcement_geo_price_bound_au": _trigger(
+            "announcement_geo_price_bound_au", "UPDATE OF price_cents",
+            f"{repriced} AND {_price_bound_moved()}", _refresh_sql("NEW")),
+        "announcement_geo_ad": _trigger(
+            "announcement_geo_ad", "DELETE", "", [rtree_delete] + _refresh_sql("OLD")),
+    }
+
+
+def rebuild_cells() -> None:
+    """Recompute all of ``geo_cell`` from ``announcement`` in one pass per level."""
+    size = repr(cell_size(MAX_LEVEL))
+    db.session.execute(text("DELETE FROM geo_cell"))
+    db.session.execute(text(f"""
+        INSERT INTO geo_cell ({_CELL_COLS})
+        SELECT {MAX_LEVEL}, CAST((location_lng + 180) / {size} AS INTEGER) AS x,
+               CAST((location_lat + 90) / {size} AS INTEGER) AS y,
+               COUNT(*), SUM(location_lat), SUM(location_lng),
+               SUM(price_cents), MIN(price_cents), MAX(price_cents)
+        FROM announcement
+        WHERE location_lat IS NOT NULL AND location_lng IS NOT NULL AND {_published("announcement")}
+        GROUP BY x, y"""))
+    for level in range(MAX_LEVEL - 1, -1, -1):
+        db.session.execute(text(f"""
+            INSERT INTO geo_cell ({_CELL_COLS})
+            SELECT {level}, cx >> 1 AS x, cy >> 1 AS y, SUM(count), SUM(sum_lat), SUM(sum_lng),
+                   SUM(sum_price), MIN(min_price), MAX(max_price)
+            FROM geo_cell WHERE level = {level + 1}
+            GROUP BY x, y"""))
+
+
+def install() -> None:
+    """Create the R*Tree, the cluster table and their triggers; backfill on first install.
+
+    Triggers are recreated on every start so their bodies follow this file.
+    When a definition changed, what the cells count may have changed with
+    it, so they are rebuilt once.
+    """
+    def exists(name):
+        return db.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = :n"), {"n": name}).first()
+
+    have_rtree, have_cells = exists("announcement_geo"), exists("geo_cell")
+    for stmt in _TABLES:
+        db.session.execute(text(stmt))
+    triggers = _triggers()
+    stored = dict(db.session.execute(text(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'announcement'")).all())
+    for name, sql in triggers.items():
+        db.session.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        db.session.execute(text(sql))
+    if not have_rtree:
+        db.session.execute(text(
+            "INSERT OR REPLACE INTO announcement_geo "
+            "SELECT id, location_lat, location_lat, location_lng, location_lng FROM announcement "
+            "WHERE location_lat IS NOT NULL AND location_lng IS NOT NULL"))
+    if not have_cells or any(stored.get(name) != sql for name, sql in triggers.items()):
+        rebuild_cells()
+    db.session.commit()
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(lat: float, lng: float, radius_km: float):
+    """Bounding box (south, west, north, east) enclosing a circle."""
+    dlat = radius_km / KM_PER_DEG_LAT
+    coslat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(radius_km / (KM_PER_DEG_LAT * coslat), 180.0)
+    return max(lat - dlat, -90.0), lng - dlng, min(lat + dlat, 90.0), lng + dlng
+
+
+def _lng_clause(west: float, east: float, params: dict) -> str:
+    # Boxes crossing the antimeridian are split in two
+    if west < -180 or east > 180 or west > east:
+        west = (west + 540) % 360 - 180
+        east = (east + 540) % 360 - 180
+        params.update(w=west, e=east)
+        return "(g.min_lng <= 180 AND g.max_lng >= :w OR g.min_lng <= :e AND g.max_lng >= -180)"
+    params.update(w=west, e=east)
+    return "g.min_lng <= :e AND g.max_lng >= :w"
+
+
+def search(south: float, west: float, north: float, east: float,
+           center: Optional[tuple] = None, radius_km: Optional[float] = None,
+           category_id: Optional[int] = None, country: Optional[str] = None,
+           price_min: Optional[int] = None, price_max: Optional[int] = None,
+           limit: int = 100):
+    """Published announcements inside the box (and circle), nearest to ``center`` first."""
+    if center is None:
+        center = ((south + north) / 2, (west + east) / 2)
+    clat, clng = center
+    params = {"s": south, "n": north, "clat": clat, "clng": clng,
+              "k": math.cos(math.radians(clat)) ** 2, "limit": limit}
+    where = ["g.min_lat <= :n", "g.max_lat >= :s", _lng_clause(west, east, params), _published("a")]
+    join = ""
+    if category_id is not None:
+        where.append("a.category_id = :cid")
+        params["cid"] = category_id
+    if country:
+        join = "JOIN category c ON c.id = a.category_id"
+        where.append("c.name = :country")
+        params["country"] = country
+    if price_min is not None:
+        where.append("a.price_cents >= :pmin")
+        params["pmin"] = price_min
+    if price_max is not None:
+        where.append("a.price_cents <= :pmax")
+        params["pmax"] = price_max
+    if radius_km is not None:
+        # Equirectangular distance in degrees^2; exact enough to pre-filter a circle
+        deg = radius_km / KM_PER_DEG_LAT
+        where.append("((a.location_lat - :clat) * (a.location_lat - :clat) + "
+                     ":k * (a.location_lng - :clng) * (a.location_lng - :clng)) <= :r2")
+        params["r2"] = (deg * 1.01) ** 2
+    sql = f"""
+        SELECT a.id, a.title, a.price_cents, a.is_per_month, a.location_lat, a.location_lng,
+               a.category_id, a.images_json, a.address
+        FROM announcement_geo g
+        JOIN announcement a ON a.id = g.id
+        {join}
+        WHERE {' AND '.join(where)}
+        ORDER BY (a.location_lat - :clat) * (a.location_lat - :clat)
+               + :k * (a.location_lng - :clng) * (a.location_lng - :clng)
+        LIMIT :limit
+    """
+    rows = db.session.execute(text(sql), params).all()
+    out = []
+    for r in rows:
+        dist = haversine_km(clat, clng, r.location_lat, r.location_lng)
+        if radius_km is not None and dist > radius_km:
+            continue
+        out.append((r, dist))
+    return out
+
+
+_tile_cache = OrderedDict()
+_tile_lock = threading.Lock()
+TILE_CACHE_SIZE = 4096
+
+
+def tile_range(z: int):
+    """Number of tile columns and rows at zoom ``z``.
+
+    Tiles are square in degrees, so there are half as many rows as columns;
+    at zoom 0 the single 360-degree tile covers the whole world.
+    """
+    return 1 << z, 1 << max(z - 1, 0)
+
+
+def tiles_for_bbox(z: int, south: float, west: float, north: float, east: float) -> list:
+    """Tiles at zoom ``z`` covering the box; longitudes wrap across the antimeridian."""
+    size = cell_size(z)
+    cols, rows = tile_range(z)
+    y0 = max(0, int((max(south, -90.0) + 90) // size))
+    y1 = min(rows - 1, int((min(north, 90.0) + 90) // size))
+    x0 = int((west + 180) // size)
+    x1 = int((east + 180) // size)
+    if x1 < x0:
+        x1 += cols
+    xs = sorted({x % cols for x in range(x0, min(x1, x0 + cols - 1) + 1)})
+    return [(z, x, y) for y in range(y0, y1 + 1) for x in xs]
+
+
+def _tile_version(z: int, x: int, y: int):
+    # The tile's own aggregate changes with any write inside it
+    return db.session.execute(text(
+        "SELECT count, sum_lat, sum_lng, sum_price, min_price, max_price FROM geo_cell "
+        "WHERE level = :z AND cx = :x AND cy = :y"), {"z": z, "x": x, "y": y}).first()
+
+
+def _singleton_id(lat: float, lng: float) -> Optional[int]:
+    return db.session.execute(text(
+        "SELECT a.id FROM announcement_geo g JOIN announcement a ON a.id = g.id "
+        "WHERE g.min_lat <= :lat AND g.max_lat >= :lat AND g.min_lng <= :lng AND g.max_lng >= :lng "
+        f"AND a.location_lat = :lat AND a.location_lng = :lng AND {_published('a')} LIMIT 1"),
+        {"lat": lat, "lng": lng}).scalar()
+
+
+def tile_clusters(z: int, x: int, y: int):
+    """(version, clusters) for one tile, served from the process cache while unchanged.
+
+    ``version`` is a short hash usable as an ETag; it is None for an empty tile.
+    """
+    row = _tile_version(z, x, y)
+    version = hashlib.blake2s(repr(tuple(row)).encode(), digest_size=8).hexdigest() if row else None
+    key = (z, x, y)
+    with _tile_lock:
+        hit = _tile_cache.get(key)
+        if hit is not None and hit[0] == version:
+            _tile_cache.move_to_end(key)
+            return hit
+    clusters = []
+    if row:
+        level, shift = z + CLUSTER_SHIFT, CLUSTER_SHIFT
+        size = cell_size(level)
+        cells = db.session.execute(text(
+            "SELECT cx, cy, count, sum_lat, sum_lng, min_price, max_price FROM geo_cell "
+            "WHERE level = :l AND cx BETWEEN :x0 AND :x1 AND cy BETWEEN :y0 AND :y1"),
+            {"l": level, "x0": x << shift, "x1": ((x + 1) << shift) - 1,
+             "y0": y << shift, "y1": ((y + 1) << shift) - 1}).all()
+        for c in cells:
+            lat, lng = c.sum_lat / c.count, c.sum_lng / c.count
+            south, west = -90 + c.cy * size, -180 + c.cx * size
+            clusters.append({
+                "count": c.count,
+                "lat": round(lat, 6),
+                "lng": round(lng, 6),
+                "price_min": round(c.min_price / 100, 2),
+                "price_max": round(c.max_price / 100, 2),
+                "bbox": [south, west, south + size, west + size],
+                "id": _singleton_id(lat, lng) if c.count == 1 else None,
+            })
+    entry = (version, clusters)
+    with _tile_lock:
+        _tile_cache[key] = entry
+        _tile_cache.move_to_end(key)
+        while len(_tile_cache) > TILE_CACHE_SIZE:
+            _tile_cache.popitem(last=False)
+    return entry
@@ -0,0 +1,332 @@
+"""Small durable job queue stored in the ``job`` table.
+
+Enqueue from a request (the row is part of the caller's transaction, so it
+is only visible once the request commits)::
+
+    from . import jobs
+
+    @jobs.handler("sitemap.rebuild")
+    def rebuild_sitemap(payload):
+        ...
+
+    jobs.enqueue("sitemap.rebuild", {"full": True}, priority=5, key="sitemap")
+    db.session.commit()
+
+and run the worker next to the web server::
+
+    python -m backend.jobs worker --threads 4
+
+Jobs are claimed with a single ``UPDATE ... RETURNING`` so several worker
+processes can share the table. Failures are retried with exponential backoff
+until ``max_attempts``; ``key`` makes enqueueing idempotent (a second enqueue
+with the same key is a no-op for as long as the row exists). With
+``JOBS_INLINE`` set, the handler runs in-process instead: right after the
+caller's commit (nothing runs if it rolls back), in its own app context
+and transaction, with failures logged rather than raised into the caller.
+Periodic jobs then run on a thread of the web process (started by its
+first request). This keeps the dev server usable without a worker.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import select, update, delete, func, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .extensions import db
+from .models import Job
+
+log = logging.getLogger(__name__)
+
+_handlers = {}
+_periodic = {}  # kind -> interval in seconds, or the config key holding it
+_scheduled_slots = {}  # kind -> last slot this process enqueued
+_ticker = None
+_ticker_pid = None
+_ticker_lock = threading.Lock()
+
+
+def handler(kind: str):
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def periodic(kind: str, every):
+    """Have the worker enqueue ``kind`` every ``every`` seconds (a number or a config key)."""
+    _periodic[kind] = every
+
+
+def schedule_periodic() -> None:
+    now = time.time()
+    for kind, every in _periodic.items():
+        interval = float(current_app.config.get(every, 0) if isinstance(every, str) else every)
+        if interval <= 0:
+            continue
+        slot = int(now // interval)
+        if _scheduled_slots.get(kind) == slot:
+            continue
+        if current_app.config.get("JOBS_INLINE"):
+            # No worker: run it here. Like a queued periodic job it gets one
+            # attempt, and a failure waits for the next slot.
+            _scheduled_slots[kind] = slot
+            try:
+                _handlers[kind]({})
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                log.exception("periodic job %s failed", kind)
+            continue
+        # One key per time slot: however many workers tick, the slot runs once
+        enqueue(kind, key=f"{kind}@{slot}", priority=-1, max_attempts=1)
+        _scheduled_slots[kind] = slot
+    db.session.commit()
+
+
+def _tick(app) -> None:
+    while True:
+        try:
+            with app.app_context():
+                schedule_periodic()
+        except Exception:
+            log.exception("periodic job scheduling failed")
+        time.sleep(1)
+
+
+def _ensure_ticker(app) -> None:
+    global _ticker, _ticker_pid
+    if _ticker is not None and _ticker_pid == os.getpid() and _ticker.is_alive():
+        return
+    with _ticker_lock:
+        if _ticker is None or _ticker_pid != os.getpid() or not _ticker.is_alive():
+            _ticker_pid = os.getpid()
+            _ticker = threading.Thread(target=_tick, args=(app,), name="jobs-periodic", daemon=True)
+            _ticker.start()
+
+
+def init_app(app) -> None:
+    """With ``JOBS_INLINE`` no worker runs ``schedule_periodic``; each serving process does."""
+    if not app.config.get("JOBS_INLINE"):
+        return
+
+    # Started lazily, in the process that serves (after a fork, not in a preloading master)
+    @app.before_request
+    def _start_periodic():
+        _ensure_ticker(app)
+
+
+def enqueue(kind: str, payload: Optional[dict] = None, priority: int = 0, delay: float = 0,
+            key: Optional[str] = None, max_attempts: int = 5) -> Optional[int]:
+    """Queue ``kind`` for the worker; returns the job id (None if run inline or deduplicated)."""
+    if current_app.config.get("JOBS_INLINE"):
+        # Like a queued row, it takes effect only once the caller commits
+        db.session.info.setdefault("inline_jobs", []).append((kind, payload or {}))
+        return None
+    values = dict(
+        kind=kind,
+        payload_json=json.dumps(payload or {}, ensure_ascii=False),
+        priority=priority,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        idempotency_key=key,
+        status="queued",
+        attempts=0,
+        created_at=datetime.utcnow(),
+    )
+    stmt = sqlite_insert(Job).values(**values)
+    if key:
+        stmt = stmt.on_conflict_do_nothing(index_elements=["idempotency_key"])
+    res = db.session.execute(stmt.returning(Job.id))
+    row = res.first()
+    return row[0] if row else None
+
+
+@event.listens_for(db.session, "after_commit")
+def _run_inline(session) -> None:
+    pending = session.info.pop("inline_jobs", None)
+    if not pending:
+        return
+    app = current_app._get_current_object()
+    for kind, payload in pending:
+        # A fresh app context has its own session, so the caller's stays untouched
+        with app.app_context():
+            try:
+                _handlers[kind](payload)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                log.exception("inline job %s failed", kind)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _drop_inline(session, previous_transaction) -> None:
+    # Also when nothing had been flushed yet; a savepoint rollback keeps them
+    if not session.in_transaction():
+        session.info.pop("inline_jobs", None)
+
+
+def backoff(attempts: int) -> float:
+    base = current_app.config.get("JOBS_BACKOFF_BASE", 5)
+    cap = current_app.config.get("JOBS_BACKOFF_MAX", 3600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(worker_id: str) -> Optional[dict]:
+    now = datetime.utcnow()
+    next_id = (select(Job.id)
+               .where(Job.status == "queued", Job.run_at <= now)
+               .order_by(Job.priority.desc(), Job.run_at, Job.id)
+               .limit(1)
+               .scalar_subquery())
+    stmt = (update(Job)
+            .where(Job.id == next_id, Job.status == "queued")
+            .values(status="running", locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+            .returning(Job.id, Job.kind, Job.payload_json, Job.attempts, Job.max_attempts))
+    row = db.session.execute(stmt, execution_options={"synchronize_session": False}).first()
+    db.session.commit()
+    return dict(row._mapping) if row else None
+
+
+def run_job(job: dict) -> bool:
+    try:
+        fn = _handlers.get(job["kind"])
+        if fn is None:
+            raise LookupError(f"no handler for job kind {job['kind']!r}")
+        fn(json.loads(job["payload_json"] or "{}"))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log.exception("job %s (%s) failed", job["id"], job["kind"])
+        failed = job["attempts"] >= job["max_attempts"]
+        values = dict(last_error=f"{type(e).__name__}: {e}"[:2000], locked_by=None, locked_at=None)
+        if failed:
+            values.update(status="failed", finished_at=datetime.utcnow())
+        else:
+            values.update(status="queued", run_at=datetime.utcnow() + timedelta(seconds=backoff(job["attempts"])))
+        db.session.execute(update(Job).where(Job.id == job["id"]).values(**values))
+        db.session.commit()
+        return False
+    db.session.execute(update(Job).where(Job.id == job["id"]).values(
+        status="done", finished_at=datetime.utcnow(), locked_by=None, locked_at=None, last_error=None))
+    db.session.commit()
+    return True
+
+
+def requeue_stale(timeout: float) -> int:
+    """Put back jobs whose worker died while running them."""
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+    res = db.session.execute(update(Job)
+                             .where(Job.status == "running", Job.locked_at < cutoff)
+                             .values(status="queued", locked_by=None, locked_at=None))
+    db.session.commit()
+    return res.rowcount or 0
+
+
+def prune(retention: float) -> int:
+    """Delete finished jobs older than ``retention`` seconds."""
+    cutoff = datetime.utcnow() - timedelta(seconds=retention)
+    res = db.session.execute(delete(Job).where(Job.status == "done", Job.finished_at < cutoff))
+    db.session.commit()
+    return res.rowcount or 0
+
+
+def stats() -> dict:
+    """Queue depth per status and kind, plus the age of the oldest ready job."""
+    rows = db.session.execute(select(Job.status, Job.kind, func.count()).group_by(Job.status, Job.kind)).all()
+    by_status = {}
+    by_kind = {}
+    for status, kind, n in rows:
+        by_status[status] = by_status.get(status, 0) + n
+        by_kind.setdefault(kind, {})[status] = n
+    oldest = db.session.execute(select(func.min(Job.run_at)).where(Job.status == "queued", Job.run_at <= datetime.utcnow())).scalar()
+    return {
+        "by_status": by_status,
+        "by_kind": by_kind,
+        "oldest_ready_age": (datetime.utcnow() - oldest).total_seconds() if oldest else 0,
+    }
+
+
+class Worker:
+    def __init__(self, app, threads: int = 4, poll: float = 1.0):
+        self.app = app
+        self.threads = threads
+        self.poll = poll
+        self.id = f"{socket.gethostname()}:{os.getpid()}"
+        self._slots = threading.Semaphore(threads)
+        self._stop = threading.Event()
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def _run(self, job):
+        try:
+            with self.app.app_context():
+                run_job(job)
+        finally:
+            self._slots.release()
+
+    def run(self):
+        lock_timeout = self.app.config.get("JOBS_LOCK_TIMEOUT", 600)
+        last_sweep = last_tick = 0.0
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="job") as pool:
+            while not self._stop.is_set():
+                if time.monotonic() - last_tick > 1:
+                    with self.app.app_context():
+                        schedule_periodic()
+                    last_tick = time.monotonic()
+                if time.monotonic() - last_sweep > lock_timeout / 2:
+                    with self.app.app_context():
+                        requeue_stale(lock_timeout)
+                        prune(self.app.config.get("JOBS_RETENTION", 7 * 86400))
+                    last_sweep = time.monotonic()
+                self._slots.acquire()
+                with self.app.app_context():
+                    job = claim(self.id)
+                if job is None:
+                    self._slots.release()
+                    self._stop.wait(self.poll)
+                    continue
+                pool.submit(self._run, job)
+
+
+def main():
+    from . import create_app
+    parser = argparse.ArgumentParser(description="Magic Worlds background jobs")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("worker", help="run jobs until interrupted")
+    w.add_argument("--threads", type=int, default=int(os.environ.get("JOBS_THREADS", 4)))
+    w.add_argument("--poll", type=float, default=float(os.environ.get("JOBS_POLL_INTERVAL", 1.0)))
+    sub.add_parser("stats", help="print queue depth")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    app = create_app(os.environ.get("FLASK_ENV", "production"))
+    app.config["JOBS_INLINE"] = False
+    if args.cmd == "stats":
+        with app.app_context():
+            print(json.dumps(stats(), indent=2))
+        return 0
+    worker = Worker(app, threads=args.threads, poll=args.poll)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    log.info("worker %s started with %d threads", worker.id, args.threads)
+    worker.run()
+    return 0
+
+
+if __name__ == "__main__":
+    # Re-import so handlers registered by the app modules land in the same module object
+    from backend.jobs import main as _main
+    raise SystemExit(_main())
@@ -0,0 +1,151 @@
+"""Server-rendered country and category landing pages.
+
+``/country-<slug>.html`` (the URLs the old redirect stubs lived at) and
+``/category/<slug>`` are rendered on the server with the first page of
+listings and Telegram posts in the HTML, so a visit costs one request and
+crawlers see the content.
+
+The two blocks are rendered separately and cached in process per
+(block, scope, page). Each cached fragment remembers the ``table_version``
+counters of the tables it was built from (``DEPENDS``) and is re-rendered
+once one of them moves: a Telegram import only invalidates post blocks, a
+new or edited listing only listing blocks. Checking costs one small query
+per page view.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from flask import render_template
+from markupsafe import Markup
+
+from . import versions
+from .extensions import db
+from .models import Announcement, Category, TgPost
+
+PAGE_SIZE = 20
+FRAGMENT_CACHE_SIZE = 512
+EXCERPT_CHARS = 160
+
+# slug of the historical country-<slug>.html URL -> country (category) name
+COUNTRIES = {
+    "armeniya": "Армения",
+    "avstriya": "Австрия",
+    "bahrain": "Бахрейн",
+    "dominikana": "Доминикана",
+    "egipet": "Египет",
+    "germaniya": "Германия",
+    "gonduras": "Гондурас",
+    "greciya": "Греция",
+    "gruziya": "Грузия",
+    "india": "Индия",
+    "indoneziya": "Индонезия",
+    "islandiya": "Исландия",
+    "ispaniya": "Испания",
+    "velikobritaniya": "Великобритания",
+    "vetnam": "Вьетнам",
+}
+
+DEPENDS = {
+    "listings": ("announcement", "category"),
+    "posts": ("tg_post",),
+}
+
+_fragments = OrderedDict()
+_lock = threading.Lock()
+
+
+def _excerpt(text_: Optional[str]) -> str:
+    t = (text_ or "").strip()
+    return t if len(t) <= EXCERPT_CHARS else t[:EXCERPT_CHARS - 1] + "…"
+
+
+def _listings(country: str, page: int) -> list:
+    rows = (Announcement.query.join(Category)
+            .filter(Category.name == country, Announcement.draft.is_(False), Announcement.duplicate_of.is_(None))
+            .with_entities(Announcement.id, Announcement.title, Announcement.content_excerpt,
+                           Announcement.first_image, Announcement.price_cents, Announcement.is_per_month,
+                           Announcement.address, Announcement.created_at)
+            .order_by(Announcement.created_at.desc())
+            .offset((page - 1) * PAGE_SIZE).limit(PAGE_SIZE + 1).all())
+    return [{
+        "id": r.id,
+        "title": r.title,
+        "excerpt": _excerpt(r.content_excerpt),
+        "image_url": r.first_image,
+        "price": round((r.price_cents or 0) / 100, 2),
+        "is_per_month": bool(r.is_per_month),
+        "address": r.address or "",
+        "created_at": r.created_at.isoformat(),
+    } for r in rows]
+
+
+def _posts(country: str, page: int) -> list:
+    # Same match as /api/tg_posts: the name as a JSON string in countries_json
+    rows = (TgPost.query.filter(TgPost.countries_json.like(f'%"{country}"%'), TgPost.duplicate_of.is_(None))
+            .with_entities(TgPost.id, TgPost.date, TgPost.text, TgPost.image_urls_json, TgPost.source_link)
+            .order_by(TgPost.date.desc())
+            .offset((page - 1) * PAGE_SIZE).limit(PAGE_SIZE + 1).all())
+    out = []
+    for r in rows:
+        try:
+            images = json.loads(r.image_urls_json) if r.image_urls_json else []
+        except ValueError:
+            images = []
+        out.append({
+            "id": r.id,
+            "date": r.date.isoformat() if r.date else None,
+            "text_excerpt": _excerpt(r.text),
+            "image_url": images[0] if images else None,
+            "source_link": r.source_link,
+        })
+    return out
+
+
+_LOADERS = {"listings": _listings, "posts": _posts}
+
+
+def fragment(block: str, country: str, page: int, known: dict) -> tuple:
+    """(html, has_next) for one block, from cache while its tables are unchanged."""
+    stamp = tuple(known[t] for t in DEPENDS[block])
+    key = (block, country, page)
+    hit = _fragments.get(key)
+    if hit is not None and hit[0] == stamp:
+        with _lock:
+            if key in _fragments:
+                _fragments.move_to_end(key)
+        return hit[1], hit[2]
+    items = _LOADERS[block](country, page)
+    has_next = len(items) > PAGE_SIZE
+    html = Markup(render_template(f"landing/_{block}.html", items=items[:PAGE_SIZE]))
+    with _lock:
+        _fragments[key] = (stamp, html, has_next)
+        _fragments.move_to_end(key)
+        while len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+    return html, has_next
+
+
+def render(country: str, page: int, canonical: str) -> tuple:
+    """(page HTML, ETag) for the landing page of ``country``."""
+    known = versions.get_many(versions.TRACKED)
+    listings, listings_next = fragment("listings", country, page, known)
+    posts, posts_next = fragment("posts", country, page, known)
+    etag = hashlib.blake2s(repr((country, page, sorted(known.items()))).encode(), digest_size=12).hexdigest()
+    html = render_template(
+        "landing/page.html",
+        country=country,
+        page=page,
+        canonical=canonical,
+        listings=listings,
+        posts=posts,
+        has_next=listings_next or posts_next,
+        data={"country": country, "page": page, "page_size": PAGE_SIZE},
+    )
+    return html, etag
+
+
+def country_for_category(slug: str) -> Optional[str]:
+    return db.session.execute(db.select(Category.name).where(Category.slug == slug)).scalar()
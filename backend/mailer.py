@@ -0,0 +1,122 @@
+"""Outgoing mail over a small pool of reused SMTP connections.
+
+Opening an SMTP session (TCP + EHLO + STARTTLS + AUTH) costs far more than
+sending one message, so connections are kept and handed out by ``pool``.
+A connection is retired after ``SMTP_MAX_PER_CONNECTION`` messages (many
+servers cap this) or when the server drops it.
+
+Configuration comes from the environment: SMTP_HOST, SMTP_PORT, SMTP_USER,
+SMTP_PASSWORD, SMTP_STARTTLS, SMTP_SSL, SMTP_FROM. Without SMTP_HOST mail
+is disabled and ``send`` only logs.
+"""
+import logging
+import os
+import queue
+import smtplib
+from contextlib import contextmanager
+from email.message import EmailMessage
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+
+# Refusals of one message or address: the connection is still usable and
+# retrying the same recipient will not help. Anything else (disconnects,
+# auth, a refused sender) affects every message and should fail the caller.
+RECIPIENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPNotSupportedError)
+
+
+def enabled() -> bool:
+    return bool(os.environ.get("SMTP_HOST"))
+
+
+def build_message(to: str, subject: str, body: str, headers: Optional[dict] = None) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = os.environ.get("SMTP_FROM", "Magic Worlds <noreply@localhost>")
+    msg["To"] = to
+    msg["Subject"] = subject
+    for k, v in (headers or {}).items():
+        msg[k] = v
+    msg.set_content(body)
+    return msg
+
+
+class _Conn:
+    def __init__(self):
+        host = os.environ.get("SMTP_HOST", "localhost")
+        port = int(os.environ.get("SMTP_PORT", 25))
+        timeout = float(os.environ.get("SMTP_TIMEOUT", 30))
+        if os.environ.get("SMTP_SSL", "0") == "1":
+            self.smtp = smtplib.SMTP_SSL(host, port, timeout=timeout)
+        else:
+            self.smtp = smtplib.SMTP(host, port, timeout=timeout)
+            if os.environ.get("SMTP_STARTTLS", "0") == "1":
+                self.smtp.starttls()
+        user = os.environ.get("SMTP_USER")
+        if user:
+            self.smtp.login(user, os.environ.get("SMTP_PASSWORD", ""))
+        self.sent = 0
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            pass
+
+
+class SMTPPool:
+    def __init__(self, size: int = 4, max_per_connection: int = 100):
+        self.size = size
+        self.max_per_connection = max_per_connection
+        self._idle = queue.LifoQueue()
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = _Conn()
+        try:
+            yield conn
+        except smtplib.SMTPServerDisconnected:
+            conn = None
+            raise
+        finally:
+            if conn is not None:
+                if conn.sent >= self.max_per_connection or self._idle.qsize() >= self.size:
+                    conn.close()
+                else:
+                    self._idle.put(conn)
+
+    def send(self, msg: EmailMessage) -> None:
+        # One retry on a fresh connection if a pooled one went stale
+        for attempt in (1, 2):
+            try:
+                with self.connection() as conn:
+                    conn.smtp.send_message(msg)
+                    conn.sent += 1
+                return
+            except smtplib.SMTPServerDisconnected:
+                if attempt == 2:
+                    raise
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+pool = SMTPPool(
+    size=int(os.environ.get("SMTP_POOL_SIZE", 4)),
+    max_per_connection=int(os.environ.get("SMTP_MAX_PER_CONNECTION", 100)),
+)
+
+
+def send(to: str, subject: str, body: str, headers: Optional[dict] = None) -> bool:
+    if not enabled():
+        log.info("mail disabled (SMTP_HOST unset); not sending %r to %s", subject, to)
+        return False
+    pool.send(build_message(to, subject, body, headers))
+    return True
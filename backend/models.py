@@ -38,6 +38,15 @@ class Announcement(db.Model):
     subcategory = db.Column(db.String(100))
     deal_type = db.Column(db.String(20))  # buy/sell/exchange
     district = db.Column(db.String(120))
+    # Mirrors of images_json kept by triggers (backend/summaries.py)
+    first_image = db.Column(db.Text)
+    images_count = db.Column(db.Integer, default=0, nullable=False)
+    # ln of time-weighted views, see backend/trending.py
+    trending_score = db.Column(db.Float)
+    # Near-duplicate signature, see backend/dedupe.py
+    minhash = db.Column(db.LargeBinary)
+    # Set once confirmed as a copy of that listing: hidden from public lists
+    duplicate_of = db.Column(db.Integer)
 
     category = db.relationship('Category', backref=db.backref('announcements', lazy=True))
 
@@ -56,6 +65,12 @@ class Article(db.Model):
     og_image_url = db.Column(db.Text)
     category = db.Column(db.String(120))
     views = db.Column(db.Integer, default=0, nullable=False)
+    # Approved comments; bumped by the comment create path, also the cache validator
+    comments_count = db.Column(db.Integer, default=0, nullable=False)
+    # Derived from content on write (backend/summaries.py)
+    excerpt = db.Column(db.Text)
+    reading_minutes = db.Column(db.Integer, default=1, nullable=False)
+    trending_score = db.Column(db.Float)
 
 
 class ArticleComment(db.Model):
@@ -67,6 +82,12 @@ class ArticleComment(db.Model):
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     approved = db.Column(db.Boolean, default=True, nullable=False)
+    # Thread root this comment replies to; replies are kept one level deep
+    parent_id = db.Column(db.Integer, db.ForeignKey('article_comment.id'), index=True)
+
+    __table_args__ = (
+        db.Index('ix_article_comment_thread', 'article_id', 'created_at', 'id'),
+    )
 
 
 class AuthorSubscription(db.Model):
@@ -76,6 +97,26 @@ class AuthorSubscription(db.Model):
     token = db.Column(db.String(64), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     confirmed_at = db.Column(db.DateTime)
+    unsubscribed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_author_subscription_author_id", "author_id", "id"),
+        db.Index("ix_author_subscription_author_email", "author_id", "email"),
+        db.Index("ix_author_subscription_token", "token"),
+    )
+
+
+class NotificationDispatch(db.Model):
+    """Progress of one "new article" mail-out; ``cursor`` is the last subscription id handled."""
+    id = db.Column(db.Integer, primary_key=True)
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id'), nullable=False, unique=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    cursor = db.Column(db.Integer, default=0, nullable=False)
+    sent_count = db.Column(db.Integer, default=0, nullable=False)
+    failed_count = db.Column(db.Integer, default=0, nullable=False)
+    status = db.Column(db.String(16), default="running", nullable=False)  # running/done
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime)
 
 
 class TgPost(db.Model):
@@ -86,6 +127,10 @@ class TgPost(db.Model):
     countries_json = db.Column(db.Text)  # JSON list of country names
     image_urls_json = db.Column(db.Text)  # JSON list of local static URLs
     source_link = db.Column(db.String(255))
+    views = db.Column(db.Integer, default=0, nullable=False)
+    trending_score = db.Column(db.Float)
+    minhash = db.Column(db.LargeBinary)
+    duplicate_of = db.Column(db.Integer)
 
 
 class User(db.Model, UserMixin):
@@ -98,6 +143,9 @@ class User(db.Model, UserMixin):
     username_changed_at = db.Column(db.DateTime)
     avatar_url = db.Column(db.Text)
     bio = db.Column(db.Text)
+    tg_user_id = db.Column(db.String(64), index=True)
+    # Bumped on every update; lets cached user snapshots revalidate cheaply
+    version = db.Column(db.Integer, default=0, nullable=False)
 
     def set_password(self, password: str):
         # Explicit algorithm to avoid environments without hashlib.scrypt
@@ -112,11 +160,13 @@ class TelegramVerification(db.Model):
     token = db.Column(db.String(64), unique=True, nullable=False)
     code = db.Column(db.String(6), nullable=False)
     username = db.Column(db.String(64), nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    # Unused since accounts get their password at creation; kept for the NOT NULL column
+    password_hash = db.Column(db.String(128), nullable=False, default="")
     tg_user_id = db.Column(db.String(64))
     avatar_url = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     verified_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)
 
 
 class Review(db.Model):
@@ -126,3 +176,25 @@ class Review(db.Model):
     rating = db.Column(db.Integer, nullable=False, default=5)  # 1..5
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class Job(db.Model):
+    """Deferred work item; see backend/jobs.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(80), nullable=False)
+    payload_json = db.Column(db.Text)
+    priority = db.Column(db.Integer, default=0, nullable=False)  # higher runs first
+    status = db.Column(db.String(16), default="queued", nullable=False)  # queued/running/done/failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    idempotency_key = db.Column(db.String(190), unique=True)
+    last_error = db.Column(db.Text)
+    locked_by = db.Column(db.String(64))
+    locked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_job_ready", "status", "priority", "run_at"),
+    )
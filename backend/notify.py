@@ -0,0 +1,114 @@
+"""Mail confirmed author subscribers when one of the author's articles is published.
+
+Publishing enqueues ``notify.article_published`` (idempotency key per
+article). The job walks confirmed, still-subscribed rows of
+``author_subscription`` in id order, a batch at a time with a column-only
+keyset query, so memory stays flat however many subscribers an author has.
+After every message the dispatch cursor is committed: a crashed or retried
+job resumes after the last subscriber it handled instead of starting over.
+An address the server refuses is logged, counted in ``failed_count`` and
+skipped; only connection-level errors fail (and later retry) the job.
+"""
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import select, exists
+from sqlalchemy.orm import aliased
+
+from . import jobs, mailer
+from .extensions import db
+from .models import Article, AuthorSubscription, NotificationDispatch
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", 500))
+
+
+def site_url() -> str:
+    return os.environ.get("SITE_URL", "http://localhost:5001").rstrip("/")
+
+
+def unsubscribe_url(token: str) -> str:
+    return f"{site_url()}/unsubscribe?token={token}"
+
+
+def article_published(article: Article) -> None:
+    """Queue the subscriber mail-out for a just-published article (once per article)."""
+    if article.user_id:
+        jobs.enqueue("notify.article_published", {"article_id": article.id},
+                     key=f"article-published:{article.id}")
+
+
+def _subscriber_batch(author_id: int, after_id: int, limit: int):
+    earlier = aliased(AuthorSubscription)
+    # The same address may have subscribed twice; only its first live row gets mail
+    duplicate = (exists()
+                 .where(earlier.author_id == AuthorSubscription.author_id,
+                        earlier.email == AuthorSubscription.email,
+                        earlier.id < AuthorSubscription.id,
+                        earlier.confirmed_at.isnot(None),
+                        earlier.unsubscribed_at.is_(None)))
+    stmt = (select(AuthorSubscription.id, AuthorSubscription.email, AuthorSubscription.token)
+            .where(AuthorSubscription.author_id == author_id,
+                   AuthorSubscription.id > after_id,
+                   AuthorSubscription.confirmed_at.isnot(None),
+                   AuthorSubscription.unsubscribed_at.is_(None),
+                   ~duplicate)
+            .order_by(AuthorSubscription.id)
+            .limit(limit))
+    return db.session.execute(stmt).all()
+
+
+@jobs.handler("notify.article_published")
+def job_article_published(payload):
+    article = db.session.get(Article, payload["article_id"])
+    if article is None or article.is_draft or not article.user_id:
+        return
+    if not mailer.enabled():
+        return
+    dispatch = NotificationDispatch.query.filter_by(article_id=article.id).first()
+    if dispatch is None:
+        dispatch = NotificationDispatch(article_id=article.id, author_id=article.user_id)
+        db.session.add(dispatch)
+        db.session.commit()
+    if dispatch.status == "done":
+        return
+    subject = f"Новая статья: {article.title}"
+    link = f"{site_url()}/article?id={article.id}"
+    while True:
+        batch = _subscriber_batch(dispatch.author_id, dispatch.cursor, BATCH_SIZE)
+        if not batch:
+            break
+        for sub_id, email, token in batch:
+            unsub = unsubscribe_url(token)
+            body = (f"{article.title}\n\n{link}\n\n"
+                    f"Вы получили это письмо, потому что подписались на автора.\n"
+                    f"Отписаться: {unsub}\n")
+            try:
+                mailer.send(email, subject, body, headers={
+                    "List-Unsubscribe": f"<{unsub}>",
+                    "List-Unsubscribe-Post": "List-Unsubscribe=One-Click",
+                })
+            except mailer.RECIPIENT_ERRORS as exc:
+                log.warning("article %s: mail to subscription %s refused: %s", article.id, sub_id, exc)
+                dispatch.failed_count += 1
+            else:
+                dispatch.sent_count += 1
+            dispatch.cursor = sub_id
+            db.session.commit()
+        # Drop hydrated state between batches so the session does not grow
+        db.session.expire_all()
+    dispatch.status = "done"
+    dispatch.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+@jobs.handler("notify.subscription_confirm")
+def job_subscription_confirm(payload):
+    sub = db.session.get(AuthorSubscription, payload["subscription_id"])
+    if sub is None or sub.confirmed_at:
+        return
+    confirm = f"{site_url()}/confirm-subscription?token={sub.token}"
+    mailer.send(sub.email, "Подтвердите подписку",
+                f"Чтобы получать новые статьи автора, подтвердите подписку:\n{confirm}\n")
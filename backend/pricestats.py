@@ -0,0 +1,203 @@
+"""Price statistics of published listings, precomputed as one snapshot.
+
+The ``prices.refresh`` job reads the priced listings once (columns only),
+groups them with NumPy by country, deal type, rooms (5 and more together)
+and per-month flag, and for every combination of those dimensions, each
+either fixed or left open ("*"), stores:
+
+- ``n``, ``mean`` and the price at every 5th percentile (``q``, 21 values)
+- a 12-bin histogram between the 5th and 95th percentile, with the counts
+  below and above it
+- the same percentiles of the price per square metre where ``area`` is set
+
+Groups with fewer than ``MIN_COUNT`` listings are left out. The snapshot
+is a single JSON row in ``price_stats``; it is rebuilt every
+``PRICE_STATS_INTERVAL`` seconds when ``table_version`` says listings
+changed, and skipped otherwise. Web processes keep the parsed snapshot and
+only check the row's timestamp per request, so ``/api/stats/prices`` never
+touches the listings.
+"""
+import argparse
+import bisect
+import json
+import logging
+import threading
+from datetime import datetime
+from itertools import product
+from typing import Optional
+
+from sqlalchemy import text
+
+from . import jobs, versions
+from .extensions import db
+
+try:
+    import numpy as np
+except ImportError:  # optional: no snapshot is built
+    np = None
+
+log = logging.getLogger(__name__)
+
+DIMENSIONS = ("country", "deal_type", "rooms", "is_per_month")
+ANY = "*"
+QUANTILES = list(range(0, 101, 5))
+HIST_BINS = 12
+MIN_COUNT = 3
+MAX_ROOMS = 5
+
+_cached = None  # (computed_at, snapshot)
+_lock = threading.Lock()
+
+
+def install() -> None:
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS price_stats (
+          id INTEGER PRIMARY KEY CHECK (id = 1),
+          source_version INTEGER NOT NULL,
+          computed_at TEXT NOT NULL,
+          payload TEXT NOT NULL)"""))
+    db.session.commit()
+
+
+def key(country=ANY, deal_type=ANY, rooms=ANY, is_per_month=ANY) -> str:
+    """Snapshot key of a group; ``""`` stands for listings without a value."""
+    return "|".join(str(v) for v in (country, deal_type, rooms, is_per_month))
+
+
+def rooms_value(rooms) -> str:
+    if rooms is None:
+        return ""
+    return f"{MAX_ROOMS}+" if int(rooms) >= MAX_ROOMS else str(int(rooms))
+
+
+# ---------- build ----------
+
+def _round(values) -> list:
+    return [round(float(v), 2) for v in values]
+
+
+def _summary(price, per_area) -> dict:
+    q = np.percentile(price, QUANTILES)
+    lo, hi = q[1], q[-2]
+    inner = price[(price >= lo) & (price <= hi)]
+    counts, edges = np.histogram(inner, bins=HIST_BINS, range=(lo, hi) if hi > lo else (lo, lo + 1))
+    out = {
+        "n": int(price.size),
+        "mean": round(float(price.mean()), 2),
+        "q": _round(q),
+        "hist": {"edges": _round(edges), "counts": counts.tolist(),
+                 "below": int((price < lo).sum()), "above": int((price > hi).sum())},
+    }
+    per_area = per_area[~np.isnan(per_area)]
+    if per_area.size >= MIN_COUNT:
+        out["per_area"] = {"n": int(per_area.size), "q": _round(np.percentile(per_area, QUANTILES))}
+    return out
+
+
+def build() -> dict:
+    rows = db.session.execute(text("""
+        SELECT c.name AS country, a.deal_type, a.rooms, a.is_per_month, a.price_cents, a.area
+        FROM announcement a LEFT JOIN category c ON c.id = a.category_id
+        WHERE a.draft = 0 AND a.duplicate_of IS NULL AND a.price_cents > 0""")).all()
+    if not rows:
+        return {"quantiles": QUANTILES, "groups": {}}
+    price = np.array([r.price_cents for r in rows], dtype=np.float64) / 100
+    area = np.array([r.area if r.area and r.area > 0 else np.nan for r in rows], dtype=np.float64)
+    per_area = price / area
+    # Dimension values as strings, coded to ints for grouping
+    columns = [
+        [r.country or "" for r in rows],
+        [r.deal_type or "" for r in rows],
+        [rooms_value(r.rooms) for r in rows],
+        [str(int(bool(r.is_per_month))) for r in rows],
+    ]
+    labels, codes = [], []
+    for col in columns:
+        values, inverse = np.unique(np.array(col, dtype=object), return_inverse=True)
+        labels.append(list(values))
+        codes.append(inverse.reshape(-1).astype(np.int64))
+    groups = {}
+    for fixed in product((False, True), repeat=len(DIMENSIONS)):
+        dims = [d for d, f in enumerate(fixed) if f]
+        if dims:
+            combo = np.stack([codes[d] for d in dims], axis=1)
+            uniques, inverse = np.unique(combo, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            uniques, inverse = np.zeros((1, 0), dtype=np.int64), np.zeros(len(rows), dtype=np.int64)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(uniques)))[:-1]
+        for values, idx in zip(uniques, np.split(order, bounds)):
+            if idx.size < MIN_COUNT:
+                continue
+            parts = [ANY] * len(DIMENSIONS)
+            for d, v in zip(dims, values):
+                parts[d] = labels[d][v]
+            groups[key(*parts)] = _summary(price[idx], per_area[idx])
+    return {"quantiles": QUANTILES, "groups": groups}
+
+
+@jobs.handler("prices.refresh")
+def refresh(payload=None) -> bool:
+    """Rebuild the snapshot if listings changed (or ``{"force": true}``); True when rebuilt."""
+    if np is None:
+        log.warning("numpy is not installed: price statistics are not computed")
+        return False
+    version = versions.get("announcement")
+    stored = db.session.execute(text("SELECT source_version FROM price_stats WHERE id = 1")).scalar()
+    if stored == version and not (payload or {}).get("force"):
+        return False
+    snapshot = build()
+    db.session.execute(text(
+        "INSERT OR REPLACE INTO price_stats (id, source_version, computed_at, payload) VALUES (1, :v, :t, :p)"),
+        {"v": version, "t": datetime.utcnow().isoformat(),
+         "p": json.dumps(snapshot, ensure_ascii=False, separators=(",", ":"))})
+    db.session.commit()
+    return True
+
+
+jobs.periodic("prices.refresh", "PRICE_STATS_INTERVAL")
+
+
+# ---------- serving ----------
+
+def snapshot() -> Optional[tuple]:
+    """(computed_at, snapshot) of the latest build, None before the first one."""
+    global _cached
+    computed_at = db.session.execute(text("SELECT computed_at FROM price_stats WHERE id = 1")).scalar()
+    if computed_at is None:
+        return None
+    cached = _cached
+    if cached is None or cached[0] != computed_at:
+        with _lock:
+            if _cached is None or _cached[0] != computed_at:
+                row = db.session.execute(text("SELECT computed_at, payload FROM price_stats WHERE id = 1")).one()
+                _cached = (row.computed_at, json.loads(row.payload))
+            cached = _cached
+    return cached
+
+
+def percentile_of(price: float, q: list) -> float:
+    """Share of the group (0-100) priced at or below ``price``, interpolated between stored percentiles."""
+    if price <= q[0]:
+        return 0.0
+    if price >= q[-1]:
+        return 100.0
+    i = bisect.bisect_right(q, price)
+    lo, hi = q[i - 1], q[i]
+    frac = (price - lo) / (hi - lo) if hi > lo else 1.0
+    return round(QUANTILES[i - 1] + frac * (QUANTILES[i] - QUANTILES[i - 1]), 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the price statistics snapshot")
+    parser.add_argument("--force", action="store_true", help="rebuild even if listings did not change")
+    args = parser.parse_args()
+    from . import create_app
+    app = create_app()
+    with app.app_context():
+        print("rebuilt" if refresh({"force": args.force}) else "unchanged")
+
+
+if __name__ == "__main__":
+    main()
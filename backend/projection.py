@@ -0,0 +1,84 @@
+"""``fields=`` projection for list endpoints.
+
+An endpoint declares the fields it can return, each as the columns it needs
+plus a function turning the selected row into the JSON value, and the
+fields returned by default. ``resolve`` parses ``?fields=a,b,c``
+(``fields=all`` for everything) into the field names and the columns they
+need; selecting just those (``query.with_entities(*columns)`` or
+``select(*columns)``) means unrequested columns, large bodies in
+particular, are never read or hydrated into ORM objects::
+
+    spec = {"id": Field(Article.id), "title": Field(Article.title), ...}
+    names, columns = resolve(spec, DEFAULT, request.args.get("fields"))
+    rows = q.with_entities(*columns).limit(20).all()
+    items = [serialize(spec, names, r) for r in rows]
+"""
+import json
+from typing import Callable, Optional
+
+
+class Field:
+    def __init__(self, *columns, get: Optional[Callable] = None):
+        self.columns = columns
+        # Default: the single column's value as is
+        self.get = get or (lambda row, key=columns[0].key: getattr(row, key))
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(spec: dict, default, raw: Optional[str]) -> list:
+    if not raw:
+        return list(default)
+    if raw.strip() == "all":
+        return list(spec)
+    names = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in names if f not in spec]
+    if unknown:
+        raise InvalidFields(",".join(unknown))
+    if "id" in spec and "id" not in names:
+        names.insert(0, "id")
+    return names
+
+
+def resolve(spec: dict, default, raw: Optional[str]):
+    """(field names, the distinct columns those fields need)."""
+    names = parse_fields(spec, default, raw)
+    columns = []
+    for name in names:
+        for col in spec[name].columns:
+            if not any(col is c for c in columns):
+                columns.append(col)
+    return names, columns
+
+
+def serialize(spec: dict, names: list, row) -> dict:
+    return {name: spec[name].get(row) for name in names}
+
+
+def iso(col) -> Field:
+    return Field(col, get=lambda row, key=col.key: getattr(row, key).isoformat() if getattr(row, key) else None)
+
+
+def money(col) -> Field:
+    """Integer cents as currency units."""
+    return Field(col, get=lambda row, key=col.key: round((getattr(row, key) or 0) / 100, 2))
+
+
+def flag(col) -> Field:
+    return Field(col, get=lambda row, key=col.key: bool(getattr(row, key)))
+
+
+def text_or_empty(col) -> Field:
+    return Field(col, get=lambda row, key=col.key: getattr(row, key) or "")
+
+
+def json_list(col) -> Field:
+    def get(row, key=col.key):
+        try:
+            value = json.loads(getattr(row, key) or "[]")
+        except ValueError:
+            return []
+        return value if isinstance(value, list) else []
+    return Field(col, get=get)
@@ -0,0 +1,228 @@
+"""Token-bucket rate limiting and load shedding for expensive endpoints.
+
+Views opt in by endpoint class::
+
+    @public_bp.post("/api/auth/login")
+    @ratelimit.limit("auth")
+    def api_login(): ...
+
+Each class has a policy in ``RATELIMIT_POLICIES``: a bucket per client IP,
+per logged-in user and/or one shared by the whole class ("global"), written
+as ``"<tokens>/<seconds>"`` (the bucket holds ``tokens`` and refills that
+many every ``seconds``). An empty bucket answers 429 with ``Retry-After``.
+
+Buckets live in process memory by default. ``RATELIMIT_STORAGE`` pointing at
+a SQLite file makes all workers on the host share them.
+
+Independently, the number of requests in flight in this process is capped at
+``MAX_INFLIGHT``. Classes listed in ``RATELIMIT_SHED_AT`` are refused (503)
+once in-flight requests reach that fraction of the cap, so pbkdf2-heavy auth
+calls are shed before cheap reads when the server is saturated.
+
+Sub-requests of a batch (``backend/batch.py``, marked with ``SUBREQUEST``
+in their WSGI environ) still spend tokens but run inside the outer
+request's in-flight slot.
+"""
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from flask import g, jsonify, request, current_app
+from flask_login import current_user
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``rate`` tokens per second, up to ``burst``."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self, n: float = 1) -> Tuple[bool, float]:
+        """Take ``n`` tokens if available; otherwise return the seconds until they are."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= n:
+                self._tokens -= n
+                return True, 0.0
+            return False, (n - self._tokens) / self.rate
+
+    def acquire(self, n: float = 1) -> None:
+        """Block until ``n`` tokens are available."""
+        while True:
+            ok, wait = self.try_take(n)
+            if ok:
+                return
+            time.sleep(wait)
+
+
+def parse_policy(spec: str) -> Tuple[float, float]:
+    """``"10/60"`` -> (rate per second, burst)."""
+    tokens, _, seconds = spec.partition("/")
+    tokens, seconds = float(tokens), float(seconds or 1)
+    return tokens / seconds, tokens
+
+
+class MemoryStore:
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+        return bucket.try_take()
+
+
+class SQLiteStore:
+    """Buckets in a small SQLite file shared by the workers of one host.
+
+    Kept apart from the application database so limiter writes never compete
+    with the site's single writer.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection must not cross a fork
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM bucket WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            ok = tokens >= 1
+            if ok:
+                tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if random.random() < 0.001:
+            self.purge()
+        return ok, 0.0 if ok else (1 - tokens) / rate
+
+    def purge(self, older_than: float = 3600) -> None:
+        self._conn().execute("DELETE FROM bucket WHERE updated < ?", (time.time() - older_than,))
+
+
+store = MemoryStore()
+_inflight = 0
+_inflight_lock = threading.Lock()
+stats = {"limited": 0, "shed": 0}
+SUBREQUEST = "magicworlds.subrequest"
+
+
+def limit(endpoint_class: str):
+    """Tag a view with its rate-limit class; enforcement happens in ``before_request``."""
+    def decorator(fn):
+        fn._ratelimit_class = endpoint_class
+        return fn
+    return decorator
+
+
+def client_ip() -> str:
+    if current_app.config.get("RATELIMIT_TRUST_PROXY") and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or "-"
+
+
+def _check_buckets(endpoint_class: str) -> Optional[float]:
+    policy = current_app.config.get("RATELIMIT_POLICIES", {}).get(endpoint_class) or {}
+    retry_after = 0.0
+    for scope, spec in policy.items():
+        if scope == "ip":
+            key = f"{endpoint_class}:ip:{client_ip()}"
+        elif scope == "user":
+            if not current_user.is_authenticated:
+                continue
+            key = f"{endpoint_class}:user:{current_user.id}"
+        else:
+            key = f"{endpoint_class}:global"
+        rate, burst = parse_policy(spec)
+        ok, wait = store.take(key, rate, burst)
+        if not ok:
+            retry_after = max(retry_after, wait)
+    return retry_after or None
+
+
+def _refuse(status: int, error: str, retry_after: float):
+    resp = jsonify({"ok": False, "error": error})
+    resp.status_code = status
+    resp.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return resp
+
+
+def _before_request():
+    global _inflight
+    view = current_app.view_functions.get(request.endpoint)
+    endpoint_class = getattr(view, "_ratelimit_class", None)
+    cap = current_app.config.get("MAX_INFLIGHT", 0)
+    if not request.environ.get(SUBREQUEST):
+        with _inflight_lock:
+            if cap and endpoint_class:
+                shed_at = current_app.config.get("RATELIMIT_SHED_AT", {}).get(endpoint_class, 1.0)
+                if _inflight >= cap * shed_at:
+                    stats["shed"] += 1
+                    return _refuse(503, "overloaded", 1)
+            _inflight += 1
+            g._counted_inflight = True
+    if endpoint_class and current_app.config.get("RATELIMIT_ENABLED", True):
+        retry_after = _check_buckets(endpoint_class)
+        if retry_after:
+            stats["limited"] += 1
+            return _refuse(429, "rate_limited", retry_after)
+    return None
+
+
+def _teardown_request(_exc):
+    global _inflight
+    # Sub-requests share the outer request's ``g`` and slot
+    if request.environ.get(SUBREQUEST):
+        return
+    if g.pop("_counted_inflight", False):
+        with _inflight_lock:
+            _inflight -= 1
+
+
+def inflight() -> int:
+    return _inflight
+
+
+def init_app(app):
+    global store
+    path = app.config.get("RATELIMIT_STORAGE")
+    if path:
+        store = SQLiteStore(path)
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
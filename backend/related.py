@@ -0,0 +1,370 @@
+"""Precomputed "similar items" for listings, articles and Telegram posts.
+
+Each published item is turned into a hashed term vector (words folded to
+their first ``STEM_CHARS`` letters and hashed into ``DIMENSIONS`` buckets,
+so there is no vocabulary to keep) stored in ``related_doc`` together with
+the metadata it is compared on. Neighbours are ranked by the TF-IDF cosine
+of the texts plus bonuses for the same group (category/country), the same
+subcategory and a close price, and the best ``RELATED_TOP_K`` are written
+to ``related_item``: serving ``/api/.../related`` is one indexed range
+read joined to the item table.
+
+Triggers add every inserted, edited or deleted item to ``related_dirty``.
+The ``related.refresh`` job re-vectorizes only those, recomputes their own
+lists and the lists of items they enter or leave; the rest stay as they
+are. Document frequencies move a little as the corpus grows, so
+``python -m backend.related rebuild`` recomputes everything from scratch
+(run it now and then, e.g. nightly).
+
+NumPy does the scoring; without it the job logs a warning and the
+endpoints return whatever was computed before.
+"""
+import argparse
+import json
+import logging
+import math
+import re
+import zlib
+from collections import Counter
+
+from sqlalchemy import column, table, text
+
+from . import jobs
+from .extensions import db
+
+try:
+    import numpy as np
+except ImportError:  # optional: no recomputation
+    np = None
+
+log = logging.getLogger(__name__)
+
+DIMENSIONS = 1 << 20
+STEM_CHARS = 6
+W_GROUP = 0.3
+W_SUB = 0.1
+W_PRICE = 0.2
+
+_WORD = re.compile(r"[^\W\d_]{3,}")
+_STOP = frozenset("""
+    the and for with this that from are was were have has not you your our
+    как что это для при или его она они так все уже еще где там тут быть
+    был была были есть нет над под без про через после только также очень
+""".split())
+
+ITEMS = table("related_item", column("kind"), column("item_id"), column("rank"),
+              column("other_id"), column("score"))
+
+# kind -> (source query of the published items, columns whose change makes an item dirty).
+# Confirmed near-duplicates (see dedupe.py) are left out like drafts.
+SOURCES = {
+    "announcement": (
+        "SELECT id, title, content_excerpt, subcategory, district, category_id, price_cents, is_per_month "
+        "FROM announcement WHERE NOT draft AND duplicate_of IS NULL AND id IN ({ids})",
+        ("title", "content_excerpt", "subcategory", "district", "category_id", "price_cents",
+         "is_per_month", "draft", "duplicate_of"),
+    ),
+    "article": (
+        "SELECT id, title, content, tags_json, category FROM article WHERE NOT is_draft AND id IN ({ids})",
+        ("title", "content", "tags_json", "category", "is_draft"),
+    ),
+    "tg_post": (
+        "SELECT id, text, countries_json FROM tg_post WHERE duplicate_of IS NULL AND id IN ({ids})",
+        ("text", "countries_json", "duplicate_of"),
+    ),
+}
+
+
+def install() -> None:
+    """Tables and dirty-marking triggers; a new install marks every item dirty.
+
+    The update triggers follow ``SOURCES``: when one's column list changed,
+    it is recreated and every item of its kind is marked dirty, since which
+    items are published may have changed with it.
+    """
+    fresh = not db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'related_doc'")).first()
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS related_doc (
+          kind TEXT NOT NULL, item_id INTEGER NOT NULL,
+          terms BLOB NOT NULL, weights BLOB NOT NULL, meta TEXT NOT NULL,
+          PRIMARY KEY (kind, item_id)) WITHOUT ROWID"""))
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS related_item (
+          kind TEXT NOT NULL, item_id INTEGER NOT NULL, rank INTEGER NOT NULL,
+          other_id INTEGER NOT NULL, score REAL NOT NULL,
+          PRIMARY KEY (kind, item_id, rank)) WITHOUT ROWID"""))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_related_item_other ON related_item (kind, other_id)"))
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS related_dirty (
+          kind TEXT NOT NULL, item_id INTEGER NOT NULL,
+          PRIMARY KEY (kind, item_id)) WITHOUT ROWID"""))
+    stored = dict(db.session.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")).all())
+    for kind, (_, columns) in SOURCES.items():
+        stale = False
+        for suffix, event, row in (("ai", "INSERT", "NEW"),
+                                   ("au", f"UPDATE OF {', '.join(columns)}", "NEW"),
+                                   ("ad", "DELETE", "OLD")):
+            name = f"{kind}_related_{suffix}"
+            # NOT EXISTS, not OR IGNORE: inside a trigger the outer statement's conflict
+            # policy wins, and an upsert (transfer import) would abort on a duplicate
+            sql = (f"CREATE TRIGGER {name} AFTER {event} ON {kind} BEGIN "
+                   f"INSERT INTO related_dirty (kind, item_id) SELECT '{kind}', {row}.id "
+                   f"WHERE NOT EXISTS (SELECT 1 FROM related_dirty WHERE kind = '{kind}' AND item_id = {row}.id); END")
+            if stored.get(name) != sql:
+                stale = stale or name in stored
+                db.session.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+                db.session.execute(text(sql))
+        if fresh or stale:
+            db.session.execute(text(
+                f"INSERT OR IGNORE INTO related_dirty (kind, item_id) SELECT '{kind}', id FROM {kind}"))
+    db.session.commit()
+
+
+def query(model, kind: str, item_id: int):
+    """``model`` rows related to ``item_id``, best first: one range read of the primary key."""
+    q = (model.query.join(ITEMS, ITEMS.c.other_id == model.id)
+         .filter(ITEMS.c.kind == kind, ITEMS.c.item_id == item_id))
+    if hasattr(model, "duplicate_of"):
+        # Copies confirmed since the last refresh
+        q = q.filter(model.duplicate_of.is_(None))
+    return q.order_by(ITEMS.c.rank)
+
+
+# ---------- documents ----------
+
+def tokens(*texts) -> list:
+    out = []
+    for t in texts:
+        for word in _WORD.findall((t or "").lower()):
+            if word not in _STOP:
+                out.append(word[:STEM_CHARS])
+    return out
+
+
+def vectorize(words) -> tuple:
+    """(sorted bucket ids, 1 + ln(tf)) of a token list."""
+    counts = Counter(zlib.crc32(w.encode()) & (DIMENSIONS - 1) for w in words)
+    buckets = sorted(counts)
+    return buckets, [1.0 + math.log(counts[b]) for b in buckets]
+
+
+def _json_list(raw) -> list:
+    try:
+        value = json.loads(raw) if raw else []
+    except ValueError:
+        return []
+    return value if isinstance(value, list) else []
+
+
+def _document(kind: str, row) -> tuple:
+    """(tokens, meta) of one source row."""
+    if kind == "announcement":
+        words = tokens(row.title, row.title, row.content_excerpt, row.subcategory, row.district)
+        meta = {"groups": [row.category_id] if row.category_id else [], "sub": row.subcategory or None,
+                "price": row.price_cents or 0, "monthly": bool(row.is_per_month)}
+    elif kind == "article":
+        from .summaries import plain_text
+        tags = " ".join(str(t) for t in _json_list(row.tags_json))
+        words = tokens(row.title, row.title, plain_text(row.content), tags, tags)
+        meta = {"groups": [row.category] if row.category else [], "sub": None, "price": 0, "monthly": False}
+    else:
+        words = tokens(row.text)
+        meta = {"groups": _json_list(row.countries_json), "sub": None, "price": 0, "monthly": False}
+    return words, meta
+
+
+# ---------- scoring ----------
+
+class Index:
+    """All documents of one kind as bucket-sorted postings, TF-IDF weighted and normalized."""
+
+    def __init__(self, rows):
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.pos = {int(i): n for n, i in enumerate(self.ids)}
+        terms = [np.frombuffer(r[1], dtype=np.int32) for r in rows]
+        weights = [np.frombuffer(r[2], dtype=np.float32) for r in rows]
+        metas = [json.loads(r[3]) for r in rows]
+        n = len(rows)
+        lengths = np.array([len(t) for t in terms], dtype=np.int64)
+        doc = np.repeat(np.arange(n), lengths)
+        bucket = np.concatenate(terms) if n else np.zeros(0, dtype=np.int32)
+        tf = np.concatenate(weights).astype(np.float64) if n else np.zeros(0)
+        vocab, df = np.unique(bucket, return_counts=True)
+        self.vocab = vocab
+        self.idf = np.log((1 + n) / (1 + df)) + 1.0
+        w = tf * self.idf[np.searchsorted(vocab, bucket)]
+        norm = np.sqrt(np.bincount(doc, weights=w * w, minlength=n))
+        w /= np.where(norm > 0, norm, 1.0)[doc]
+        order = np.argsort(bucket, kind="stable")
+        self.post_bucket, self.post_doc, self.post_w = bucket[order], doc[order], w[order]
+        # Per-document slices of the unsorted arrays, to rebuild query vectors
+        self._starts = np.concatenate(([0], np.cumsum(lengths)))
+        self._bucket, self._w = bucket, w
+        # Groups as bitmasks: overlap is a bitwise and
+        codes = {}
+        masks = []
+        for m in metas:
+            mask = 0
+            for g in m["groups"]:
+                mask |= 1 << (codes.setdefault(json.dumps(g), len(codes)) % 63)
+            masks.append(mask)
+        self.groups = np.array(masks, dtype=np.int64)
+        subs = {}
+        self.subs = np.array([subs.setdefault(m["sub"], len(subs)) if m["sub"] else -1 for m in metas],
+                             dtype=np.int64)
+        price = np.array([m["price"] for m in metas], dtype=np.float64)
+        self.log_price = np.where(price > 0, np.log(np.maximum(price, 1)), np.nan)
+        self.monthly = np.array([m["monthly"] for m in metas], dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, i: int):
+        """Similarity of document ``i`` to every document (itself excluded)."""
+        s, e = self._starts[i], self._starts[i + 1]
+        q_bucket, q_w = self._bucket[s:e], self._w[s:e]
+        lo = np.searchsorted(self.post_bucket, q_bucket, "left")
+        hi = np.searchsorted(self.post_bucket, q_bucket, "right")
+        counts = hi - lo
+        total = int(counts.sum())
+        out = np.zeros(len(self), dtype=np.float64)
+        if total:
+            # Concatenated posting ranges of the query's buckets
+            offsets = np.repeat(lo - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+            idx = offsets + np.arange(total)
+            out = np.bincount(self.post_doc[idx], weights=self.post_w[idx] * np.repeat(q_w, counts),
+                              minlength=len(self))
+        if self.groups[i]:
+            out += W_GROUP * ((self.groups & self.groups[i]) != 0)
+        if self.subs[i] >= 0:
+            out += W_SUB * (self.subs == self.subs[i])
+        if not np.isnan(self.log_price[i]):
+            gap = np.abs(self.log_price - self.log_price[i])
+            same_terms = self.monthly == self.monthly[i]
+            out += W_PRICE * np.where(np.isnan(gap) | ~same_terms, 0.0, np.exp(-np.nan_to_num(gap)))
+        out[i] = 0.0
+        return out
+
+    def top(self, scores, k: int) -> list:
+        """[(item id, score)] of the ``k`` best positive scores, best first."""
+        k = min(k, len(scores))
+        if not k:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(self.ids[j]), float(scores[j])) for j in best if scores[j] > 0]
+
+
+# ---------- refresh ----------
+
+def _write_list(kind: str, item_id: int, neighbours: list) -> None:
+    db.session.execute(text("DELETE FROM related_item WHERE kind = :k AND item_id = :i"),
+                       {"k": kind, "i": item_id})
+    if neighbours:
+        db.session.execute(text(
+            "INSERT INTO related_item (kind, item_id, rank, other_id, score) VALUES (:k, :i, :r, :o, :s)"),
+            [{"k": kind, "i": item_id, "r": r, "o": o, "s": s} for r, (o, s) in enumerate(neighbours)])
+
+
+def refresh_kind(kind: str, k: int, full: bool = False) -> int:
+    """Bring ``kind`` up to date; returns the number of lists rewritten."""
+    if full:
+        dirty = [r[0] for r in db.session.execute(text(
+            f"SELECT id FROM {kind} UNION SELECT item_id FROM related_doc WHERE kind = :k"), {"k": kind})]
+    else:
+        dirty = [r[0] for r in db.session.execute(text(
+            "SELECT item_id FROM related_dirty WHERE kind = :k"), {"k": kind})]
+    if not dirty:
+        return 0
+    query = SOURCES[kind][0]
+    present = set()
+    for start in range(0, len(dirty), 500):
+        chunk = dirty[start:start + 500]
+        rows = db.session.execute(text(query.format(ids=", ".join(str(int(i)) for i in chunk)))).all()
+        docs = []
+        for row in rows:
+            words, meta = _document(kind, row)
+            buckets, tf = vectorize(words)
+            docs.append({"k": kind, "i": row.id, "t": np.array(buckets, dtype=np.int32).tobytes(),
+                         "w": np.array(tf, dtype=np.float32).tobytes(), "m": json.dumps(meta)})
+            present.add(row.id)
+        if docs:
+            db.session.execute(text(
+                "INSERT OR REPLACE INTO related_doc (kind, item_id, terms, weights, meta) "
+                "VALUES (:k, :i, :t, :w, :m)"), docs)
+    removed = [i for i in dirty if i not in present]
+    for i in removed:
+        db.session.execute(text("DELETE FROM related_doc WHERE kind = :k AND item_id = :i"), {"k": kind, "i": i})
+        db.session.execute(text("DELETE FROM related_item WHERE kind = :k AND item_id = :i"), {"k": kind, "i": i})
+
+    index = Index(db.session.execute(text(
+        "SELECT item_id, terms, weights, meta FROM related_doc WHERE kind = :k ORDER BY item_id"),
+        {"k": kind}).all())
+    recompute = set(present)
+    floor = None
+    if not full:
+        # Lists that contain a changed or removed item may lose it or reorder
+        changed = list(present) + removed
+        for start in range(0, len(changed), 500):
+            chunk = ", ".join(str(int(i)) for i in changed[start:start + 500])
+            recompute.update(r[0] for r in db.session.execute(text(
+                f"SELECT DISTINCT item_id FROM related_item WHERE kind = :k AND other_id IN ({chunk})"),
+                {"k": kind}))
+        # Lists a changed item now enters: scores are symmetric, so compare with their k-th best
+        floor = np.zeros(len(index))
+        for item_id, count, worst in db.session.execute(text(
+                "SELECT item_id, COUNT(*), MIN(score) FROM related_item WHERE kind = :k GROUP BY item_id"),
+                {"k": kind}):
+            if item_id in index.pos and count >= k:
+                floor[index.pos[item_id]] = worst
+    entering = set()
+    written = 0
+    for item_id in sorted(recompute):
+        i = index.pos.get(item_id)
+        if i is None:
+            continue
+        scores = index.scores(i)
+        if floor is not None and item_id in present:
+            entering.update(int(index.ids[j]) for j in np.nonzero(scores > floor)[0])
+        _write_list(kind, item_id, index.top(scores, k))
+        written += 1
+    for item_id in sorted(entering - recompute):
+        _write_list(kind, item_id, index.top(index.scores(index.pos[item_id]), k))
+        written += 1
+    for start in range(0, len(dirty), 500):
+        chunk = ", ".join(str(int(i)) for i in dirty[start:start + 500])
+        db.session.execute(text(f"DELETE FROM related_dirty WHERE kind = :k AND item_id IN ({chunk})"),
+                           {"k": kind})
+    db.session.commit()
+    return written
+
+
+@jobs.handler("related.refresh")
+def refresh(payload=None) -> int:
+    from flask import current_app
+    if np is None:
+        log.warning("numpy is not installed: related items are not recomputed")
+        return 0
+    full = bool((payload or {}).get("full"))
+    k = current_app.config.get("RELATED_TOP_K", 10)
+    return sum(refresh_kind(kind, k, full) for kind in SOURCES)
+
+
+jobs.periodic("related.refresh", "RELATED_REFRESH_INTERVAL")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute related items")
+    parser.add_argument("command", choices=["refresh", "rebuild"],
+                        help="refresh: changed items only; rebuild: everything")
+    args = parser.parse_args()
+    from . import create_app
+    app = create_app()
+    with app.app_context():
+        print(refresh({"full": args.command == "rebuild"}))
+
+
+if __name__ == "__main__":
+    main()
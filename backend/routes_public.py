@@ -1,12 +1,14 @@
 import os
-from flask import Blueprint, jsonify, request, send_from_directory, abort, redirect, Response
+from flask import Blueprint, jsonify, request, send_from_directory, abort, redirect, Response, current_app, stream_with_context, url_for
 import secrets
 import json
+import base64
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash
 from flask_login import login_user, logout_user, current_user
 from .extensions import db
-from .models import Announcement, User, TelegramVerification, Article, Review
+from .models import Announcement, User, TelegramVerification, Article, Review, Job
+from . import jobs, notify, ratelimit, projection, jsonio, events, trending, related, dedupe, pricestats
+from .projection import Field
 
 public_bp = Blueprint("public", __name__)
 
@@ -31,10 +33,35 @@ def serve_category_html():
     return send_from_directory(PROJECT_ROOT, "category.html")
 
 
+def _landing(country: str):
+    from . import landing
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    canonical = request.base_url + (f"?page={page}" if page > 1 else "")
+    html, etag = landing.render(country, page, canonical)
+    resp = Response(html, mimetype="text/html")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "public, no-cache"
+    return resp.make_conditional(request)
+
+
 @public_bp.get("/country-<slug>.html")
 def serve_country_slug(slug):
-    filename = f"country-{slug}.html"
-    return send_from_directory(PROJECT_ROOT, filename)
+    from .landing import COUNTRIES
+    if slug not in COUNTRIES:
+        abort(404)
+    return _landing(COUNTRIES[slug])
+
+
+@public_bp.get("/category/<slug>")
+def serve_category_slug(slug):
+    from .landing import country_for_category
+    name = country_for_category(slug)
+    if name is None:
+        abort(404)
+    return _landing(name)
 
 
 @public_bp.get("/announcement.html")
@@ -64,7 +91,12 @@ def serve_assets(filename):
 def serve_uploads(filename):
     if not os.path.commonpath([UPLOAD_DIR, os.path.abspath(os.path.join(UPLOAD_DIR, filename))]).startswith(UPLOAD_DIR):
         abort(404)
-    return send_from_directory(UPLOAD_DIR, filename)
+    # Avatars and user uploads get unique names and are never rewritten
+    immutable = filename.startswith("avatars/") or "/" not in filename
+    resp = send_from_directory(UPLOAD_DIR, filename, max_age=31536000 if immutable else 86400)
+    if immutable:
+        resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
 
 
 @public_bp.get("/robots.txt")
@@ -78,18 +110,24 @@ Sitemap: {host}/image-sitemap.xml
     return Response(content, mimetype="text/plain")
 
 
+SITEMAP_LIMIT = 5000
+# Rows fetched per round trip by streamed responses
+STREAM_BATCH = 200
+
+
 @public_bp.get("/sitemap.xml")
 def sitemap_xml():
     host = request.host_url.rstrip('/')
-    items = Announcement.query.order_by(Announcement.created_at.desc()).limit(5000).all()
-    urlset = [
-        f"<url><loc>{host}/preview?id={a.id}</loc><lastmod>{a.created_at.date().isoformat()}</lastmod><changefreq>weekly</changefreq><priority>0.6</priority></url>"
-        for a in items
-    ]
-    xml = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>" \
-          "<urlset xmlns=\"http://www.sitemaps.org/schemas/sitemap/0.9\">" \
-          + ''.join(urlset) + "</urlset>"
-    return Response(xml, mimetype="application/xml")
+    items = (Announcement.query.with_entities(Announcement.id, Announcement.created_at)
+             .order_by(Announcement.created_at.desc()).limit(SITEMAP_LIMIT).yield_per(STREAM_BATCH * 5))
+
+    def body():
+        yield "<?xml version=\"1.0\" encoding=\"UTF-8\"?>" \
+              "<urlset xmlns=\"http://www.sitemaps.org/schemas/sitemap/0.9\">"
+        for a in items:
+            yield f"<url><loc>{host}/preview?id={a.id}</loc><lastmod>{a.created_at.date().isoformat()}</lastmod><changefreq>weekly</changefreq><priority>0.6</priority></url>"
+        yield "</urlset>"
+    return Response(stream_with_context(body()), mimetype="application/xml")
 
 
 @public_bp.get("/image-sitemap.xml")
@@ -97,17 +135,20 @@ def image_sitemap_xml():
     host = request.host_url.rstrip('/')
     ns = "http://www.sitemaps.org/schemas/sitemap/0.9"
     ns_img = "http://www.google.com/schemas/sitemap-image/1.1"
-    items = Announcement.query.order_by(Announcement.created_at.desc()).limit(5000).all()
-    urls = []
-    for a in items:
-        try:
-            images = json.loads(a.images_json) if a.images_json else []
-        except Exception:
-            images = []
-        img_tags = ''.join([f"<image:image><image:loc>{host}{u}</image:loc></image:image>" for u in images if isinstance(u, str)])
-        urls.append(f"<url><loc>{host}/preview?id={a.id}</loc>{img_tags}</url>")
-    xml = f"<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<urlset xmlns=\"{ns}\" xmlns:image=\"{ns_img}\">" + ''.join(urls) + "</urlset>"
-    return Response(xml, mimetype="application/xml")
+    items = (Announcement.query.with_entities(Announcement.id, Announcement.images_json)
+             .order_by(Announcement.created_at.desc()).limit(SITEMAP_LIMIT).yield_per(STREAM_BATCH * 5))
+
+    def body():
+        yield f"<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<urlset xmlns=\"{ns}\" xmlns:image=\"{ns_img}\">"
+        for a in items:
+            try:
+                images = json.loads(a.images_json) if a.images_json else []
+            except Exception:
+                images = []
+            img_tags = ''.join([f"<image:image><image:loc>{host}{u}</image:loc></image:image>" for u in images if isinstance(u, str)])
+            yield f"<url><loc>{host}/preview?id={a.id}</loc>{img_tags}</url>"
+        yield "</urlset>"
+    return Response(stream_with_context(body()), mimetype="application/xml")
 
 
 @public_bp.get("/login")
@@ -164,26 +205,69 @@ def _require_admin():
     return None
 
 
+ANNOUNCEMENT_FIELDS = {
+    "id": Field(Announcement.id),
+    "title": Field(Announcement.title),
+    "excerpt": projection.text_or_empty(Announcement.content_excerpt),
+    "views": Field(Announcement.views, get=lambda r: r.views or 0),
+    "created_at": projection.iso(Announcement.created_at),
+    "draft": projection.flag(Announcement.draft),
+    "user_id": Field(Announcement.user_id),
+    "category_id": Field(Announcement.category_id),
+    "tg_post_url": Field(Announcement.tg_post_url),
+    "price": projection.money(Announcement.price_cents),
+    "is_per_month": projection.flag(Announcement.is_per_month),
+    "address": projection.text_or_empty(Announcement.address),
+    "first_image": Field(Announcement.first_image),
+    "image_url": Field(Announcement.first_image),
+    "images_count": Field(Announcement.images_count, get=lambda r: r.images_count or 0),
+    "images": projection.json_list(Announcement.images_json),
+    "area": Field(Announcement.area, get=lambda r: float(r.area) if r.area is not None else None),
+    "rooms": Field(Announcement.rooms, get=lambda r: int(r.rooms) if r.rooms is not None else None),
+    "floor": Field(Announcement.floor),
+    "district": Field(Announcement.district),
+    "deal_type": Field(Announcement.deal_type),
+    "subcategory": Field(Announcement.subcategory),
+    "lat": Field(Announcement.location_lat),
+    "lng": Field(Announcement.location_lng),
+}
+ARTICLE_FIELDS = {
+    "id": Field(Article.id),
+    "title": Field(Article.title),
+    "content": Field(Article.content),
+    "excerpt": projection.text_or_empty(Article.excerpt),
+    "reading_minutes": Field(Article.reading_minutes),
+    "created_at": projection.iso(Article.created_at),
+    "draft": projection.flag(Article.is_draft),
+    "user_id": Field(Article.user_id),
+    "cover_url": projection.text_or_empty(Article.cover_url),
+    "views": Field(Article.views, get=lambda r: r.views or 0),
+    "comments_count": Field(Article.comments_count),
+    "category": Field(Article.category),
+    "tags": projection.json_list(Article.tags_json),
+}
+
+
+def _fields(spec, default):
+    """(names, columns) for ?fields=; raises projection.InvalidFields."""
+    return projection.resolve(spec, default, request.args.get("fields"))
+
+
+def _invalid_fields(e):
+    return jsonify({"ok": False, "error": "invalid_fields", "fields": str(e)}), 400
+
+
+def _invalid_sort():
+    return jsonify({"ok": False, "error": "invalid_sort", "sorts": list(trending.SORTS)}), 400
+
+
 @public_bp.get("/api/admin/summary")
 def api_admin_summary():
+    """Dashboard totals; pass the previous response's ``rev`` as ``since`` for deltas."""
+    from . import dashboard
     maybe = _require_admin()
     if maybe: return maybe
-    users_count = User.query.count()
-    anns_total = Announcement.query.count()
-    anns_drafts = Announcement.query.filter_by(draft=True).count()
-    anns_published = anns_total - anns_drafts
-    latest = Announcement.query.order_by(Announcement.created_at.desc()).limit(5).all()
-    return jsonify({
-        "ok": True,
-        "users": users_count,
-        "announcements": anns_total,
-        "published": anns_published,
-        "drafts": anns_drafts,
-        "latest": [
-            {"id": a.id, "title": a.title, "created_at": a.created_at.isoformat(), "draft": bool(a.draft)}
-            for a in latest
-        ]
-    })
+    return jsonify({"ok": True, **dashboard.summary(request.args.get("since"))})
 
 
 @public_bp.get("/api/articles")
@@ -192,7 +276,15 @@ def api_public_articles_list():
         limit = min(max(int(request.args.get('limit', 5)), 1), 50)
     except Exception:
         limit = 5
-    q = Article.query.filter_by(is_draft=False).order_by(Article.created_at.desc())
+    try:
+        names, columns = _fields(ARTICLE_FIELDS, ("id", "title", "cover_url", "created_at"))
+    except projection.InvalidFields as e:
+        return _invalid_fields(e)
+    try:
+        order = trending.order_by(Article, request.args.get('sort') or 'recent')
+    except ValueError:
+        return _invalid_sort()
+    q = Article.query.filter_by(is_draft=False).order_by(*order)
     author = (request.args.get('author') or '').strip()
     if author:
         u = User.query.filter(User.username.ilike(author)).first()
@@ -200,35 +292,114 @@ def api_public_articles_list():
             q = q.filter(Article.user_id == u.id)
         else:
             return jsonify({"ok": True, "items": []})
-    items = q.limit(limit).all()
+    rows = q.with_entities(*columns).limit(limit).all()
     return jsonify({
         "ok": True,
-        "items": [
-            {"id": a.id, "title": a.title, "cover_url": a.cover_url or "", "created_at": a.created_at.isoformat()}
-            for a in items
-        ]
+        "items": [projection.serialize(ARTICLE_FIELDS, names, r) for r in rows]
     })
 
 
+COMMENTS_PAGE_SIZE = 50
+COMMENT_REPLIES_PREVIEW = 3
+
+
+def _comment_cursor(c) -> str:
+    raw = f"{c.created_at.isoformat()}|{c.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _parse_comment_cursor(token: str):
+    raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+    created_at, _, cid = raw.partition("|")
+    return datetime.fromisoformat(created_at), int(cid)
+
+
+def _comment_json(c) -> dict:
+    return {"id": c.id, "author_name": c.author_name, "content": c.content,
+            "created_at": c.created_at.isoformat(), "parent_id": c.parent_id}
+
+
+def _comment_page(aid: int, limit: int, after=None, parent_id=None, threaded: bool = False):
+    """(approved comments of one page, cursor of the next page or None)."""
+    from sqlalchemy import func, select, and_, or_
+    from .models import ArticleComment
+    q = ArticleComment.query.filter(ArticleComment.article_id == aid, ArticleComment.approved.is_(True))
+    if parent_id is not None:
+        q = q.filter(ArticleComment.parent_id == parent_id)
+    elif threaded:
+        q = q.filter(ArticleComment.parent_id.is_(None))
+    if after:
+        q = q.filter(or_(ArticleComment.created_at > after[0],
+                         and_(ArticleComment.created_at == after[0], ArticleComment.id > after[1])))
+    rows = q.order_by(ArticleComment.created_at.asc(), ArticleComment.id.asc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [_comment_json(c) for c in rows]
+    if threaded and parent_id is None and rows:
+        # First replies of every root on the page, plus reply counts, in one query
+        rn = func.row_number().over(partition_by=ArticleComment.parent_id,
+                                    order_by=(ArticleComment.created_at, ArticleComment.id)).label("rn")
+        n = func.count().over(partition_by=ArticleComment.parent_id).label("n")
+        sub = (select(ArticleComment.id, ArticleComment.parent_id, ArticleComment.author_name,
+                      ArticleComment.content, ArticleComment.created_at, rn, n)
+               .where(ArticleComment.parent_id.in_([c.id for c in rows]), ArticleComment.approved.is_(True))
+               .subquery())
+        replies = db.session.execute(select(sub).where(sub.c.rn <= COMMENT_REPLIES_PREVIEW)
+                                     .order_by(sub.c.parent_id, sub.c.rn)).all()
+        by_root = {}
+        for r in replies:
+            entry = by_root.setdefault(r.parent_id, {"count": r.n, "items": []})
+            entry["items"].append(_comment_json(r))
+        for item in items:
+            entry = by_root.get(item["id"], {"count": 0, "items": []})
+            item["reply_count"] = entry["count"]
+            item["replies"] = entry["items"]
+    return items, (_comment_cursor(rows[-1]) if has_more else None)
+
+
 @public_bp.get("/api/articles/<int:aid>/comments")
 def api_public_article_comments(aid: int):
+    """Approved comments oldest first, a page at a time.
+
+    ``cursor`` continues from ``next_cursor``; ``thread=1`` pages through
+    root comments with a preview of their replies; ``parent_id`` pages
+    through the replies of one root. Responses carry an ETag derived from
+    ``Article.comments_count`` so clients revalidate without a comment query.
+    """
     a = Article.query.get_or_404(aid)
     if a.is_draft and not (current_user.is_authenticated and getattr(current_user, 'is_admin', False)):
         # In drafts, do not expose comments publicly
-        return jsonify({"ok": True, "items": []})
-    from .models import ArticleComment
-    rows = (ArticleComment.query
-            .filter_by(article_id=aid, approved=True)
-            .order_by(ArticleComment.created_at.asc()).all())
-    return jsonify({
+        return jsonify({"ok": True, "items": [], "total": 0, "next_cursor": None})
+    etag = f"c{aid}-{a.comments_count}"
+    # Weak match: compressed responses carry the weak form of the tag
+    if not a.is_draft and request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+    try:
+        limit = min(max(int(request.args.get('limit', COMMENTS_PAGE_SIZE)), 1), 100)
+        cursor = request.args.get('cursor')
+        after = _parse_comment_cursor(cursor) if cursor else None
+        parent_id = int(request.args['parent_id']) if request.args.get('parent_id') else None
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"ok": False, "error": "invalid_cursor"}), 400
+    items, next_cursor = _comment_page(aid, limit, after, parent_id, request.args.get('thread') == '1')
+    resp = jsonify({
         "ok": True,
-        "items": [
-            {"id": c.id, "author_name": c.author_name, "content": c.content, "created_at": c.created_at.isoformat()} for c in rows
-        ]
+        "items": items,
+        "total": a.comments_count,
+        "next_cursor": next_cursor,
     })
+    if a.is_draft:
+        resp.headers["Cache-Control"] = "no-store"
+    else:
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "public, no-cache"
+    return resp
 
 
 @public_bp.post("/api/articles/<int:aid>/comments")
+@ratelimit.limit("write")
 def api_public_article_comment_create(aid: int):
     a = Article.query.get_or_404(aid)
     if a.is_draft and not (current_user.is_authenticated and getattr(current_user, 'is_admin', False)):
@@ -239,24 +410,39 @@ def api_public_article_comment_create(aid: int):
     content = (data.get('content') or '').strip()
     if not content:
         return jsonify({"ok": False, "error": "empty"}), 400
+    from sqlalchemy import update
     from .models import ArticleComment
-    c = ArticleComment(article_id=aid, user_id=(current_user.id if current_user.is_authenticated else None), author_name=name, author_email=email, content=content, approved=True)
+    parent_id = None
+    if data.get('parent_id'):
+        try:
+            parent = db.session.get(ArticleComment, int(data['parent_id']))
+        except (TypeError, ValueError):
+            parent = None
+        if parent is None or parent.article_id != aid or not parent.approved:
+            return jsonify({"ok": False, "error": "invalid_parent"}), 400
+        # Replies to replies join the root's thread
+        parent_id = parent.parent_id or parent.id
+    c = ArticleComment(article_id=aid, user_id=(current_user.id if current_user.is_authenticated else None), author_name=name, author_email=email, content=content, approved=True, parent_id=parent_id)
     db.session.add(c)
+    # Counter doubles as the comments ETag, so this is what invalidates cached pages
+    db.session.execute(update(Article).where(Article.id == aid).values(comments_count=Article.comments_count + 1))
     db.session.commit()
-    return jsonify({"ok": True, "id": c.id})
+    trending.record("article", aid, "comment")
+    return jsonify({"ok": True, "id": c.id, "parent_id": parent_id})
 
 
 @public_bp.post("/api/articles/<int:aid>/view")
+@ratelimit.limit("view")
 def api_public_article_view(aid: int):
     a = Article.query.get_or_404(aid)
     if a.is_draft and not (current_user.is_authenticated and getattr(current_user, 'is_admin', False)):
         return jsonify({"ok": False}), 200
-    a.views = (a.views or 0) + 1
-    db.session.commit()
-    return jsonify({"ok": True, "views": int(a.views or 0)})
+    views = (a.views or 0) + trending.record("article", aid)
+    return jsonify({"ok": True, "views": views})
 
 
 @public_bp.post("/api/subscribe/author")
+@ratelimit.limit("write")
 def api_subscribe_author():
     data = request.get_json(silent=True) or {}
     email = (data.get('email') or '').strip().lower()
@@ -264,13 +450,19 @@ def api_subscribe_author():
     if not email or not author_id:
         return jsonify({"ok": False, "error": "missing"}), 400
     from .models import AuthorSubscription
-    import secrets
-    token = secrets.token_urlsafe(24)
-    sub = AuthorSubscription(author_id=int(author_id), email=email, token=token)
-    db.session.add(sub)
+    sub = (AuthorSubscription.query
+           .filter_by(author_id=int(author_id), email=email, unsubscribed_at=None)
+           .first())
+    if not sub:
+        sub = AuthorSubscription(author_id=int(author_id), email=email, token=secrets.token_urlsafe(24))
+        db.session.add(sub)
+        db.session.flush()
+    if not sub.confirmed_at:
+        jobs.enqueue("notify.subscription_confirm", {"subscription_id": sub.id},
+                     key=f"subscription-confirm:{sub.id}")
     db.session.commit()
-    confirm_url = f"{request.host_url.rstrip('/')}/confirm-subscription?token={token}"
-    # Email sending can be integrated here; for now, return confirm_url for client display
+    confirm_url = f"{request.host_url.rstrip('/')}/confirm-subscription?token={sub.token}"
+    # The confirmation mail goes out from the job queue; confirm_url is also returned for client display
     return jsonify({"ok": True, "confirm_url": confirm_url})
 
 
@@ -287,64 +479,72 @@ def api_confirm_subscription():
     return Response("Подписка подтверждена. Спасибо!", mimetype='text/plain')
 
 
-@public_bp.get("/api/admin/announcements")
-def api_admin_ann_list():
-    maybe = _require_admin()
-    if maybe: return maybe
-    try:
-        page = max(int(request.args.get("page", 1)), 1)
-        per = min(max(int(request.args.get("per", 20)), 1), 100)
-    except Exception:
-        page, per = 1, 20
-    q = Announcement.query.order_by(Announcement.created_at.desc())
-    draft = request.args.get("draft")
+@public_bp.route("/unsubscribe", methods=["GET", "POST"])
+def api_unsubscribe():
+    # GET (the mail link) only asks: mail scanners and prefetchers open links.
+    # POST comes from that page's button or a List-Unsubscribe one-click client.
+    from flask import render_template
+    from .models import AuthorSubscription
+    token = request.args.get('token') or ''
+    sub = AuthorSubscription.query.filter_by(token=token).first()
+    if not sub:
+        return Response("Invalid token", status=400)
+    if request.method == "POST" and not sub.unsubscribed_at:
+        sub.unsubscribed_at = datetime.utcnow()
+        db.session.commit()
+    resp = Response(render_template("unsubscribe.html", token=token, email=sub.email,
+                                    done=sub.unsubscribed_at is not None), mimetype="text/html")
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+def _filter_admin_announcements(q, args):
+    draft = args.get("draft")
     if draft in ("0","1"):
         q = q.filter_by(draft=(draft=="1"))
     # Filters: q (search), category_id, author (username ilike)
-    qstr = (request.args.get('q') or '').strip()
+    qstr = (args.get('q') or '').strip()
     if qstr:
         like = f"%{qstr}%"
         q = q.filter((Announcement.title.ilike(like)) | (Announcement.content_excerpt.ilike(like)))
-    cat = request.args.get('category_id')
+    cat = args.get('category_id')
     try:
         if cat is not None and cat != '':
             q = q.filter(Announcement.category_id == int(cat))
     except Exception:
         pass
-    author = (request.args.get('author') or '').strip()
+    author = (args.get('author') or '').strip()
     if author:
-        from .models import User
         match_ids = [u.id for u in User.query.filter(User.username.ilike(f"%{author}%")).all()]
         if match_ids:
             q = q.filter(Announcement.user_id.in_(match_ids))
         else:
             q = q.filter(False)
+    return q
+
+
+@public_bp.get("/api/admin/announcements")
+def api_admin_ann_list():
+    maybe = _require_admin()
+    if maybe: return maybe
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+        per = min(max(int(request.args.get("per", 20)), 1), 100)
+    except Exception:
+        page, per = 1, 20
+    try:
+        names, columns = _fields(ANNOUNCEMENT_FIELDS, (
+            "id", "title", "created_at", "draft", "user_id", "category_id", "views", "price", "address",
+            "first_image", "images_count", "is_per_month", "area", "rooms"))
+    except projection.InvalidFields as e:
+        return _invalid_fields(e)
+    q = _filter_admin_announcements(Announcement.query, request.args)
     total = q.count()
-    items = q.offset((page-1)*per).limit(per).all()
-    return jsonify({
-        "ok": True,
-        "total": total,
-        "page": page,
-        "per": per,
-        "items": [
-            {
-                "id": a.id,
-                "title": a.title,
-                "created_at": a.created_at.isoformat(),
-                "draft": bool(a.draft),
-                "user_id": a.user_id,
-                "category_id": a.category_id,
-                "views": a.views or 0,
-                "price": round((a.price_cents or 0)/100, 2),
-                "address": a.address or "",
-                "first_image": (lambda imgs: (imgs[0] if imgs else None))((__import__('json').loads(a.images_json) if a.images_json else [])),
-                "images_count": (lambda imgs: len(imgs))((__import__('json').loads(a.images_json) if a.images_json else [])),
-                "is_per_month": bool(getattr(a, 'is_per_month', False)),
-                "area": float(a.area) if a.area is not None else None,
-                "rooms": int(a.rooms) if a.rooms is not None else None,
-            } for a in items
-        ]
-    })
+    rows = (q.with_entities(*columns).order_by(Announcement.created_at.desc())
+             .offset((page-1)*per).limit(per).yield_per(STREAM_BATCH))
+    return jsonio.response(jsonio.stream_object(
+        {"ok": True, "total": total, "page": page, "per": per}, "items",
+        (projection.serialize(ANNOUNCEMENT_FIELDS, names, r) for r in rows)))
 
 
 @public_bp.get("/api/admin/categories")
@@ -359,41 +559,47 @@ def api_admin_categories():
     })
 
 
-@public_bp.get("/api/admin/articles")
-def api_admin_articles():
-    maybe = _require_admin()
-    if maybe: return maybe
-    try:
-        page = max(int(request.args.get('page', 1)), 1)
-        per = min(max(int(request.args.get('per', 20)), 1), 100)
-    except Exception:
-        page, per = 1, 20
-    q = Article.query.order_by(Article.created_at.desc())
-    draft = request.args.get('draft')
+def _filter_admin_articles(q, args):
+    draft = args.get('draft')
     if draft in ('0','1'):
         q = q.filter(Article.is_draft == (draft=='1'))
-    term = (request.args.get('q') or '').strip()
+    term = (args.get('q') or '').strip()
     if term:
         like = f"%{term}%"
         q = q.filter((Article.title.ilike(like)) | (Article.content.ilike(like)))
-    author = (request.args.get('author') or '').strip()
+    author = (args.get('author') or '').strip()
     if author:
         match_ids = [u.id for u in User.query.filter(User.username.ilike(f"%{author}%")).all()]
         if match_ids:
             q = q.filter(Article.user_id.in_(match_ids))
         else:
             q = q.filter(False)
+    return q
+
+
+@public_bp.get("/api/admin/articles")
+def api_admin_articles():
+    maybe = _require_admin()
+    if maybe: return maybe
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per = min(max(int(request.args.get('per', 20)), 1), 100)
+    except Exception:
+        page, per = 1, 20
+    try:
+        names, columns = _fields(ARTICLE_FIELDS, ("id", "title", "created_at", "draft", "user_id"))
+    except projection.InvalidFields as e:
+        return _invalid_fields(e)
+    q = _filter_admin_articles(Article.query, request.args)
     total = q.count()
-    items = q.offset((page-1)*per).limit(per).all()
+    rows = (q.with_entities(*columns).order_by(Article.created_at.desc())
+             .offset((page-1)*per).limit(per).all())
     return jsonify({
         "ok": True,
         "total": total,
         "page": page,
         "per": per,
-        "items": [
-            {"id": a.id, "title": a.title, "created_at": a.created_at.isoformat(), "draft": bool(a.is_draft), "user_id": a.user_id}
-            for a in items
-        ]
+        "items": [projection.serialize(ARTICLE_FIELDS, names, r) for r in rows]
     })
 
 
@@ -433,6 +639,9 @@ def api_admin_articles_create():
         category=category,
     )
     db.session.add(a)
+    db.session.flush()
+    if not a.is_draft:
+        notify.article_published(a)
     db.session.commit()
     return jsonify({"ok": True, "id": a.id})
 
@@ -483,7 +692,9 @@ def api_admin_article_update(aid: int):
         a.title = t
     if content is not None:
         a.content = content
+    published = False
     if is_draft is not None:
+        published = bool(a.is_draft) and not is_draft
         a.is_draft = bool(is_draft)
     if cover_url is not None:
         a.cover_url = (cover_url or '').strip() or None
@@ -503,18 +714,28 @@ def api_admin_article_update(aid: int):
         else:
             tags_list = None
         a.tags_json = json.dumps(tags_list) if tags_list else None
+    if published:
+        # Queued in the same transaction as the edit, with every field applied
+        notify.article_published(a)
     db.session.commit()
     return jsonify({"ok": True})
 
 
+def _filter_admin_users(q, args):
+    term = (args.get('q') or '').strip()
+    if term:
+        q = q.filter(User.username.ilike(f"%{term}%"))
+    banned = args.get('banned')
+    if banned in ('0','1'):
+        q = q.filter(User.is_banned.is_(True) if banned == '1' else User.is_banned.isnot(True))
+    return q
+
+
 @public_bp.get("/api/admin/users")
 def api_admin_users():
     maybe = _require_admin()
     if maybe: return maybe
-    q = User.query
-    term = (request.args.get('q') or '').strip()
-    if term:
-        q = q.filter(User.username.ilike(f"%{term}%"))
+    q = _filter_admin_users(User.query, request.args)
     try:
         page = max(int(request.args.get('page', 1)), 1)
         per = min(max(int(request.args.get('per', 20)), 1), 100)
@@ -575,6 +796,104 @@ def api_admin_user_balance(uid: int):
     return jsonify({"ok": True, "balance": round((u.balance_cents or 0)/100, 2)})
 
 
+_BULK_FILTERS = {
+    "users": (User, _filter_admin_users),
+    "announcements": (Announcement, _filter_admin_announcements),
+    "articles": (Article, _filter_admin_articles),
+}
+
+
+@public_bp.post("/api/admin/bulk/<target>")
+def api_admin_bulk(target: str):
+    """Apply one action to many rows in a single transaction.
+
+    Body: {"action": ..., "ids": [...]} or {"action": ..., "filter": {...}}
+    (the same filters as the matching admin list), plus "dry_run",
+    "amount" (balance), "category_id"/"category" (set_category). A filter
+    that narrows nothing is refused unless the body also says "all": true.
+    Admins are never applied to themselves by a ban.
+    """
+    from . import bulk, user_cache
+    maybe = _require_admin()
+    if maybe: return maybe
+    if target not in _BULK_FILTERS:
+        return jsonify({"ok": False, "error": "invalid_target"}), 404
+    data = request.get_json(silent=True) or {}
+    action = (data.get('action') or '').strip()
+    if isinstance(data.get('ids'), list):
+        try:
+            ids = [int(i) for i in data['ids']]
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "error": "invalid_ids"}), 400
+        per_id = True
+    elif isinstance(data.get('filter'), dict):
+        model, apply_filter = _BULK_FILTERS[target]
+        flt = {k: str(v) for k, v in data['filter'].items() if v is not None}
+        query = apply_filter(model.query, flt)
+        # Empty, unknown or blank filters leave the query as is and would hit every row
+        if str(query.statement) == str(model.query.statement) and data.get('all') is not True:
+            return jsonify({"ok": False, "error": "empty_filter"}), 400
+        ids = [r[0] for r in query.with_entities(model.id).all()]
+        per_id = False
+    else:
+        return jsonify({"ok": False, "error": "missing_ids"}), 400
+    dry_run = bool(data.get('dry_run'))
+    try:
+        res = bulk.run(target, action, ids, data, dry_run=dry_run, actor_id=current_user.id)
+    except bulk.BulkError as e:
+        db.session.rollback()
+        return jsonify({"ok": False, "error": str(e)}), 400
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+        if target == "users":
+            for uid in res["changed_ids"]:
+                user_cache.cache.invalidate(uid)
+    out = {"ok": True, "dry_run": dry_run, "matched": res["matched"], "changed": res["changed"],
+           "not_found": res["not_found"], "skipped": res["skipped"]}
+    if per_id:
+        out["results"] = res["results"]
+        if "balances" in res:
+            out["balances"] = res["balances"]
+    return jsonify(out)
+
+
+@public_bp.get("/api/admin/export")
+def api_admin_export_index():
+    from sqlalchemy import func
+    from . import transfer
+    maybe = _require_admin()
+    if maybe: return maybe
+    items = []
+    for name, model in transfer.MODELS.items():
+        count, max_id = db.session.query(func.count(model.id), func.max(model.id)).one()
+        items.append({"table": name, "rows": count, "max_id": max_id or 0,
+                      "url": url_for("public.api_admin_export", table=name)})
+    return jsonify({"ok": True, "items": items})
+
+
+@public_bp.get("/api/admin/export/<table>")
+def api_admin_export(table: str):
+    """Stream one table as NDJSON (gzip=1 to compress, after=<id> to resume)."""
+    from . import transfer
+    maybe = _require_admin()
+    if maybe: return maybe
+    if table not in transfer.MODELS:
+        return jsonify({"ok": False, "error": "invalid_table"}), 404
+    try:
+        after = max(int(request.args.get("after", 0)), 0)
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid_after"}), 400
+    compress = request.args.get("gzip") == "1"
+    filename = f"{table}.ndjson" + (".gz" if compress else "")
+    body = stream_with_context(transfer.stream(table, after=after, compress=compress))
+    resp = Response(body, mimetype="application/gzip" if compress else "application/x-ndjson")
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
 @public_bp.get("/api/admin/reports/activity")
 def api_admin_reports_activity():
     maybe = _require_admin()
@@ -627,34 +946,155 @@ def api_admin_settings_get():
     })
 
 
+SETTINGS_KEYS = ['YANDEX_MAPS_API_KEY','TELEGRAM_BOT_USERNAME','SEO_SITE_NAME','SEO_DESCRIPTION','SEO_DEFAULT_IMAGE','SEO_TWITTER','FAVICON_URL','OG_TYPE']
+
+
+@jobs.handler("settings.write_env")
+def job_write_env(payload):
+    # For demo purposes write to a .env file in project root
+    env_path = os.path.join(PROJECT_ROOT, '.env')
+    # Read existing
+    existing = {}
+    if os.path.exists(env_path):
+        with open(env_path, 'r') as f:
+            for line in f:
+                if '=' in line:
+                    k,v = line.strip().split('=',1)
+                    existing[k]=v
+    # Apply updates
+    for k, v in (payload.get('updates') or {}).items():
+        if k in SETTINGS_KEYS:
+            existing[k] = str(v)
+    # Write back atomically
+    tmp = env_path + '.tmp'
+    with open(tmp, 'w') as f:
+        for k,v in existing.items():
+            f.write(f"{k}={v}\n")
+    os.replace(tmp, env_path)
+
+
 @public_bp.post("/api/admin/settings")
 def api_admin_settings_set():
     maybe = _require_admin()
     if maybe: return maybe
-    # For demo purposes write to a .env file in project root
     data = request.get_json(silent=True) or {}
-    env_path = os.path.join(PROJECT_ROOT, '.env')
+    updates = {k: str(data[k]) for k in SETTINGS_KEYS if k in data}
     try:
-        # Read existing
-        existing = {}
-        if os.path.exists(env_path):
-            with open(env_path, 'r') as f:
-                for line in f:
-                    if '=' in line:
-                        k,v = line.strip().split('=',1)
-                        existing[k]=v
-        # Apply updates
-        for k in ['YANDEX_MAPS_API_KEY','TELEGRAM_BOT_USERNAME','SEO_SITE_NAME','SEO_DESCRIPTION','SEO_DEFAULT_IMAGE','SEO_TWITTER','FAVICON_URL','OG_TYPE']:
-            if k in data:
-                existing[k] = str(data[k])
-        # Write back
-        with open(env_path, 'w') as f:
-            for k,v in existing.items():
-                f.write(f"{k}={v}\n")
+        jobs.enqueue("settings.write_env", {"updates": updates}, priority=10)
+        db.session.commit()
         return jsonify({"ok": True})
     except Exception as e:
+        db.session.rollback()
         return jsonify({"ok": False, "error": "write_failed"}), 500
 
+
+@public_bp.get("/api/admin/jobs")
+def api_admin_jobs():
+    maybe = _require_admin()
+    if maybe: return maybe
+    failures = (Job.query.filter(Job.status == "failed")
+                .order_by(Job.finished_at.desc()).limit(20).all())
+    return jsonify({
+        "ok": True,
+        **jobs.stats(),
+        "failures": [
+            {"id": j.id, "kind": j.kind, "attempts": j.attempts, "last_error": j.last_error or "",
+             "finished_at": j.finished_at.isoformat() if j.finished_at else None}
+            for j in failures
+        ]
+    })
+
+
+@public_bp.get("/api/admin/metrics")
+def api_admin_metrics():
+    """Process-local counters: compression and rate limiting."""
+    from . import compress
+    maybe = _require_admin()
+    if maybe: return maybe
+    return jsonify({
+        "ok": True,
+        "compression": compress.metrics(),
+        "ratelimit": {**ratelimit.stats, "inflight": ratelimit.inflight()},
+    })
+
+
+@public_bp.get("/api/admin/duplicates")
+def api_admin_duplicates():
+    """Near-duplicate flags (backend/dedupe.py), newest first, with both texts side by side."""
+    maybe = _require_admin()
+    if maybe: return maybe
+    from sqlalchemy import text
+    from .models import TgPost
+    kind = request.args.get("kind") or "announcement"
+    status = request.args.get("status") or "pending"
+    if kind not in dedupe.TABLES or status not in ("pending", "confirmed", "dismissed"):
+        return jsonify({"ok": False, "error": "invalid_filter"}), 400
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+        per = min(max(int(request.args.get("per", 20)), 1), 100)
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid_query"}), 400
+    total = db.session.execute(text("SELECT COUNT(*) FROM duplicate_flag WHERE kind = :k AND status = :s"),
+                               {"k": kind, "s": status}).scalar()
+    flags = db.session.execute(text(
+        "SELECT item_id, original_id, similarity, status, created_at FROM duplicate_flag "
+        "WHERE kind = :k AND status = :s ORDER BY created_at DESC, item_id DESC LIMIT :n OFFSET :o"),
+        {"k": kind, "s": status, "n": per, "o": (page - 1) * per}).all()
+    model = Announcement if kind == "announcement" else TgPost
+    ids = {f.item_id for f in flags} | {f.original_id for f in flags}
+    rows = {r.id: r for r in model.query.filter(model.id.in_(ids))} if ids else {}
+
+    def brief(r):
+        if r is None:
+            return None
+        if kind == "announcement":
+            return {"id": r.id, "title": r.title, "excerpt": r.content_excerpt or "", "user_id": r.user_id,
+                    "draft": bool(r.draft), "created_at": r.created_at.isoformat()}
+        return {"id": r.id, "text": r.text or "", "source_link": r.source_link,
+                "date": r.date.isoformat() if r.date else None}
+
+    return jsonify({
+        "ok": True,
+        "total": total,
+        "page": page,
+        "per": per,
+        "items": [{
+            "item": brief(rows.get(f.item_id)),
+            "original": brief(rows.get(f.original_id)),
+            "similarity": round(f.similarity, 3),
+            "status": f.status,
+            "created_at": str(f.created_at).replace(" ", "T"),
+        } for f in flags]
+    })
+
+
+@public_bp.post("/api/admin/duplicates/<kind>/<int:item_id>")
+def api_admin_duplicate_review(kind: str, item_id: int):
+    """``{"action": "confirm"}`` hides the copy from public lists, ``"dismiss"`` keeps it."""
+    maybe = _require_admin()
+    if maybe: return maybe
+    action = (request.get_json(silent=True) or {}).get("action")
+    if kind not in dedupe.TABLES or action not in ("confirm", "dismiss"):
+        return jsonify({"ok": False, "error": "invalid_action"}), 400
+    if not dedupe.review(kind, item_id, action):
+        return jsonify({"ok": False, "error": "not_found"}), 404
+    return jsonify({"ok": True})
+
+
+@public_bp.post("/api/admin/jobs/<int:jid>/retry")
+def api_admin_job_retry(jid: int):
+    maybe = _require_admin()
+    if maybe: return maybe
+    j = Job.query.get_or_404(jid)
+    if j.status != "failed":
+        return jsonify({"ok": False, "error": "not_failed"}), 400
+    j.status = "queued"
+    j.attempts = 0
+    j.run_at = datetime.utcnow()
+    j.finished_at = None
+    db.session.commit()
+    return jsonify({"ok": True})
+
 @public_bp.get("/api/config")
 def api_public_config():
     return jsonify({
@@ -669,8 +1109,17 @@ def list_announcements():
     offset = max(int(request.args.get("offset", 0)), 0)
     country = (request.args.get("country") or "").strip()
     category_id = request.args.get("category_id")
+    try:
+        names, columns = _fields(ANNOUNCEMENT_FIELDS, (
+            "id", "title", "excerpt", "views", "created_at", "category_id", "tg_post_url", "image_url", "price"))
+    except projection.InvalidFields as e:
+        return _invalid_fields(e)
+    try:
+        order = trending.order_by(Announcement, request.args.get("sort") or "recent")
+    except ValueError:
+        return _invalid_sort()
 
-    q = Announcement.query
+    q = Announcement.query.filter(Announcement.duplicate_of.is_(None))
     # filter by category name (country) if provided
     if country:
         q = q.join(Category).filter(Category.name == country)
@@ -680,55 +1129,234 @@ def list_announcements():
             q = q.filter(Announcement.category_id == cid)
         except Exception:
             pass
-    items = (
-        q.order_by(Announcement.created_at.desc())
+    rows = (
+        q.with_entities(*columns)
+         .order_by(*order)
          .offset(offset)
          .limit(limit)
-         .all()
+         .yield_per(STREAM_BATCH)
     )
+    return jsonio.response(jsonio.stream_array(projection.serialize(ANNOUNCEMENT_FIELDS, names, r) for r in rows))
+
 
-    def first_image(a):
+@public_bp.get("/api/stats/prices")
+def api_stats_prices():
+    """Price distribution of published listings (backend/pricestats.py).
+
+    Filters, each optional (left out = any): country or category_id,
+    deal_type, rooms (``5+`` includes more), is_per_month (0/1). With
+    ``price`` (and ``area``) the response also places that price in the
+    group: ``price_percentile`` and ``per_area_percentile``.
+    """
+    from .models import Category
+    args = request.args
+    country = (args.get("country") or "").strip()
+    try:
+        if not country and args.get("category_id"):
+            country = db.session.execute(db.select(Category.name).where(
+                Category.id == int(args["category_id"]))).scalar() or ""
+            if not country:
+                return jsonify({"ok": False, "error": "unknown_category"}), 404
+        rooms = args.get("rooms")
+        if rooms:
+            rooms = pricestats.rooms_value(int(rooms.rstrip("+")))
+        monthly = args.get("is_per_month")
+        if monthly:
+            monthly = {"0": "0", "1": "1", "false": "0", "true": "1"}[monthly.lower()]
+        price = float(args["price"]) if args.get("price") else None
+        area = float(args["area"]) if args.get("area") else None
+    except (ValueError, KeyError):
+        return jsonify({"ok": False, "error": "invalid_filter"}), 400
+    filters = {
+        "country": country or pricestats.ANY,
+        "deal_type": (args.get("deal_type") or "").strip() or pricestats.ANY,
+        "rooms": rooms or pricestats.ANY,
+        "is_per_month": monthly or pricestats.ANY,
+    }
+    snap = pricestats.snapshot()
+    if snap is None:
+        # First request after install: have the worker build it (inline in development)
+        jobs.enqueue("prices.refresh", key="prices.refresh")
+        db.session.commit()
+        snap = pricestats.snapshot()
+        if snap is None:
+            return jsonify({"ok": False, "error": "not_ready"}), 503
+    computed_at, data = snap
+    stats = data["groups"].get(pricestats.key(**filters))
+    body = {"ok": True, "computed_at": computed_at, "filters": filters,
+            "quantiles": data["quantiles"], "stats": stats}
+    if stats and price is not None:
+        body["price_percentile"] = pricestats.percentile_of(price, stats["q"])
+        if area and area > 0 and "per_area" in stats:
+            body["per_area_percentile"] = pricestats.percentile_of(price / area, stats["per_area"]["q"])
+    resp = jsonify(body)
+    # One snapshot per timestamp: the tag only has to change with it
+    resp.set_etag(f"prices-{computed_at}")
+    resp.headers["Cache-Control"] = "public, max-age=60"
+    return resp.make_conditional(request)
+
+
+@public_bp.get("/api/announcements/search")
+def api_announcements_search():
+    """Published listings matching facet filters, with counts for every facet.
+
+    Multi-value filters (comma-separated or repeated): category_id, country,
+    deal_type, subcategory, district, is_per_month. Ranges: price_min/max
+    (currency units), rooms_min/max, area_min/max, floor_min/max. ``fields=``
+    picks the item fields as on /api/announcements.
+    """
+    from . import facets
+    args = request.args
+    try:
+        names, columns = _fields(ANNOUNCEMENT_FIELDS, (
+            "id", "title", "excerpt", "views", "created_at", "category_id", "tg_post_url", "image_url",
+            "price", "is_per_month", "rooms", "area", "floor", "district", "deal_type", "subcategory"))
+    except projection.InvalidFields as e:
+        return _invalid_fields(e)
+    filters = {"values": {}, "ranges": {}}
+    try:
+        limit = min(max(int(args.get("limit", 20)), 1), 100)
+        offset = max(int(args.get("offset", 0)), 0)
+        for name in facets.CATEGORICAL:
+            raw = [v.strip() for item in args.getlist(name) for v in item.split(",") if v.strip()]
+            if not raw:
+                continue
+            if name == "category_id":
+                raw = [int(v) for v in raw]
+            elif name == "is_per_month":
+                raw = [int(v.lower() in ("1", "true")) for v in raw]
+            filters["values"][name] = raw
+        for name in facets.RANGES:
+            lo, hi = args.get(f"{name}_min"), args.get(f"{name}_max")
+            if lo or hi:
+                filters["ranges"][name] = (float(lo) if lo else None, float(hi) if hi else None)
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid_query"}), 400
+    total, ids, facet_counts = facets.current().query(filters, offset=offset, limit=limit)
+    rows = (Announcement.query.filter(Announcement.id.in_(ids)).with_entities(*columns).all()
+            if ids else [])
+    by_id = {r.id: r for r in rows}
+    return jsonify({
+        "ok": True,
+        "total": total,
+        "items": [projection.serialize(ANNOUNCEMENT_FIELDS, names, r)
+                  for r in (by_id.get(i) for i in ids) if r is not None],
+        "facets": facet_counts,
+    })
+
+
+@public_bp.get("/api/announcements/geo")
+def api_announcements_geo():
+    """Published listings in a bounding box (bbox=south,west,north,east)
+    or circle (lat, lng, radius_km), nearest first."""
+    from . import geo
+    args = request.args
+    try:
+        limit = min(max(int(args.get("limit", 100)), 1), 500)
+        if args.get("bbox"):
+            south, west, north, east = [float(v) for v in args["bbox"].split(",")]
+            center, radius = None, None
+            if args.get("lat") and args.get("lng"):
+                center = (float(args["lat"]), float(args["lng"]))
+        else:
+            center = (float(args["lat"]), float(args["lng"]))
+            radius = min(float(args.get("radius_km", 5)), 500.0)
+            south, west, north, east = geo.radius_bbox(center[0], center[1], radius)
+        category_id = int(args["category_id"]) if args.get("category_id") else None
+        price_min = int(round(float(args["price_min"]) * 100)) if args.get("price_min") else None
+        price_max = int(round(float(args["price_max"]) * 100)) if args.get("price_max") else None
+    except (KeyError, ValueError):
+        return jsonify({"ok": False, "error": "invalid_query"}), 400
+    if south > north:
+        return jsonify({"ok": False, "error": "invalid_query"}), 400
+    rows = geo.search(south, west, north, east, center=center, radius_km=radius,
+                      category_id=category_id, country=(args.get("country") or "").strip() or None,
+                      price_min=price_min, price_max=price_max, limit=limit)
+
+    def first_image(images_json):
         try:
-            import json as _json
-            imgs = _json.loads(a.images_json) if a.images_json else []
+            imgs = json.loads(images_json) if images_json else []
             return imgs[0] if imgs else None
         except Exception:
             return None
 
-    return jsonify([
-        {
-            "id": a.id,
-            "title": a.title,
-            "excerpt": a.content_excerpt or "",
-            "views": a.views,
-            "created_at": a.created_at.isoformat(),
-            "category_id": a.category_id,
-            "tg_post_url": a.tg_post_url,
-            "image_url": first_image(a),
-            "price": round((a.price_cents or 0) / 100, 2),
-        }
-        for a in items
-    ])
+    return jsonify({
+        "ok": True,
+        "items": [
+            {
+                "id": r.id,
+                "title": r.title,
+                "price": round((r.price_cents or 0) / 100, 2),
+                "is_per_month": bool(r.is_per_month),
+                "lat": r.location_lat,
+                "lng": r.location_lng,
+                "distance_km": round(dist, 3),
+                "category_id": r.category_id,
+                "address": r.address or "",
+                "image_url": first_image(r.images_json),
+            } for r, dist in rows
+        ]
+    })
+
+
+@public_bp.get("/api/announcements/clusters/<int:z>/<int:x>/<int:y>")
+def api_announcement_cluster_tile(z, x, y):
+    """Marker clusters for one map tile (see geo.py for the tile grid)."""
+    from . import geo
+    cols, rows = geo.tile_range(z) if 0 <= z <= geo.MAX_TILE_ZOOM else (0, 0)
+    if not (0 <= x < cols and 0 <= y < rows):
+        return jsonify({"ok": False, "error": "invalid_tile"}), 404
+    version, clusters = geo.tile_clusters(z, x, y)
+    resp = jsonify({"ok": True, "z": z, "x": x, "y": y, "clusters": clusters})
+    resp.set_etag(version or "empty")
+    resp.headers["Cache-Control"] = "public, max-age=30"
+    return resp.make_conditional(request)
+
+
+@public_bp.get("/api/announcements/clusters")
+def api_announcement_clusters():
+    """Marker clusters for a viewport: bbox=south,west,north,east&zoom=N."""
+    from . import geo
+    try:
+        south, west, north, east = [float(v) for v in request.args["bbox"].split(",")]
+        zoom = min(max(int(request.args.get("zoom", 10)), 0), geo.MAX_TILE_ZOOM)
+    except (KeyError, ValueError):
+        return jsonify({"ok": False, "error": "invalid_query"}), 400
+    if south > north:
+        return jsonify({"ok": False, "error": "invalid_query"}), 400
+    tiles = geo.tiles_for_bbox(zoom, south, west, north, east)
+    if len(tiles) > 64:
+        return jsonify({"ok": False, "error": "too_many_tiles"}), 400
+    clusters = []
+    for z, x, y in tiles:
+        clusters.extend(geo.tile_clusters(z, x, y)[1])
+    return jsonify({"ok": True, "zoom": zoom, "tiles": len(tiles), "clusters": clusters})
 
 
 @public_bp.get("/api/tg_posts")
 def api_tg_posts():
     from .models import TgPost
-    import json as _json
     country = (request.args.get("country") or "").strip()
     limit = min(int(request.args.get("limit", 20)), 100)
     offset = max(int(request.args.get("offset", 0)), 0)
+    try:
+        order = trending.order_by(TgPost, request.args.get("sort") or "recent")
+    except ValueError:
+        return _invalid_sort()
 
-    q = TgPost.query.order_by(TgPost.date.desc())
+    q = TgPost.query.filter(TgPost.duplicate_of.is_(None)).order_by(*order)
     if country:
         # crude filter: countries_json contains the country name as a JSON string
         like = f'%"{country}"%'
         q = q.filter(TgPost.countries_json.like(like))
-    items = q.offset(offset).limit(limit).all()
+    items = q.offset(offset).limit(limit).yield_per(STREAM_BATCH)
+    return jsonio.response(jsonio.stream_array(_tg_post_json(tp) for tp in items))
+
 
-    def first_image(tp):
+def _tg_post_json(tp) -> dict:
+    def first_image():
         try:
-            arr = _json.loads(tp.image_urls_json) if tp.image_urls_json else []
+            arr = json.loads(tp.image_urls_json) if tp.image_urls_json else []
             return arr[0] if arr else None
         except Exception:
             return None
@@ -739,18 +1367,16 @@ def api_tg_posts():
             return t
         return t[:max_len-1] + '…'
 
-    return jsonify([
-        {
-            "id": tp.id,
-            "message_id": tp.tg_message_id,
-            "date": tp.date.isoformat() if tp.date else None,
-            "text_excerpt": first_lines(tp.text or ''),
-            "image_url": first_image(tp),
-            "countries": _json.loads(tp.countries_json) if tp.countries_json else [],
-            "source_link": tp.source_link,
-        }
-        for tp in items
-    ])
+    return {
+        "id": tp.id,
+        "message_id": tp.tg_message_id,
+        "date": tp.date.isoformat() if tp.date else None,
+        "text_excerpt": first_lines(tp.text or ''),
+        "image_url": first_image(),
+        "countries": json.loads(tp.countries_json) if tp.countries_json else [],
+        "source_link": tp.source_link,
+        "views": tp.views or 0,
+    }
 
 
 @public_bp.get("/api/announcements/<int:aid>")
@@ -768,15 +1394,61 @@ def get_announcement(aid: int):
 
 
 @public_bp.post("/api/announcements/<int:aid>/view")
+@ratelimit.limit("view")
 def increment_view(aid: int):
     a = Announcement.query.get_or_404(aid)
-    a.views = (a.views or 0) + 1
-    db.session.commit()
-    return jsonify({"id": a.id, "views": a.views})
+    return jsonify({"id": a.id, "views": (a.views or 0) + trending.record("announcement", aid)})
+
+
+@public_bp.post("/api/tg_posts/<int:pid>/view")
+@ratelimit.limit("view")
+def api_tg_post_view(pid: int):
+    from .models import TgPost
+    tp = TgPost.query.get_or_404(pid)
+    return jsonify({"id": tp.id, "views": (tp.views or 0) + trending.record("tg_post", pid)})
+
+
+# Similar items, precomputed by the related.refresh job (backend/related.py)
+RELATED_MAX_AGE = 300
+RELATED_ARTICLE_FIELDS = ("id", "title", "cover_url", "excerpt", "created_at")
+
+
+def _related_response(items):
+    resp = jsonify({"ok": True, "items": items})
+    resp.headers["Cache-Control"] = f"public, max-age={RELATED_MAX_AGE}"
+    return resp
+
+
+@public_bp.get("/api/announcements/<int:aid>/related")
+def api_announcement_related(aid: int):
+    try:
+        names, columns = _fields(ANNOUNCEMENT_FIELDS, (
+            "id", "title", "image_url", "price", "is_per_month", "address", "views", "created_at", "category_id"))
+    except projection.InvalidFields as e:
+        return _invalid_fields(e)
+    rows = related.query(Announcement, "announcement", aid).filter(Announcement.draft.is_(False)).with_entities(*columns)
+    return _related_response([projection.serialize(ANNOUNCEMENT_FIELDS, names, r) for r in rows])
+
+
+@public_bp.get("/api/articles/<int:aid>/related")
+def api_article_related(aid: int):
+    try:
+        names, columns = _fields(ARTICLE_FIELDS, RELATED_ARTICLE_FIELDS)
+    except projection.InvalidFields as e:
+        return _invalid_fields(e)
+    rows = related.query(Article, "article", aid).filter(Article.is_draft.is_(False)).with_entities(*columns)
+    return _related_response([projection.serialize(ARTICLE_FIELDS, names, r) for r in rows])
+
+
+@public_bp.get("/api/tg_posts/<int:pid>/related")
+def api_tg_post_related(pid: int):
+    from .models import TgPost
+    return _related_response([_tg_post_json(tp) for tp in related.query(TgPost, "tg_post", pid)])
 
 
 # -------- Auth endpoints --------
 @public_bp.post("/api/auth/login")
+@ratelimit.limit("auth")
 def api_login():
     data = request.get_json(silent=True) or {}
     username = (data.get("username") or "").strip()
@@ -797,27 +1469,57 @@ def api_login():
 
 
 # -------- Telegram registration flow --------
-@public_bp.post("/api/auth/telegram/init")
-def api_telegram_init():
-    # No username/password required — registration will use Telegram username
-    # Create verification with random password to complete account creation
-    token = secrets.token_urlsafe(24)
-    code = f"{secrets.randbelow(1000000):06d}"
-    random_password = secrets.token_urlsafe(12)
+def _new_verification():
+    # No password hashing here: most attempts are abandoned, and the account
+    # gets its random password only when it is actually created
+    now = datetime.utcnow()
     tv = TelegramVerification(
-        token=token,
-        code=code,
+        token=secrets.token_urlsafe(24),
+        code=f"{secrets.randbelow(1000000):06d}",
         username="pending",
-        password_hash=generate_password_hash(random_password, method='pbkdf2:sha256', salt_length=16),
+        password_hash="",
+        created_at=now,
+        expires_at=now + timedelta(seconds=current_app.config["TELEGRAM_VERIFICATION_TTL"]),
     )
     db.session.add(tv)
     db.session.commit()
     bot_username = os.environ.get("TELEGRAM_BOT_USERNAME", "")
-    deep_link = f"https://t.me/{bot_username}?start={token}" if bot_username else None
-    return jsonify({"ok": True, "token": token, "deep_link": deep_link})
+    deep_link = f"https://t.me/{bot_username}?start={tv.token}" if bot_username else None
+    return jsonify({"ok": True, "token": tv.token, "deep_link": deep_link})
+
+
+def _is_expired(tv) -> bool:
+    expires_at = tv.expires_at or (tv.created_at and tv.created_at + timedelta(seconds=current_app.config["TELEGRAM_VERIFICATION_TTL"]))
+    return bool(expires_at) and datetime.utcnow() > expires_at
+
+
+@jobs.handler("telegram.sweep_verifications")
+def job_sweep_verifications(payload):
+    # Abandoned sign-in attempts: delete in chunks to keep write locks short
+    while True:
+        expired = (db.session.query(TelegramVerification.id)
+                   .filter(TelegramVerification.expires_at < datetime.utcnow())
+                   .limit(5000).subquery())
+        n = (TelegramVerification.query
+             .filter(TelegramVerification.id.in_(db.select(expired.c.id)))
+             .delete(synchronize_session=False))
+        db.session.commit()
+        if n < 5000:
+            return
+
+
+jobs.periodic("telegram.sweep_verifications", "TELEGRAM_VERIFICATION_SWEEP_INTERVAL")
+
+
+@public_bp.post("/api/auth/telegram/init")
+@ratelimit.limit("auth")
+def api_telegram_init():
+    # No username/password required — registration will use Telegram username
+    return _new_verification()
 
 
 @public_bp.post("/api/auth/telegram/complete")
+@ratelimit.limit("auth")
 def api_telegram_complete():
     data = request.get_json(silent=True) or {}
     token = data.get("token") or ""
@@ -825,8 +1527,7 @@ def api_telegram_complete():
     tv = TelegramVerification.query.filter_by(token=token).first()
     if not tv:
         return jsonify({"ok": False, "error": "invalid_token"}), 400
-    # expire after 15 minutes
-    if tv.created_at and datetime.utcnow() - tv.created_at > timedelta(minutes=15):
+    if _is_expired(tv):
         return jsonify({"ok": False, "error": "expired"}), 410
     if tv.code != code:
         return jsonify({"ok": False, "error": "invalid_code"}), 400
@@ -841,7 +1542,8 @@ def api_telegram_complete():
         suffix += 1
         candidate = f"{base_username}{suffix}"
     user = User(username=candidate, is_admin=False, balance_cents=0)
-    user.password_hash = tv.password_hash
+    user.set_password(secrets.token_urlsafe(12))
+    user.tg_user_id = tv.tg_user_id
     if tv.avatar_url:
         user.avatar_url = tv.avatar_url
     # Admin promotion based on Telegram user id
@@ -862,23 +1564,13 @@ def api_telegram_complete():
 
 # -------- Telegram login flow --------
 @public_bp.post("/api/auth/telegram/login_init")
+@ratelimit.limit("auth")
 def api_telegram_login_init():
-    token = secrets.token_urlsafe(24)
-    code = f"{secrets.randbelow(1000000):06d}"
-    tv = TelegramVerification(
-        token=token,
-        code=code,
-        username="pending",
-        password_hash=generate_password_hash(secrets.token_urlsafe(12), method='pbkdf2:sha256', salt_length=16),
-    )
-    db.session.add(tv)
-    db.session.commit()
-    bot_username = os.environ.get("TELEGRAM_BOT_USERNAME", "")
-    deep_link = f"https://t.me/{bot_username}?start={token}" if bot_username else None
-    return jsonify({"ok": True, "token": token, "deep_link": deep_link})
+    return _new_verification()
 
 
 @public_bp.post("/api/auth/telegram/login_complete")
+@ratelimit.limit("auth")
 def api_telegram_login_complete():
     data = request.get_json(silent=True) or {}
     token = data.get("token") or ""
@@ -886,7 +1578,7 @@ def api_telegram_login_complete():
     tv = TelegramVerification.query.filter_by(token=token).first()
     if not tv:
         return jsonify({"ok": False, "error": "invalid_token"}), 400
-    if tv.created_at and datetime.utcnow() - tv.created_at > timedelta(minutes=15):
+    if _is_expired(tv):
         return jsonify({"ok": False, "error": "expired"}), 410
     if tv.code != code:
         return jsonify({"ok": False, "error": "invalid_code"}), 400
@@ -903,7 +1595,7 @@ def api_telegram_login_complete():
             suffix += 1
             candidate = f"{base_username}{suffix}"
         user = User(username=candidate, is_admin=False, balance_cents=0)
-        user.password_hash = tv.password_hash
+        user.set_password(secrets.token_urlsafe(12))
         # set avatar from Telegram if available
         if getattr(tv, 'avatar_url', None):
             user.avatar_url = tv.avatar_url
@@ -912,6 +1604,8 @@ def api_telegram_login_complete():
     admin_tg_id = os.environ.get("ADMIN_TG_ID")
     if admin_tg_id and str(getattr(tv, 'tg_user_id', '')) == str(admin_tg_id):
         user.is_admin = True
+    if tv.tg_user_id and user.tg_user_id != tv.tg_user_id:
+        user.tg_user_id = tv.tg_user_id
     # Update avatar from Telegram on each login if available
     if getattr(tv, 'avatar_url', None):
         try:
@@ -941,24 +1635,20 @@ def api_my_announcements():
         per_page = min(max(int(request.args.get("per", 10)), 1), 50)
     except Exception:
         page, per_page = 1, 10
-    q = Announcement.query.filter_by(user_id=current_user.id).order_by(Announcement.created_at.desc())
+    try:
+        names, columns = _fields(ANNOUNCEMENT_FIELDS, ("id", "title", "excerpt", "views", "created_at", "category_id"))
+    except projection.InvalidFields as e:
+        return _invalid_fields(e)
+    q = Announcement.query.filter_by(user_id=current_user.id)
     total = q.count()
-    items = q.offset((page-1)*per_page).limit(per_page).all()
+    rows = (q.with_entities(*columns).order_by(Announcement.created_at.desc())
+             .offset((page-1)*per_page).limit(per_page).all())
     return jsonify({
         "ok": True,
         "total": total,
         "page": page,
         "per": per_page,
-        "items": [
-            {
-                "id": a.id,
-                "title": a.title,
-                "excerpt": a.content_excerpt or "",
-                "views": a.views,
-                "created_at": a.created_at.isoformat(),
-                "category_id": a.category_id,
-            } for a in items
-        ]
+        "items": [projection.serialize(ANNOUNCEMENT_FIELDS, names, r) for r in rows]
     })
 
 
@@ -975,9 +1665,11 @@ def api_me_topup():
     if amount <= 0:
         return jsonify({"ok": False, "error": "invalid_amount"}), 400
     cents = int(round(amount * 100))
-    current_user.balance_cents = (current_user.balance_cents or 0) + cents
+    # current_user is a read-only snapshot; modify the row itself
+    user = User.query.get(current_user.id)
+    user.balance_cents = (user.balance_cents or 0) + cents
     db.session.commit()
-    return jsonify({"ok": True, "balance": round((current_user.balance_cents or 0)/100, 2)})
+    return jsonify({"ok": True, "balance": round((user.balance_cents or 0)/100, 2)})
 
 
 @public_bp.post("/api/me/profile")
@@ -988,38 +1680,39 @@ def api_me_profile_update():
     new_username = (data.get("username") or "").strip()
     new_password = data.get("password") or None
     new_bio = data.get("bio")
+    user = User.query.get(current_user.id)
     changed = False
-    if new_username and new_username != current_user.username:
+    if new_username and new_username != user.username:
         if len(new_username) < 3:
             return jsonify({"ok": False, "error": "weak_username"}), 400
         if User.query.filter_by(username=new_username).first():
             return jsonify({"ok": False, "error": "user_exists"}), 409
         # cooldown 24h between renames
         from datetime import datetime, timedelta
-        if getattr(current_user, 'username_changed_at', None):
-            if datetime.utcnow() - (current_user.username_changed_at) < timedelta(hours=24):
+        if getattr(user, 'username_changed_at', None):
+            if datetime.utcnow() - (user.username_changed_at) < timedelta(hours=24):
                 return jsonify({"ok": False, "error": "rename_cooldown"}), 429
-        current_user.username = new_username
-        current_user.username_changed_at = datetime.utcnow()
+        user.username = new_username
+        user.username_changed_at = datetime.utcnow()
         changed = True
     if new_password:
         if len(new_password) < 6:
             return jsonify({"ok": False, "error": "weak_password"}), 400
-        current_user.set_password(new_password)
+        user.set_password(new_password)
         changed = True
     if new_bio is not None:
-        current_user.bio = new_bio
+        user.bio = new_bio
         changed = True
     if changed:
         db.session.commit()
     return jsonify({
         "ok": True,
         "user": {
-            "id": current_user.id,
-            "username": current_user.username,
-            "balance": round((current_user.balance_cents or 0)/100, 2),
-            "avatar_url": current_user.avatar_url or "",
-            "bio": current_user.bio or ""
+            "id": user.id,
+            "username": user.username,
+            "balance": round((user.balance_cents or 0)/100, 2),
+            "avatar_url": user.avatar_url or "",
+            "bio": user.bio or ""
         }
     })
 
@@ -1029,24 +1722,31 @@ def api_me_profile_update():
 def api_my_articles_list():
     if not current_user.is_authenticated:
         return jsonify({"ok": False, "error": "unauthorized"}), 401
-    items = (Article.query
-             .filter_by(user_id=current_user.id)
-             .order_by(Article.created_at.desc())
-             .all())
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+        per_page = min(max(int(request.args.get("per", 50)), 1), 100)
+    except Exception:
+        page, per_page = 1, 50
+    # Bodies only on request (fields=content); the list shows excerpts
+    try:
+        names, columns = _fields(ARTICLE_FIELDS, ("id", "title", "excerpt", "reading_minutes", "created_at", "draft"))
+    except projection.InvalidFields as e:
+        return _invalid_fields(e)
+    q = Article.query.filter_by(user_id=current_user.id)
+    total = q.count()
+    rows = (q.with_entities(*columns).order_by(Article.created_at.desc())
+             .offset((page-1)*per_page).limit(per_page).all())
     return jsonify({
         "ok": True,
-        "items": [
-            {
-                "id": a.id,
-                "title": a.title,
-                "content": a.content,
-                "created_at": a.created_at.isoformat(),
-            } for a in items
-        ]
+        "total": total,
+        "page": page,
+        "per": per_page,
+        "items": [projection.serialize(ARTICLE_FIELDS, names, r) for r in rows]
     })
 
 
 @public_bp.post("/api/me/articles")
+@ratelimit.limit("write")
 def api_my_articles_create():
     if not current_user.is_authenticated:
         return jsonify({"ok": False, "error": "unauthorized"}), 401
@@ -1057,6 +1757,8 @@ def api_my_articles_create():
         return jsonify({"ok": False, "error": "missing_fields"}), 400
     a = Article(title=title, content=content, user_id=current_user.id)
     db.session.add(a)
+    db.session.flush()
+    notify.article_published(a)
     db.session.commit()
     return jsonify({"ok": True, "id": a.id})
 
@@ -1085,6 +1787,7 @@ def api_my_reviews_list():
 
 
 @public_bp.post("/api/me/reviews")
+@ratelimit.limit("write")
 def api_my_reviews_create():
     if not current_user.is_authenticated:
         return jsonify({"ok": False, "error": "unauthorized"}), 401
@@ -1103,6 +1806,7 @@ def api_my_reviews_create():
     return jsonify({"ok": True, "id": r.id})
 
 @public_bp.post("/api/me/announcements")
+@ratelimit.limit("write")
 def api_create_my_announcement():
     if not current_user.is_authenticated:
         return jsonify({"ok": False, "error": "unauthorized"}), 401
@@ -1154,11 +1858,15 @@ def api_create_my_announcement():
         district=district,
     )
     db.session.add(a)
+    db.session.flush()
+    # Flagged for review, still published
+    original_id = dedupe.check(a)
     db.session.commit()
-    return jsonify({"ok": True, "id": a.id})
+    return jsonify({"ok": True, "id": a.id, "possible_duplicate_of": original_id})
 
 
 @public_bp.post("/api/upload")
+@ratelimit.limit("write")
 def api_upload_file():
     if not current_user.is_authenticated:
         return jsonify({"ok": False, "error": "unauthorized"}), 401
@@ -1177,53 +1885,150 @@ def api_upload_file():
     return jsonify({"ok": True, "url": url})
 
 
-@public_bp.get('/uploads/<path:filename>')
-def serve_uploads(filename):
-    return send_from_directory(UPLOAD_DIR, filename)
+# -------- Public Articles --------
+def _article_item(a: Article, author) -> dict:
+    """Full public payload of one article, with its author's rating and totals."""
+    from sqlalchemy import func
+    rating_avg, rating_count = None, 0
+    articles_count, total_views = 0, 0
+    if author:
+        rating_avg, rating_count = db.session.query(func.avg(Review.rating), func.count(Review.id)).filter(
+            Review.author_id == author.id).one()
+        articles_count, total_views = db.session.query(func.count(Article.id), func.coalesce(func.sum(Article.views), 0)).filter(
+            Article.user_id == author.id, Article.is_draft == False).one()
+    return {
+        "id": a.id,
+        "title": a.title,
+        "content": a.content,
+        "cover_url": a.cover_url or "",
+        "tags": (json.loads(a.tags_json) if a.tags_json else []),
+        "seo_title": a.seo_title or "",
+        "seo_description": a.seo_description or "",
+        "og_image_url": a.og_image_url or "",
+        "created_at": a.created_at.isoformat(),
+        "is_draft": bool(a.is_draft),
+        "category": a.category or "",
+        "views": int(a.views or 0) + trending.pending_views("article", a.id),
+        "author": {"id": author.id, "username": author.username, "avatar_url": author.avatar_url or ""} if author else None,
+        "author_rating": {"avg": float(rating_avg) if rating_avg is not None else None, "count": int(rating_count or 0)},
+        "author_metrics": {"articles": int(articles_count or 0), "total_views": int(total_views or 0)}
+    }
 
 
-# -------- Public Articles --------
 @public_bp.get("/api/articles/<int:aid>")
 def api_public_article(aid: int):
     a = Article.query.get_or_404(aid)
     # Hide drafts from non-admins
     if a.is_draft and not (current_user.is_authenticated and getattr(current_user, 'is_admin', False)):
         abort(404)
-    author = User.query.get(a.user_id) if a.user_id else None
-    # Metrics and rating
-    from sqlalchemy import func
-    rating_avg = None
-    rating_count = 0
-    articles_count = 0
-    total_views = 0
+    author = db.session.get(User, a.user_id) if a.user_id else None
+    return jsonify({"ok": True, "item": _article_item(a, author)})
+
+
+AUTHOR_ARTICLES_LIMIT = 5
+
+
+@public_bp.get("/api/pages/article/<int:aid>")
+@ratelimit.limit("view")
+def api_page_article(aid: int):
+    """Everything article.html renders, in one response.
+
+    The article with author stats, the author's other published articles,
+    similar articles (``related``), the first page of comments (continue with ``/api/articles/<id>/comments``
+    and ``next_cursor``) and the visitor's session. ``view=1`` also counts
+    the page view, which the response then reflects.
+    """
+    a = Article.query.get_or_404(aid)
+    is_admin = current_user.is_authenticated and getattr(current_user, 'is_admin', False)
+    if a.is_draft and not is_admin:
+        abort(404)
+    if request.args.get('view') == '1' and not a.is_draft:
+        trending.record("article", aid)
+    author = db.session.get(User, a.user_id) if a.user_id else None
+    author_articles = []
     if author:
-        try:
-            rating_avg = db.session.query(func.avg(Review.rating)).filter(Review.author_id == author.id).scalar()
-            rating_count = db.session.query(func.count(Review.id)).filter(Review.author_id == author.id).scalar() or 0
-            articles_count = Article.query.filter_by(user_id=author.id, is_draft=False).count()
-            total_views = db.session.query(func.coalesce(func.sum(Article.views), 0)).filter(Article.user_id==author.id, Article.is_draft==False).scalar() or 0
-        except Exception:
-            pass
-    return jsonify({
+        names, columns = projection.resolve(ARTICLE_FIELDS, ("id", "title", "cover_url", "created_at"), None)
+        rows = (Article.query.filter(Article.user_id == author.id, Article.is_draft == False, Article.id != aid)
+                .order_by(Article.created_at.desc()).with_entities(*columns).limit(AUTHOR_ARTICLES_LIMIT).all())
+        author_articles = [projection.serialize(ARTICLE_FIELDS, names, r) for r in rows]
+    comments = {"items": [], "total": 0, "next_cursor": None}
+    related_articles = []
+    if not a.is_draft:
+        items, next_cursor = _comment_page(aid, COMMENTS_PAGE_SIZE)
+        comments = {"items": items, "total": a.comments_count, "next_cursor": next_cursor}
+        names, columns = projection.resolve(ARTICLE_FIELDS, RELATED_ARTICLE_FIELDS, None)
+        rows = related.query(Article, "article", aid).filter(Article.is_draft.is_(False)).with_entities(*columns)
+        related_articles = [projection.serialize(ARTICLE_FIELDS, names, r) for r in rows]
+    resp = jsonify({
         "ok": True,
-        "item": {
-            "id": a.id,
-            "title": a.title,
-            "content": a.content,
-            "cover_url": a.cover_url or "",
-            "tags": (json.loads(a.tags_json) if a.tags_json else []),
-            "seo_title": a.seo_title or "",
-            "seo_description": a.seo_description or "",
-            "og_image_url": a.og_image_url or "",
-            "created_at": a.created_at.isoformat(),
-            "is_draft": bool(a.is_draft),
-            "category": a.category or "",
-            "views": int(a.views or 0),
-            "author": {"id": author.id, "username": author.username, "avatar_url": author.avatar_url or ""} if author else None,
-            "author_rating": {"avg": float(rating_avg) if rating_avg is not None else None, "count": int(rating_count)},
-            "author_metrics": {"articles": int(articles_count), "total_views": int(total_views)}
-        }
+        "item": _article_item(a, author),
+        "author_articles": author_articles,
+        "related": related_articles,
+        "comments": comments,
+        "me": _me_json(),
     })
+    # Per-visitor (session) and counts views: never cache
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+@public_bp.get("/api/events")
+def api_events():
+    """Server-Sent Events for ``?topics=a,b`` (see ``backend/events.py``)."""
+    topics = sorted({t.strip() for t in (request.args.get("topics") or "").split(",") if t.strip()})
+    if not topics or len(topics) > events.MAX_TOPICS or not all(events.valid_topic(t) for t in topics):
+        return jsonify({"ok": False, "error": "invalid_topics"}), 400
+    is_admin = current_user.is_authenticated and getattr(current_user, 'is_admin', False)
+    if "admin:summary" in topics and not is_admin:
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    for t in topics:
+        if t.startswith("article:"):
+            a = db.session.get(Article, int(t.split(":")[1]))
+            if a is None or (a.is_draft and not is_admin):
+                return jsonify({"ok": False, "error": "not_found"}), 404
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or -1)
+    except ValueError:
+        last_id = -1
+    cfg = current_app.config
+    try:
+        sub = events.hub.subscribe(current_app._get_current_object(), topics,
+                                   cfg.get("EVENTS_QUEUE_SIZE", 100), cfg.get("EVENTS_MAX_CONNECTIONS", 32))
+    except events.Full:
+        resp = jsonify({"ok": False, "error": "too_many_streams"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "30"
+        return resp
+    try:
+        backlog = events.replay(topics, last_id, cfg.get("EVENTS_QUEUE_SIZE", 100)) if last_id >= 0 else []
+    except Exception:
+        events.hub.unsubscribe(sub)
+        raise
+    db.session.rollback()
+    # No stream_with_context: the request (and its in-flight slot) ends here, the stream only needs ``sub``
+    resp = Response(events.stream(sub, backlog, cfg.get("EVENTS_HEARTBEAT", 15), cfg.get("EVENTS_MAX_AGE", 300)),
+                    mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@public_bp.post("/api/batch")
+def api_batch():
+    """Run several GET API calls in one round trip.
+
+    Body: ``{"requests": [{"path": "/api/..."}, ...]}``, at most
+    ``BATCH_MAX_REQUESTS``. Answers ``{"ok": true, "responses": [{"status",
+    "body"}, ...]}`` in request order; see ``backend/batch.py``.
+    """
+    from . import batch
+    data = request.get_json(silent=True) or {}
+    try:
+        responses = batch.run(data.get("requests"))
+    except batch.BatchError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    return jsonify({"ok": True, "responses": responses})
+
 
 @public_bp.post("/api/auth/logout")
 def api_logout():
@@ -1232,18 +2037,13 @@ def api_logout():
     return jsonify({"ok": True})
 
 
-@public_bp.get("/api/auth/me")
-def api_me():
+def _me_json() -> dict:
     if not current_user.is_authenticated:
-        return jsonify({"authenticated": False}), 200
-    # rating stats
-    try:
-        ratings = [rv.rating for rv in Review.query.filter_by(author_id=current_user.id).all()]
-        rating_count = len(ratings)
-        rating_avg = round(sum(ratings)/rating_count, 2) if rating_count else 0
-    except Exception:
-        rating_count, rating_avg = 0, 0
-    return jsonify({
+        return {"authenticated": False}
+    from sqlalchemy import func
+    rating_avg, rating_count = db.session.query(func.avg(Review.rating), func.count(Review.id)).filter(
+        Review.author_id == current_user.id).one()
+    return {
         "authenticated": True,
         "user": {
             "id": current_user.id,
@@ -1251,14 +2051,20 @@ def api_me():
             "balance": round((current_user.balance_cents or 0) / 100, 2),
             "avatar_url": current_user.avatar_url or "",
             "bio": current_user.bio or "",
-            "rating_avg": rating_avg,
-            "rating_count": rating_count,
+            "rating_avg": round(float(rating_avg), 2) if rating_count else 0,
+            "rating_count": int(rating_count or 0),
             "is_admin": bool(getattr(current_user, 'is_admin', False))
         }
-    })
+    }
+
+
+@public_bp.get("/api/auth/me")
+def api_me():
+    return jsonify(_me_json()), 200
 
 
 @public_bp.post("/api/auth/register")
+@ratelimit.limit("auth")
 def api_register():
     data = request.get_json(silent=True) or {}
     username = (data.get("username") or "").strip()
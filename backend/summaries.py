@@ -0,0 +1,102 @@
+"""Precomputed summary columns so list views never load bodies.
+
+- ``Article.excerpt`` / ``Article.reading_minutes`` are derived from the
+  HTML ``content`` whenever it is written through the ORM (the editor and
+  API paths); ``install`` backfills rows that predate the columns.
+- ``Announcement.first_image`` / ``Announcement.images_count`` mirror
+  ``images_json`` via triggers, so raw SQL and imports keep them right too.
+"""
+import html
+import math
+import re
+
+from sqlalchemy import event, text
+
+from .extensions import db
+from .models import Article
+
+EXCERPT_CHARS = 240
+WORDS_PER_MINUTE = 200
+
+_TAG = re.compile(r"<[^>]+>")
+_BLOCK_END = re.compile(r"</(p|div|h[1-6]|li|blockquote|pre)>|<br\s*/?>", re.I)
+_SPACE = re.compile(r"\s+")
+
+
+def plain_text(markup: str) -> str:
+    s = _BLOCK_END.sub(" ", markup or "")
+    s = _TAG.sub("", s)
+    return _SPACE.sub(" ", html.unescape(s)).strip()
+
+
+def excerpt(text_: str, limit: int = EXCERPT_CHARS) -> str:
+    if len(text_) <= limit:
+        return text_
+    cut = text_[:limit].rsplit(" ", 1)[0] or text_[:limit]
+    return cut.rstrip(" ,.;:-") + "…"
+
+
+def reading_minutes(text_: str) -> int:
+    return max(1, math.ceil(len(text_.split()) / WORDS_PER_MINUTE))
+
+
+def summarize(article: Article) -> None:
+    body = plain_text(article.content)
+    article.excerpt = excerpt(body)
+    article.reading_minutes = reading_minutes(body)
+
+
+@event.listens_for(Article, "before_insert")
+def _summarize_new(_mapper, _connection, target):
+    summarize(target)
+
+
+@event.listens_for(Article, "before_update")
+def _summarize_changed(_mapper, _connection, target):
+    if db.inspect(target).attrs.content.history.has_changes():
+        summarize(target)
+
+
+_ANNOUNCEMENT_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS announcement_images_ai AFTER INSERT ON announcement BEGIN
+         UPDATE announcement SET
+           first_image = CASE WHEN json_valid(NEW.images_json) THEN json_extract(NEW.images_json, '$[0]') END,
+           images_count = CASE WHEN json_valid(NEW.images_json) THEN json_array_length(NEW.images_json) ELSE 0 END
+         WHERE id = NEW.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS announcement_images_au AFTER UPDATE OF images_json ON announcement BEGIN
+         UPDATE announcement SET
+           first_image = CASE WHEN json_valid(NEW.images_json) THEN json_extract(NEW.images_json, '$[0]') END,
+           images_count = CASE WHEN json_valid(NEW.images_json) THEN json_array_length(NEW.images_json) ELSE 0 END
+         WHERE id = NEW.id;
+       END""",
+]
+
+
+def install() -> None:
+    for stmt in _ANNOUNCEMENT_TRIGGERS:
+        db.session.execute(text(stmt))
+    db.session.commit()
+
+
+def backfill_announcements() -> None:
+    db.session.execute(text("""
+        UPDATE announcement SET
+          first_image = CASE WHEN json_valid(images_json) THEN json_extract(images_json, '$[0]') END,
+          images_count = CASE WHEN json_valid(images_json) THEN json_array_length(images_json) ELSE 0 END"""))
+    db.session.commit()
+
+
+def backfill_articles(batch: int = 500) -> None:
+    last = 0
+    while True:
+        rows = db.session.execute(
+            db.select(Article.id, Article.content).where(Article.id > last).order_by(Article.id).limit(batch)).all()
+        if not rows:
+            break
+        for aid, content in rows:
+            body = plain_text(content)
+            db.session.execute(db.update(Article).where(Article.id == aid).values(
+                excerpt=excerpt(body), reading_minutes=reading_minutes(body)))
+        last = rows[-1].id
+        db.session.commit()
@@ -1,69 +1,165 @@
 import os
+import argparse
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from telegram.ext import Updater, CommandHandler
-from backend import create_app
+from backend import create_app, avatars
+from backend.ratelimit import TokenBucket
 from backend.extensions import db
-from backend.models import TelegramVerification
+from backend.models import TelegramVerification, User
 from datetime import datetime
 
 # Load .env before reading token
 load_dotenv()
 BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
-if not BOT_TOKEN:
-    raise SystemExit("TELEGRAM_BOT_TOKEN is not set")
+# Handlers run concurrently in the dispatcher's pool (run_async)
+BOT_WORKERS = int(os.environ.get("TELEGRAM_BOT_WORKERS", 8))
+# Telegram allows ~30 messages/second per bot; stay below it
+SEND_RATE = float(os.environ.get("TELEGRAM_SEND_RATE", 25))
+SEND_BURST = int(os.environ.get("TELEGRAM_SEND_BURST", 5))
+AVATAR_WORKERS = int(os.environ.get("TELEGRAM_AVATAR_WORKERS", 4))
+AVATAR_TIMEOUT = float(os.environ.get("TELEGRAM_AVATAR_TIMEOUT", 5))
+# Background check of known users for a changed profile photo (seconds, 0 disables)
+AVATAR_REFRESH_INTERVAL = int(os.environ.get("TELEGRAM_AVATAR_REFRESH_INTERVAL", 6 * 3600))
+# Its own budget of users checked per second, on top of SEND_RATE and kept small
+# so the two stay under the per-bot API limit and replies never wait on it
+AVATAR_REFRESH_RATE = float(os.environ.get("TELEGRAM_AVATAR_REFRESH_RATE", 2))
+# Webhook mode (`--webhook`): Telegram posts updates to WEBHOOK_URL/<url path>
+WEBHOOK_URL = os.environ.get("TELEGRAM_WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.environ.get("TELEGRAM_WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("TELEGRAM_WEBHOOK_PORT", 8443))
+WEBHOOK_SECRET = os.environ.get("TELEGRAM_WEBHOOK_SECRET", "")
 
-app = create_app(os.environ.get("FLASK_ENV", "development"))
+# Created lazily so the handlers can be imported (and driven by the fake bot) offline
+app = None
+avatar_pool = ThreadPoolExecutor(max_workers=AVATAR_WORKERS, thread_name_prefix="tg-avatar")
+
+
+send_limiter = TokenBucket(SEND_RATE, SEND_BURST)
+refresh_limiter = TokenBucket(AVATAR_REFRESH_RATE, 1)
+
+
+def get_app():
+    global app
+    if app is None:
+        app = create_app(os.environ.get("FLASK_ENV", "development"))
+    return app
+
+
+def reply(update, text, **kwargs):
+    send_limiter.acquire()
+    update.message.reply_text(text, **kwargs)
+
+
+def derive_username(eff) -> str:
+    # Derive username from Telegram
+    tg_username = (eff.username or "").strip()
+    if tg_username:
+        candidate = tg_username
+    else:
+        # fallback: first+last or user<id>
+        first = (eff.first_name or "").strip()
+        last = (eff.last_name or "").strip()
+        candidate = (first + last).strip() or f"user{eff.id}"
+    # sanitize spaces
+    return candidate.replace(" ", "_")
+
+
+def refresh_avatars(context):
+    """Re-sync avatars of Telegram users whose profile photo changed."""
+    fetcher = avatars.TelegramFetcher(context.bot)
+    flask_app = get_app()
+    with flask_app.app_context():
+        known = db.session.query(User.id, User.tg_user_id, User.avatar_url).filter(User.tg_user_id.isnot(None)).all()
+    for uid, tg_user_id, current in known:
+        refresh_limiter.acquire()
+        try:
+            url = avatars.sync_avatar(fetcher, int(tg_user_id))
+        except Exception:
+            continue
+        if url and url != current:
+            with flask_app.app_context():
+                user = User.query.get(uid)
+                if user:
+                    user.avatar_url = url
+                    db.session.commit()
 
 
 def start(update, context):
     args = context.args
     if not args:
-        update.message.reply_text("Здравствуйте! Отправьте ссылку из сайта с параметром, чтобы подтвердить регистрацию.")
+        reply(update, "Здравствуйте! Отправьте ссылку из сайта с параметром, чтобы подтвердить регистрацию.")
         return
     token = args[0]
-    with app.app_context():
+    eff = update.effective_user
+    # Telegram API calls go to their own pool so no DB session waits on them
+    avatar = avatar_pool.submit(avatars.sync_avatar, avatars.TelegramFetcher(context.bot), eff.id)
+    flask_app = get_app()
+    with flask_app.app_context():
+        known = (db.session.query(TelegramVerification.id)
+                 .filter(TelegramVerification.token == token, TelegramVerification.expires_at > datetime.utcnow())
+                 .first() is not None)
+    if not known:
+        avatar.cancel()
+        reply(update, "Ссылка недействительна или устарела. Начните регистрацию заново на сайте.")
+        return
+    try:
+        avatar_url = avatar.result(timeout=AVATAR_TIMEOUT)
+    except Exception:
+        avatar_url = None
+    # Short write transaction: everything slow has already happened
+    with flask_app.app_context():
         tv = TelegramVerification.query.filter_by(token=token).first()
-        if not tv:
-            update.message.reply_text("Ссылка недействительна или устарела. Начните регистрацию заново на сайте.")
+        if not tv or (tv.expires_at and tv.expires_at < datetime.utcnow()):
+            reply(update, "Ссылка недействительна или устарела. Начните регистрацию заново на сайте.")
             return
-        # Derive username from Telegram
-        eff = update.effective_user
-        tg_username = (eff.username or "").strip()
-        if tg_username:
-            candidate = tg_username
-        else:
-            # fallback: first+last or user<id>
-            first = (eff.first_name or "").strip()
-            last = (eff.last_name or "").strip()
-            candidate = (first + last).strip() or f"user{eff.id}"
-        # sanitize spaces
-        candidate = candidate.replace(" ", "_")
-        tv.username = candidate
+        tv.username = derive_username(eff)
         tv.tg_user_id = str(eff.id)
-        # Try to fetch avatar
-        try:
-            photos = context.bot.get_user_profile_photos(eff.id, limit=1)
-            if photos.total_count > 0:
-                file_id = photos.photos[0][-1].file_id  # largest size
-                tg_file = context.bot.get_file(file_id)
-                # Construct public URL to the file
-                tv.avatar_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{tg_file.file_path}"
-        except Exception:
-            pass
+        if avatar_url:
+            tv.avatar_url = avatar_url
         tv.verified_at = datetime.utcnow()
+        code = tv.code
         db.session.commit()
-        # send code
-        update.message.reply_text(
-            f"Ваш код подтверждения: <b>{tv.code}</b>\nВведите его на сайте, чтобы завершить регистрацию.",
-            parse_mode='HTML'
-        )
+    # send code
+    reply(
+        update,
+        f"Ваш код подтверждения: <b>{code}</b>\nВведите его на сайте, чтобы завершить регистрацию.",
+        parse_mode='HTML'
+    )
 
 
-def main():
-    updater = Updater(BOT_TOKEN, use_context=True)
+def build_updater(token: str) -> Updater:
+    updater = Updater(token, use_context=True, workers=BOT_WORKERS)
     dp = updater.dispatcher
-    dp.add_handler(CommandHandler("start", start, pass_args=True))
-    updater.start_polling()
+    dp.add_handler(CommandHandler("start", start, run_async=True))
+    if AVATAR_REFRESH_INTERVAL > 0:
+        updater.job_queue.run_repeating(refresh_avatars, interval=AVATAR_REFRESH_INTERVAL, first=60)
+    return updater
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Magic Worlds Telegram verification bot")
+    parser.add_argument("--webhook", action="store_true", help="receive updates via webhook instead of polling")
+    opts = parser.parse_args()
+    if not BOT_TOKEN:
+        raise SystemExit("TELEGRAM_BOT_TOKEN is not set")
+    get_app()
+    updater = build_updater(BOT_TOKEN)
+    if opts.webhook:
+        if not WEBHOOK_URL:
+            raise SystemExit("TELEGRAM_WEBHOOK_URL is not set")
+        # Unguessable path so only Telegram can post updates
+        url_path = "tg/" + (WEBHOOK_SECRET or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()[:32])
+        updater.start_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=url_path,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{url_path}",
+            max_connections=BOT_WORKERS * 5,
+        )
+    else:
+        updater.start_polling()
     updater.idle()
 
 
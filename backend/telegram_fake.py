@@ -0,0 +1,98 @@
+"""Offline stand-in for the Telegram Bot API.
+
+``FakeBot`` implements the handful of Bot methods the verification bot uses,
+with an optional artificial latency, and records what would have been sent.
+``make_start_update`` builds a real ``telegram.Update`` bound to the fake bot,
+so handlers can be driven without network access::
+
+    bot = FakeBot(latency=0.2)
+    bot.add_photo(42, b"...jpeg bytes...")
+    update, context = make_start_update(bot, 42, "alice", token)
+    telegram_bot.start(update, context)
+    bot.sent  # [(chat_id, text, kwargs)]
+"""
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+from telegram import Update
+
+
+class FakeFile:
+    def __init__(self, bot, file_id, file_unique_id, data):
+        self.file_id = file_id
+        self.file_unique_id = file_unique_id
+        self.file_path = f"{bot.base_file_url}/photos/{file_unique_id}.jpg"
+        self._data = data
+
+    def download_as_bytearray(self, buf=None):
+        return bytearray(self._data)
+
+
+class FakeBot:
+    defaults = None
+
+    def __init__(self, token: str = "123456:FAKE", latency: float = 0.0):
+        self.token = token
+        self.base_file_url = f"https://api.telegram.org/file/bot{token}"
+        self.latency = latency
+        self.sent = []
+        self.calls = []
+        self._photos = {}  # tg user id -> [(file_id, file_unique_id)]
+        self._files = {}   # file_id -> FakeFile
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_photo(self, tg_user_id: int, data: bytes) -> str:
+        n = next(self._ids)
+        file_id, unique_id = f"file{n}", f"uniq{n}"
+        self._files[file_id] = FakeFile(self, file_id, unique_id, data)
+        self._photos.setdefault(tg_user_id, []).insert(0, (file_id, unique_id))
+        return unique_id
+
+    def _call(self, name):
+        with self._lock:
+            self.calls.append(name)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_user_profile_photos(self, user_id, offset=None, limit=100, **kwargs):
+        self._call("getUserProfilePhotos")
+        photos = self._photos.get(user_id, [])[:limit]
+        sizes = [[SimpleNamespace(file_id=f, file_unique_id=u, width=640, height=640)] for f, u in photos]
+        return SimpleNamespace(total_count=len(self._photos.get(user_id, [])), photos=sizes)
+
+    def get_file(self, file_id, **kwargs):
+        self._call("getFile")
+        return self._files[file_id]
+
+    def send_message(self, chat_id, text, **kwargs):
+        self._call("sendMessage")
+        with self._lock:
+            self.sent.append((chat_id, text, kwargs))
+        return SimpleNamespace(chat_id=chat_id, text=text)
+
+
+_update_ids = itertools.count(1)
+
+
+def make_start_update(bot: FakeBot, tg_user_id: int, username: str = None, token: str = None):
+    """Return ``(update, context)`` for a ``/start <token>`` private message."""
+    user = {"id": tg_user_id, "is_bot": False, "first_name": username or "User"}
+    if username:
+        user["username"] = username
+    text = f"/start {token}" if token else "/start"
+    payload = {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": tg_user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        },
+    }
+    update = Update.de_json(payload, bot)
+    context = SimpleNamespace(bot=bot, args=[token] if token else [])
+    return update, context
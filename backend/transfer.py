@@ -0,0 +1,245 @@
+"""NDJSON export and import of site content.
+
+Every line is one row: the table's columns plus ``"_table"``. Rows are read
+column-only, in primary-key order, a batch at a time with keyset pagination
+(``id > last``), so memory stays flat and each read is a short statement
+rather than one transaction held open for the whole export. The last id
+written is the resume point; ``--after``/``?after=`` restarts from it.
+
+Files written by the CLI are made of independent chunks: with ``--gzip``
+each batch is its own gzip member (a concatenation of members is a valid
+gzip file). A ``<file>.offset`` sidecar records the byte length and last id
+after every batch, so ``--resume`` truncates a half-written tail and
+continues without duplicates.
+
+Import upserts by primary key in batches (``INSERT ... ON CONFLICT(id) DO
+UPDATE``), so replaying a file or an overlapping resume is harmless.
+
+    python -m backend.transfer export -o dump/ --gzip
+    python -m backend.transfer export announcements -o dump/ --gzip --resume
+    python -m backend.transfer import dump/*.ndjson.gz
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import zlib
+from datetime import date, datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .extensions import db
+from .models import Announcement, Article, TgPost, User, Review
+
+MODELS = {
+    "announcements": Announcement,
+    "articles": Article,
+    "tg_posts": TgPost,
+    "users": User,
+    "reviews": Review,
+}
+# Never leave the database unless explicitly asked for
+SECRET_COLUMNS = {"users": {"password_hash"}}
+# Derived by background jobs (trending.py, dedupe.py) and recomputed after an
+# import: the signature trigger and dedupe.scan re-sign rows that arrive
+DERIVED_COLUMNS = {
+    "announcements": {"minhash", "duplicate_of", "trending_score"},
+    "tg_posts": {"minhash", "duplicate_of", "trending_score"},
+    "articles": {"trending_score"},
+}
+# Accounts imported without a hash get one no password can match
+UNUSABLE_PASSWORD = "!"
+
+BATCH_SIZE = int(os.environ.get("TRANSFER_BATCH_SIZE", 1000))
+
+
+def _columns(name: str, secrets: bool = False):
+    hidden = set(DERIVED_COLUMNS.get(name, ()))
+    if not secrets:
+        hidden |= SECRET_COLUMNS.get(name, set())
+    return [c for c in MODELS[name].__table__.columns if c.name not in hidden]
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_batches(name: str, after: int = 0, secrets: bool = False,
+                 batch_size: int = BATCH_SIZE) -> Iterator[tuple]:
+    """Yield (last id, NDJSON bytes) per batch of ``name`` rows with id > ``after``."""
+    model = MODELS[name]
+    cols = _columns(name, secrets)
+    keys = [c.name for c in cols]
+    while True:
+        rows = db.session.execute(
+            select(*cols).where(model.id > after).order_by(model.id).limit(batch_size)).all()
+        if not rows:
+            return
+        buf = io.StringIO()
+        for row in rows:
+            record = {"_table": name}
+            record.update((k, _encode(v)) for k, v in zip(keys, row))
+            buf.write(json.dumps(record, ensure_ascii=False))
+            buf.write("\n")
+        after = rows[-1].id
+        # Release the read snapshot between batches
+        db.session.rollback()
+        yield after, buf.getvalue().encode("utf-8")
+
+
+def stream(name: str, after: int = 0, compress: bool = False, secrets: bool = False) -> Iterator[bytes]:
+    """Response body generator; gzip output is flushed after every batch."""
+    z = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    for _last, chunk in iter_batches(name, after, secrets):
+        yield z.compress(chunk) + z.flush(zlib.Z_SYNC_FLUSH) if z else chunk
+    if z:
+        yield z.flush()
+
+
+def export_file(name: str, path: str, compress: bool = False, resume: bool = False,
+                after: int = 0, secrets: bool = False, log=None) -> int:
+    """Export one table to ``path``; returns the number of batches written."""
+    state_path = path + ".offset"
+    mode = "wb"
+    if resume and os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        after = state["after"]
+        with open(path, "r+b") as f:
+            f.truncate(state["bytes"])
+        mode = "ab"
+    batches = 0
+    with open(path, mode) as raw:
+        for last, chunk in iter_batches(name, after, secrets):
+            raw.write(gzip.compress(chunk) if compress else chunk)
+            raw.flush()
+            os.fsync(raw.fileno())
+            tmp = state_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"table": name, "after": last, "bytes": raw.tell()}, f)
+            os.replace(tmp, state_path)
+            batches += 1
+            if log:
+                log(f"{name}: up to id {last}")
+    return batches
+
+
+def _open(path: str):
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def _decode_row(name: str, record: dict) -> dict:
+    row = {}
+    derived = DERIVED_COLUMNS.get(name, ())
+    for col in MODELS[name].__table__.columns:
+        if col.name not in record or col.name in derived:
+            continue
+        value = record[col.name]
+        if value is not None and isinstance(col.type, db.DateTime):
+            value = datetime.fromisoformat(value)
+        row[col.name] = value
+    return row
+
+
+def _upsert(name: str, rows: list) -> None:
+    # Group by column set: executemany needs every row to bind the same columns
+    by_cols = {}
+    for row in rows:
+        by_cols.setdefault(tuple(sorted(row)), []).append(row)
+    table = MODELS[name].__table__
+    for cols, group in by_cols.items():
+        if name == "users" and "password_hash" not in cols:
+            # New accounts need a hash; existing ones keep theirs
+            group = [dict(row, password_hash=UNUSABLE_PASSWORD) for row in group]
+        stmt = sqlite_insert(table)
+        set_ = {c: stmt.excluded[c] for c in cols if c != "id"}
+        if name == "users":
+            # Cached user snapshots revalidate against the version column
+            set_["version"] = table.c.version + 1
+        stmt = stmt.on_conflict_do_update(index_elements=["id"], set_=set_)
+        db.session.execute(stmt, group)
+
+
+def import_lines(lines, batch_size: int = BATCH_SIZE, log=None) -> dict:
+    """Upsert NDJSON rows, committing every ``batch_size`` rows; returns counts per table."""
+    counts = {}
+    pending = {}
+
+    def flush():
+        for name, rows in pending.items():
+            if rows:
+                _upsert(name, rows)
+        db.session.commit()
+        pending.clear()
+
+    n = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        name = record.get("_table")
+        if name not in MODELS:
+            raise ValueError(f"unknown table {name!r}")
+        pending.setdefault(name, []).append(_decode_row(name, record))
+        counts[name] = counts.get(name, 0) + 1
+        n += 1
+        if n % batch_size == 0:
+            flush()
+            if log:
+                log(f"imported {n} rows")
+    flush()
+    return counts
+
+
+def main(argv: Optional[list] = None) -> int:
+    from . import create_app
+    parser = argparse.ArgumentParser(description="Export/import Magic Worlds content as NDJSON")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export", help="write one NDJSON file per table")
+    ex.add_argument("tables", nargs="*", help=f"tables to export (default: all of {', '.join(MODELS)})")
+    ex.add_argument("-o", "--out", default=".", help="output directory")
+    ex.add_argument("--gzip", action="store_true")
+    ex.add_argument("--resume", action="store_true", help="continue from <file>.offset")
+    ex.add_argument("--after", type=int, default=0, help="start after this id")
+    ex.add_argument("--secrets", action="store_true", help="include password hashes")
+    im = sub.add_parser("import", help="upsert rows from NDJSON files")
+    im.add_argument("files", nargs="+")
+    im.add_argument("--batch", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+    if args.cmd == "export":
+        unknown = set(args.tables) - set(MODELS)
+        if unknown:
+            parser.error(f"unknown tables: {', '.join(sorted(unknown))}")
+
+    def log(msg):
+        print(msg, file=sys.stderr)
+
+    app = create_app(os.environ.get("FLASK_ENV", "production"))
+    with app.app_context():
+        if args.cmd == "export":
+            os.makedirs(args.out, exist_ok=True)
+            for name in args.tables or list(MODELS):
+                path = os.path.join(args.out, f"{name}.ndjson" + (".gz" if args.gzip else ""))
+                export_file(name, path, compress=args.gzip, resume=args.resume,
+                            after=args.after, secrets=args.secrets, log=log)
+        else:
+            for path in args.files:
+                with _open(path) as f:
+                    counts = import_lines(f, batch_size=args.batch, log=log)
+                log(f"{path}: {counts}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,189 @@
+"""Time-decayed popularity for listings, articles and Telegram posts.
+
+Every view (weight 1) and comment (weight ``COMMENT_WEIGHT``) adds to a
+score that halves every ``TRENDING_HALF_LIFE_HOURS``. Rather than decaying
+every row as time passes, each event is weighted *up* by how late it
+happened, ``w * 2 ** ((t - EPOCH) / half_life)``, and the score is kept as
+the logarithm of that sum in ``trending_score``:
+
+    trending_score = ln(sum(w_i * 2 ** ((t_i - EPOCH) / half_life)))
+
+Dividing every row by the same ``2 ** ((now - EPOCH) / half_life)`` does
+not change their order, so ranking by the stored column is ranking by the
+current decayed score: ``sort=trending`` is an indexed ``ORDER BY
+trending_score DESC`` and nothing is computed per request. Logarithms keep
+the numbers small however long the site runs. ``sort=popular`` orders by
+the lifetime ``views`` counter, also indexed.
+
+Views are counted in process and written every ``TRENDING_FLUSH_INTERVAL``
+seconds by a background thread, one statement per row touched, instead of
+one write per page view. ``shutdown`` writes what is left when the process
+exits (gunicorn's ``worker_exit``, atexit otherwise), so worker recycling
+and deploys lose nothing; a crash loses at most that many seconds of views.
+The update runs in SQL (``ln``/``exp``, SQLite's math functions), so
+several workers flushing the same row never overwrite each other.
+
+Changing the half-life only affects events recorded afterwards.
+"""
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import text
+
+from .extensions import db
+from .models import Announcement, Article, TgPost
+
+log = logging.getLogger(__name__)
+
+EPOCH = 1_700_000_000
+COMMENT_WEIGHT = 5.0
+MODELS = {"announcement": Announcement, "article": Article, "tg_post": TgPost}
+SORTS = ("recent", "trending", "popular")
+
+_lock = threading.Lock()
+_weights = Counter()  # (table, id) -> summed event weight since the last flush
+_views = Counter()  # (table, id) -> views since the last flush
+_flusher = None
+_flusher_pid = None
+_wake = threading.Event()
+
+
+def _rate(app=None) -> float:
+    """Natural-log growth of an event's weight per second."""
+    hours = (app or current_app).config.get("TRENDING_HALF_LIFE_HOURS", 24)
+    return math.log(2) / (hours * 3600)
+
+
+def log_weight(weight: float, at: float, rate: float) -> float:
+    return math.log(weight) + (at - EPOCH) * rate
+
+
+def record(table: str, row_id: int, kind: str = "view") -> int:
+    """Count a view or comment; returns views of the row not yet written (this process)."""
+    key = (table, row_id)
+    with _lock:
+        _weights[key] += COMMENT_WEIGHT if kind == "comment" else 1.0
+        if kind == "view":
+            _views[key] += 1
+        pending = _views[key]
+        full = len(_weights) >= current_app.config.get("TRENDING_BUFFER_SIZE", 10000)
+    _ensure_flusher()
+    if full:
+        _wake.set()
+    return pending
+
+
+def pending_views(table: str, row_id: int) -> int:
+    with _lock:
+        return _views.get((table, row_id), 0)
+
+
+_UPDATE = """
+    UPDATE {table} SET
+      views = COALESCE(views, 0) + :views,
+      trending_score = CASE WHEN trending_score IS NULL THEN :x
+        ELSE max(trending_score, :x) + ln(1 + exp(-abs(trending_score - :x))) END
+    WHERE id = :id"""
+
+
+def flush(app=None) -> int:
+    """Write buffered events; returns the number of rows updated."""
+    global _weights, _views
+    with _lock:
+        weights, views = _weights, _views
+        _weights, _views = Counter(), Counter()
+    if not weights:
+        return 0
+    x_now = time.time()
+    rate = _rate(app)
+    by_table = {}
+    for (table, row_id), weight in weights.items():
+        by_table.setdefault(table, []).append(
+            {"id": row_id, "views": views.get((table, row_id), 0), "x": log_weight(weight, x_now, rate)})
+    try:
+        for table, params in by_table.items():
+            db.session.execute(text(_UPDATE.format(table=table)), params)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Put them back for the next attempt
+        with _lock:
+            _weights.update(weights)
+            _views.update(views)
+        raise
+    return len(weights)
+
+
+def _run(app) -> None:
+    interval = app.config.get("TRENDING_FLUSH_INTERVAL", 5)
+    while True:
+        _wake.wait(interval)
+        _wake.clear()
+        try:
+            with app.app_context():
+                flush(app)
+        except Exception:
+            log.exception("trending flush failed")
+
+
+def _ensure_flusher() -> None:
+    global _flusher, _flusher_pid
+    if _flusher is not None and _flusher_pid == os.getpid() and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is None or _flusher_pid != os.getpid() or not _flusher.is_alive():
+            app = current_app._get_current_object()
+            if _flusher_pid != os.getpid():
+                atexit.register(shutdown, app)
+            _flusher_pid = os.getpid()
+            _flusher = threading.Thread(target=_run, args=(app,), name="trending-flush", daemon=True)
+            _flusher.start()
+
+
+def shutdown(app) -> None:
+    """Write the events still buffered in this process; call when it exits."""
+    if _flusher_pid != os.getpid():
+        # Nothing was counted here (a buffer inherited over fork is not ours to write)
+        return
+    try:
+        with app.app_context():
+            flush(app)
+    except Exception:
+        log.exception("final trending flush failed")
+
+
+def order_by(model, sort: str):
+    """ORDER BY clauses for ``sort``; raises ValueError for unknown sorts."""
+    if sort == "trending":
+        return (model.trending_score.desc(), model.id.desc())
+    if sort == "popular":
+        return (model.views.desc(), model.id.desc())
+    if sort == "recent":
+        return (model.date.desc(),) if model is TgPost else (model.created_at.desc(),)
+    raise ValueError(sort)
+
+
+def install() -> None:
+    """Indexes for the two rankings (columns come from the bootstrap migrations)."""
+    for table in MODELS:
+        db.session.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_trending ON {table} (trending_score DESC, id DESC)"))
+        db.session.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_popular ON {table} (views DESC, id DESC)"))
+    db.session.commit()
+
+
+def backfill(table: str) -> None:
+    """Seed scores from lifetime views, as if they all happened at creation."""
+    created = "date" if table == "tg_post" else "created_at"
+    rate = _rate()
+    db.session.execute(text(
+        f"UPDATE {table} SET trending_score = ln(views) + (unixepoch({created}) - :epoch) * :rate "
+        f"WHERE views > 0 AND trending_score IS NULL"), {"epoch": EPOCH, "rate": rate})
+    db.session.commit()
@@ -0,0 +1,124 @@
+"""Short-TTL cache of user snapshots for Flask-Login's ``user_loader``.
+
+Authenticated pages poll cheap endpoints (``/api/auth/me`` and friends), and
+without a cache every one of them re-reads the ``user`` row. Entries here are
+immutable snapshots: ``current_user`` is one, so ``is_admin``/``is_banned``
+checks never touch the database. Code that needs to modify a user loads the
+ORM row explicitly.
+
+Invalidation relies on ``User.version``, bumped on every update of the row.
+Within a worker the entry is dropped as soon as the update is flushed; other
+workers keep serving their copy for at most ``USER_CACHE_TTL`` seconds and
+then revalidate with a primary-key lookup of the version column only.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Optional
+
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+
+from .extensions import db
+from .models import User
+
+
+@dataclass(frozen=True)
+class UserSnapshot(UserMixin):
+    id: int
+    username: str
+    is_admin: bool
+    is_banned: bool
+    balance_cents: int
+    avatar_url: Optional[str]
+    bio: Optional[str]
+    username_changed_at: Optional[datetime]
+    version: int
+
+
+_COLUMNS = [getattr(User, f.name) for f in fields(UserSnapshot)]
+
+
+class UserCache:
+    def __init__(self, ttl: float = 5.0, maxsize: int = 2048):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # user id -> (snapshot, validated_at)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+        if entry is not None:
+            snap, validated_at = entry
+            if now - validated_at < self.ttl:
+                return snap
+            version = db.session.execute(select(User.version).where(User.id == user_id)).scalar()
+            if version is not None and version == snap.version:
+                self._store(snap, now)
+                return snap
+        row = db.session.execute(select(*_COLUMNS).where(User.id == user_id)).first()
+        if row is None:
+            self.invalidate(user_id)
+            return None
+        snap = _normalize(UserSnapshot(**row._mapping))
+        self._store(snap, now)
+        return snap
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, snap: UserSnapshot, validated_at: float) -> None:
+        with self._lock:
+            self._entries[snap.id] = (snap, validated_at)
+            self._entries.move_to_end(snap.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def _normalize(snap: UserSnapshot) -> UserSnapshot:
+    # Columns added by ALTER TABLE may hold NULL for old rows
+    return UserSnapshot(
+        id=snap.id,
+        username=snap.username,
+        is_admin=bool(snap.is_admin),
+        is_banned=bool(snap.is_banned),
+        balance_cents=int(snap.balance_cents or 0),
+        avatar_url=snap.avatar_url,
+        bio=snap.bio,
+        username_changed_at=snap.username_changed_at,
+        version=int(snap.version or 0),
+    )
+
+
+cache = UserCache()
+
+
+def init_app(app):
+    cache.ttl = float(app.config.get("USER_CACHE_TTL", cache.ttl))
+    cache.maxsize = int(app.config.get("USER_CACHE_SIZE", cache.maxsize))
+
+
+@event.listens_for(User, "before_update")
+def _bump_version(_mapper, _connection, target):
+    # before_update also fires for rows that were only touched; bump on real changes
+    session = object_session(target)
+    if session is not None and session.is_modified(target, include_collections=False):
+        target.version = (target.version or 0) + 1
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _evict(_mapper, _connection, target):
+    cache.invalidate(target.id)
@@ -0,0 +1,48 @@
+"""Per-table change counters kept by SQLite triggers.
+
+``table_version`` holds one row per tracked table whose ``version`` is bumped
+by every insert, update and delete on it, whatever the write path. In-process
+caches derived from a table compare the counter (a primary-key lookup) to
+decide whether they are still current.
+
+Columns listed in ``IGNORED`` do not count as changes: an update touching
+only those (the per-visit ``views`` counter, ``trending_score``, the
+near-duplicate signature) leaves the version alone, so view traffic and
+background jobs do not invalidate every cache built on the table.
+"""
+from sqlalchemy import text
+
+from .extensions import db
+
+TRACKED = ("announcement", "tg_post", "category")
+_DERIVED = ("views", "trending_score", "minhash")
+IGNORED = {"announcement": _DERIVED, "tg_post": _DERIVED}
+
+
+def install(tables=TRACKED) -> None:
+    db.session.execute(text(
+        "CREATE TABLE IF NOT EXISTS table_version (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID"))
+    for table in tables:
+        db.session.execute(text("INSERT OR IGNORE INTO table_version (name, version) VALUES (:t, 0)"), {"t": table})
+        update = "UPDATE"
+        if table in IGNORED:
+            # Recreated every time so columns added by later migrations are covered
+            columns = [r[1] for r in db.session.execute(text(f"PRAGMA table_info('{table}')"))
+                       if r[1] not in IGNORED[table]]
+            update = f"UPDATE OF {', '.join(columns)}"
+            db.session.execute(text(f"DROP TRIGGER IF EXISTS {table}_version_au"))
+        for suffix, event in (("ai", "INSERT"), ("au", update), ("ad", "DELETE")):
+            db.session.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_version_{suffix} AFTER {event} ON {table} "
+                f"BEGIN UPDATE table_version SET version = version + 1 WHERE name = '{table}'; END"))
+    db.session.commit()
+
+
+def get(table: str) -> int:
+    return db.session.execute(text("SELECT version FROM table_version WHERE name = :t"), {"t": table}).scalar() or 0
+
+
+def get_many(tables) -> dict:
+    rows = db.session.execute(text("SELECT name, version FROM table_version")).all()
+    known = dict(rows)
+    return {t: known.get(t, 0) for t in tables}
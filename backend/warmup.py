@@ -0,0 +1,29 @@
+"""Cache warm-up hooks.
+
+Modules register callables here; serving entry points run them once inside an
+app context (in the gunicorn master when ``preload_app`` is on) so forked
+workers inherit warm caches instead of each rebuilding them on first request.
+"""
+from sqlalchemy.orm import configure_mappers
+
+_hooks = []
+
+
+def register(fn):
+    _hooks.append(fn)
+    return fn
+
+
+def run_all():
+    for fn in _hooks:
+        try:
+            fn()
+        except Exception:
+            # Warm-up is an optimisation; a cold cache is still correct
+            pass
+
+
+@register
+def _mappers():
+    # Resolve relationships/backrefs now rather than on the first query
+    configure_mappers()
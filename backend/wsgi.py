@@ -1 +1,14 @@
-from .app import app as application
+import os
+from . import create_app, warmup
+from .extensions import db
+
+# Production entry point: `gunicorn -c gunicorn.conf.py`. With preload_app the
+# master imports this module once, so bootstrap and warm-up run a single time.
+application = create_app(os.environ.get("FLASK_ENV", "production"))
+
+with application.app_context():
+    warmup.run_all()
+    # No pooled connection may survive into forked workers
+    db.engine.dispose()
+
+app = application
@@ -0,0 +1,40 @@
+import multiprocessing
+import os
+
+# Serving profile: `gunicorn -c gunicorn.conf.py`
+wsgi_app = "backend.wsgi:application"
+bind = os.environ.get("BIND", f"0.0.0.0:{os.environ.get('PORT', '5001')}")
+
+# Threaded workers: most requests wait on SQLite or the network, not the CPU
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 9)))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Import the app (bootstrap + warm-up) once in the master, then fork
+preload_app = True
+
+# Recycle workers periodically to bound slow leaks; jitter avoids restarting all at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.environ.get("GUNICORN_ACCESSLOG", "-")
+
+
+def post_fork(server, worker):
+    # The master disposed its pool before forking; dispose again in the child
+    # (without closing the parent's sockets) in case anything reconnected since.
+    from backend.wsgi import application
+    from backend.extensions import db
+    with application.app_context():
+        db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # Recycled (max_requests) or stopped workers write their buffered view counts
+    from backend.wsgi import application
+    from backend import trending
+    trending.shutdown(application)
@@ -0,0 +1,58 @@
+"""Measure cold start: time from spawning the server to its first HTTP 200.
+
+Usage:
+    python tools/coldstart.py                      # gunicorn serving profile
+    python tools/coldstart.py -- python -m backend.app
+"""
+import argparse
+import os
+import pathlib
+import subprocess
+import sys
+import time
+import urllib.request
+import urllib.error
+
+PROJECT_ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+
+def wait_for_200(url: str, timeout: float) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return time.perf_counter() - start
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"no 200 from {url} within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5001/api/config")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("cmd", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    cmd = [c for c in args.cmd if c != "--"] or [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"]
+
+    results = []
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_200(args.url, args.timeout)
+            results.append(time.perf_counter() - t0)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    print(f"cmd: {' '.join(cmd)}")
+    print("cold start to first 200: " + ", ".join(f"{r * 1000:.0f} ms" for r in results))
+    print(f"best {min(results) * 1000:.0f} ms, mean {sum(results) / len(results) * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -13,6 +13,7 @@ import sys
 sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))  # add project root
 from backend import create_app  # noqa
 from backend.extensions import db  # noqa
+from backend import dedupe  # noqa
 from backend.models import TgPost  # noqa
 
 SUPPORTED_COUNTRIES = [
@@ -88,7 +89,8 @@ def main():
         entity = await client.get_entity(channel)
 
         count = 0
-        async for msg in client.iter_messages(entity, limit=None):
+        # Oldest first, so the first of a series of cross-posts is the one kept
+        async for msg in client.iter_messages(entity, limit=None, reverse=True):
             if not (msg and (msg.message or msg.text)):
                 continue
             text = msg.message or msg.text or ''
@@ -123,6 +125,10 @@ def main():
                 existing.image_urls_json = json.dumps(image_urls, ensure_ascii=False)
                 existing.source_link = f"https://t.me/{channel}/{msg.id}"
                 try:
+                    db.session.flush()
+                    # Cross-posts of an earlier message are collapsed, close ones flagged
+                    if dedupe.check(existing):
+                        print('near-duplicate:', msg.id)
                     db.session.commit()
                     count += 1
                 except Exception as e: